@@ -18,11 +18,24 @@ from urllib.parse import urlparse, unquote, urlunparse
 
 from core.db import get_db, SessionLocal
 from core import db_async
+from core import cancel_signal
+from core import live_progress
+from core import progress_writer
 from core.models import DownloadRequest, StatusEnum
-from core.download_core import download_core, ROUTE_MANUAL, _read_download_route
+from core.download_core import download_core, ROUTE_MANUAL, _format_bytes, _read_download_route
+from core import http_sessions
+from core.mega_hoster import (
+    MegaApiError,
+    is_mega_folder_url,
+    list_mega_folder,
+    mega_error_message,
+    mega_folder_file_url,
+    parse_mega_folder_url,
+)
 from core.parser import fichier_parser
 from core.simple_parser import parse_1fichier_simple_sync, clean_1fichier_url, derive_display_name
 from core.hoster_parsers import should_preserve_original_url
+from core.url_key import normalize_url, url_hash
 from core.config import get_config
 from core.i18n import get_translations
 from core.error_messages import (
@@ -37,6 +50,7 @@ from core.error_messages import (
 from core.executors import parse_executor_for
 from services.sse_manager import sse_manager
 from services.ouo_unwrap_service import is_ouo_url, unwrap_if_ouo
+from utils.file_helpers import generate_file_path
 
 
 def _has_fichier_credentials() -> bool:
@@ -71,12 +85,20 @@ def _find_completed_duplicate(db: Session, url: str) -> Optional[DownloadRequest
     cleaned ``url`` is the canonical key, so a re-add of the same link matches.
     The newest match wins, and the on-disk check guards against a row that says
     ``done`` while the file was deleted/moved (then a real re-download is wanted).
+
+    ``url`` is matched through the indexed ``url_hash`` (core/url_key.py) and
+    ``original_url`` through its own index, so an add costs two index probes
+    instead of a scan of the whole history. The hash can collide, so a hash
+    hit is only taken once the normalised URLs agree.
     """
+    key = normalize_url(url)
     candidates = db.query(DownloadRequest).filter(
-        or_(DownloadRequest.url == url, DownloadRequest.original_url == url),
+        or_(DownloadRequest.url_hash == url_hash(url), DownloadRequest.original_url == url),
         DownloadRequest.status == StatusEnum.done,
     ).order_by(DownloadRequest.id.desc()).all()
     for req in candidates:
+        if req.original_url != url and normalize_url(req.url) != key:
+            continue
         if req.save_path and os.path.exists(req.save_path):
             return req
     return None
@@ -217,6 +239,86 @@ async def _start_download_in_background(download_id: int, url: str) -> None:
 
 
 
+def _persist_folder_children(db: Session, folder_url: str, folder_id: str, folder_key: str,
+                             files, password: Optional[str], use_proxy: bool) -> tuple:
+    """Insert one pending row per folder file, in one transaction.
+
+    Runs in a worker thread: it takes the write lock once for the whole
+    folder, and checks the disk for name clashes. A file already downloaded
+    from this folder is skipped, the same way a re-added link is. Returns
+    ``(new ids, skipped count)``.
+    """
+    rows, taken, skipped = [], set(), 0
+    for entry in sorted(files, key=lambda f: (f.path, f.name)):
+        child_url = mega_folder_file_url(folder_id, folder_key, entry.handle)
+        if _find_completed_duplicate(db, child_url) is not None:
+            skipped += 1
+            continue
+        save_path = generate_file_path(entry.name, subdirs=entry.path)
+        stem, dot, ext = entry.name.rpartition(".")
+        counter = 1
+        while save_path in taken:
+            # Two files with one name in one folder: MEGA allows it, disks don't.
+            name = f"{stem}({counter}).{ext}" if dot else f"{entry.name}({counter})"
+            save_path = generate_file_path(name, subdirs=entry.path)
+            counter += 1
+        taken.add(save_path)
+        rows.append(DownloadRequest(
+            url=child_url,
+            password=password or None,
+            use_proxy=use_proxy,
+            status=StatusEnum.pending,
+            file_name=entry.name,
+            total_size=entry.size,
+            file_size=_format_bytes(entry.size),
+            save_path=save_path,
+        ))
+    db.add_all(rows)
+    db.commit()
+    print(f"[LOG] MEGA 폴더 등록: {len(rows)}개 파일 ({skipped}개는 이미 완료) - {folder_url}")
+    return [row.id for row in rows], skipped
+
+
+async def _add_mega_folder(url: str, password: str, use_proxy: bool, db: Session) -> dict:
+    """Queue every file of a MEGA folder link as its own download.
+
+    The whole tree comes from one listing call, and every file becomes a
+    pending row whose link is MEGA's own per-file folder link, saved under
+    the folder's structure. One sweep then hands them to the scheduler,
+    which starts them as the mega.nz slots allow — like any other pending
+    download, each with its own progress, retries and resume.
+    """
+    folder_id, folder_key, _, subfolder = parse_mega_folder_url(url)
+    try:
+        async with http_sessions.session() as session:
+            files = await list_mega_folder(session, folder_id, folder_key, subfolder)
+    except MegaApiError as e:
+        raise HTTPException(status_code=400, detail=mega_error_message(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not files:
+        raise HTTPException(status_code=400, detail="MEGA 폴더에 파일이 없습니다")
+
+    ids, skipped = await asyncio.to_thread(
+        _persist_folder_children, db, url, folder_id, folder_key, files, password, use_proxy
+    )
+    if ids:
+        task = asyncio.create_task(download_core.auto_start_pending_downloads())
+        _start_tasks.add(task)
+        task.add_done_callback(_start_tasks.discard)
+
+    root = files[0].path[0] if files[0].path else url
+    return {
+        "success": True,
+        "folder": True,
+        "message_key": "mega_folder_queued",
+        "message_args": {"name": root, "count": len(ids), "skipped": skipped},
+        "ids": ids,
+        "url": url,
+        "status": "pending",
+    }
+
+
 @router.post("/download/")
 async def add_download(
     request: dict,
@@ -242,6 +344,10 @@ async def add_download(
         if not is_ouo:
             url = clean_1fichier_url(url)
 
+        # A MEGA folder is not one download but one per file in it.
+        if is_mega_folder_url(url):
+            return await _add_mega_folder(url, password, use_proxy, db)
+
         # If this exact URL was already downloaded and the file is still on disk,
         # don't re-download — quietly tell the client it's already complete.
         # Off the loop: the query contends with the same write lock, and the
@@ -448,6 +554,7 @@ async def retry_download(
         req.attempt_count = 0
         req.attempts_json = None
         req.downloaded_size = 0  # start over from the beginning
+        progress_writer.discard(req.id)
         req.finished_at = None
         await db_async.commit(db)
 
@@ -494,6 +601,7 @@ async def stop_download(download_id: int, db: Session = Depends(get_db)):
             updated_req = await db_async.first(db.query(DownloadRequest).filter(DownloadRequest.id == download_id))
 
             # Immediately notify status via SSE
+            live_progress.note_status(download_id, "stopped")
             await sse_manager.broadcast_message("download_stopped", {
                 "id": download_id,
                 "status": "stopped",
@@ -602,6 +710,7 @@ async def stop_batch_downloads(download_ids: List[int], db: Session = Depends(ge
 
             if success:
                 # SSE notification
+                live_progress.note_status(download_id, "stopped")
                 await sse_manager.broadcast_message("download_stopped", {
                     "id": download_id,
                     "status": "stopped",
@@ -639,6 +748,7 @@ async def delete_download(download_id: int, db: Session = Depends(get_db)):
             await download_core.stop_download_async(download_id, db)
 
         # Delete from the database
+        download_core.scheduler.discard(download_id)
         db.delete(req)
         await db_async.commit(db)
 
@@ -695,6 +805,7 @@ async def bulk_delete_downloads(
                 await download_core.stop_download_async(r.id, db)
             except Exception as e:
                 print(f"[WARNING] bulk-delete: 중지 중 오류 (id={r.id}): {e}")
+        download_core.scheduler.discard(r.id)
         db.delete(r)
         deleted_ids.append(r.id)
     await db_async.commit(db)
@@ -797,6 +908,85 @@ async def toggle_proxy_mode(download_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"서버 오류: {str(e)}")
 
 
+@router.get("/downloads/queue")
+def get_download_queue():
+    """The start order of waiting downloads, per (host, egress) slot.
+
+    ``slots[].queued`` lists ids in the order they will start; ``running`` is
+    how many of that slot's downloads hold a place right now. ``host_limits``
+    is what the adaptive per-host limits have learned so far.
+    """
+    snapshot = download_core.scheduler.snapshot()
+    snapshot["host_limits"] = download_core.adaptive.snapshot()
+    return snapshot
+
+
+async def _queued_row(download_id: int, db: Session) -> DownloadRequest:
+    req = await db_async.first(db.query(DownloadRequest).filter(DownloadRequest.id == download_id))
+    if not req:
+        raise HTTPException(status_code=404, detail="다운로드 요청을 찾을 수 없습니다")
+    return req
+
+
+@router.put("/downloads/{download_id}/priority")
+async def set_download_priority(download_id: int, request: dict, db: Session = Depends(get_db)):
+    """Set a download's queue priority. body: ``{"priority": int}`` — higher starts first."""
+    try:
+        priority = int(request.get("priority"))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="priority 는 정수여야 합니다")
+
+    req = await _queued_row(download_id, db)
+    req.priority = priority
+    await db_async.commit(db)
+    queued = download_core.scheduler.update(download_id, priority=priority)
+
+    await sse_manager.broadcast_message("status_update", {"id": download_id, "priority": priority})
+    return {"success": True, "id": download_id, "priority": priority, "queued": queued}
+
+
+@router.put("/downloads/{download_id}/pin")
+async def pin_download(download_id: int, request: dict, db: Session = Depends(get_db)):
+    """Pin a download to the front of its queue. body: ``{"pinned": bool}``."""
+    pinned = bool(request.get("pinned", True))
+
+    req = await _queued_row(download_id, db)
+    req.queue_pinned = pinned
+    await db_async.commit(db)
+    queued = download_core.scheduler.update(download_id, pinned=pinned)
+
+    await sse_manager.broadcast_message("status_update", {"id": download_id, "queue_pinned": pinned})
+    return {"success": True, "id": download_id, "queue_pinned": pinned, "queued": queued}
+
+
+@router.post("/downloads/queue/reorder")
+async def reorder_download_queue(request: dict, db: Session = Depends(get_db)):
+    """Put queued downloads in the given order. body: ``{"ids": [int, ...]}``.
+
+    Only the listed ids move, and only among the places they already held, so
+    the rest of the queue keeps its order. Pins and priority still come first.
+    """
+    ids = request.get("ids") or []
+    if not isinstance(ids, list) or not ids:
+        raise HTTPException(status_code=400, detail="ids 가 비어있습니다")
+    try:
+        ids = [int(i) for i in ids]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="ids 는 정수 리스트여야 합니다")
+
+    moved = download_core.scheduler.reorder(ids)
+    if moved:
+        rows = await db_async.all_rows(
+            db.query(DownloadRequest).filter(DownloadRequest.id.in_(list(moved)))
+        )
+        for r in rows:
+            r.queue_position = moved[r.id]
+        await db_async.commit(db)
+
+    await sse_manager.broadcast_message("queue_updated", download_core.scheduler.snapshot())
+    return {"success": True, "moved": sorted(moved)}
+
+
 @router.get("/downloads/health-check")
 def download_health_check():
     """Download system health check"""
@@ -810,6 +1000,7 @@ def download_health_check():
             "stats": {
                 "active_downloads": active_tasks,
                 "sse_connections": sse_connections,
+                "sse": sse_manager.stats(),
                 "system_status": "healthy"
             }
         }
@@ -938,6 +1129,7 @@ async def stop_all_downloads(db: Session = Depends(get_db)):
             stopped_count += 1
 
             # Send stopped status via SSE
+            live_progress.note_status(download.id, "stopped")
             await sse_manager.broadcast_message("status_update", {
                 "id": download.id,
                 "status": "stopped",
@@ -947,6 +1139,10 @@ async def stop_all_downloads(db: Session = Depends(get_db)):
         if stopped_count > 0:
             await db_async.commit(db)
             print(f"[LOG] {stopped_count}개 다운로드 일괄 정지 완료")
+            # Running transfers notice on the in-memory signal, not the row.
+            for download in active_downloads:
+                cancel_signal.signal_cancel(download.id)
+                download_core.scheduler.discard(download.id)
 
         # Notify that the bulk status update is complete (triggers a frontend refresh)
         # i18n support
@@ -1019,6 +1215,7 @@ async def restart_failed_downloads(db: Session = Depends(get_db)):
                 download.attempt_count = 0
                 download.attempts_json = None
                 download.downloaded_size = 0  # reset downloaded size
+                progress_writer.discard(download.id)
 
             # Ids while the instances are still loaded — after the commit,
             # reading any attribute costs a SELECT.
@@ -1090,6 +1287,7 @@ async def stop_all_local_downloads(db: Session = Depends(get_db)):
                 print(f"[DEBUG] 태스크 강제 취소: {download.id}")
 
             # Send stopped status via SSE
+            live_progress.note_status(download.id, "stopped")
             await sse_manager.broadcast_message("status_update", {
                 "id": download.id,
                 "status": "stopped",
@@ -1099,6 +1297,10 @@ async def stop_all_local_downloads(db: Session = Depends(get_db)):
         if stopped_count > 0:
             await db_async.commit(db)
             print(f"[LOG] {stopped_count}개 로컬 다운로드 일괄 정지 완료")
+            # Running transfers notice on the in-memory signal, not the row.
+            for download in active_local_downloads:
+                cancel_signal.signal_cancel(download.id)
+                download_core.scheduler.discard(download.id)
 
         # Notify that the bulk status update is complete (triggers a frontend refresh)
         # i18n support
@@ -1169,6 +1371,7 @@ async def restart_failed_local_downloads(db: Session = Depends(get_db)):
             download.attempt_count = 0
             download.attempts_json = None
             download.downloaded_size = 0  # reset downloaded size
+            progress_writer.discard(download.id)
 
         # Pick the oldest while the instances are still loaded — after the
         # commit every requested_at read is a fresh SELECT on the event loop.
@@ -1194,7 +1397,7 @@ async def restart_failed_local_downloads(db: Session = Depends(get_db)):
             else:
                 print(f"[WARNING] 가장 오래된 로컬 다운로드 시작 실패: {oldest_download.id}")
 
-            # Keep the rest in pending status (managed automatically by the semaphore)
+            # Keep the rest in pending status (the pending sweep queues them)
             pending_count = len(failed_local_downloads) - 1
             if pending_count > 0:
                 print(f"[LOG] {pending_count}개 로컬 다운로드가 대기 상태로 설정됨")
@@ -1251,6 +1454,7 @@ async def stop_all_proxy_downloads(db: Session = Depends(get_db)):
             stopped_count += 1
 
             # Send stopped status via SSE
+            live_progress.note_status(download.id, "stopped")
             await sse_manager.broadcast_message("status_update", {
                 "id": download.id,
                 "status": "stopped",
@@ -1260,6 +1464,10 @@ async def stop_all_proxy_downloads(db: Session = Depends(get_db)):
         if stopped_count > 0:
             await db_async.commit(db)
             print(f"[LOG] {stopped_count}개 프록시 다운로드 일괄 정지 완료")
+            # Running transfers notice on the in-memory signal, not the row.
+            for download in active_proxy_downloads:
+                cancel_signal.signal_cancel(download.id)
+                download_core.scheduler.discard(download.id)
 
         # Notify that the bulk status update is complete (triggers a frontend refresh)
         # i18n support
@@ -1331,6 +1539,7 @@ async def restart_failed_proxy_downloads(db: Session = Depends(get_db)):
                 download.attempt_count = 0
                 download.attempts_json = None
                 download.downloaded_size = 0  # reset downloaded size
+                progress_writer.discard(download.id)
 
             # Ids while the instances are still loaded — after the commit,
             # reading any attribute costs a SELECT.
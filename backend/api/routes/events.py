@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+from typing import Optional
+
 from fastapi import APIRouter, Request
 from fastapi.responses import StreamingResponse
 import json
@@ -8,12 +10,22 @@ from services.sse_manager import sse_manager
 router = APIRouter(prefix="/api", tags=["events"])
 
 
+def _last_event_id(request: Request) -> Optional[int]:
+    """The id the client saw last: the browser's own header, or the query
+    parameter the frontend adds when it reconnects by itself."""
+    raw = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    try:
+        return int(raw) if raw else None
+    except ValueError:
+        return None
+
+
 @router.get("/events")
 async def stream_events(request: Request):
     """SSE event stream"""
     try:
-        # Create a new SSE connection
-        connection = await sse_manager.add_connection(request)
+        # Create a new SSE connection, replaying what it missed
+        connection = await sse_manager.add_connection(request, _last_event_id(request))
 
         # Return the stream response
         return StreamingResponse(
@@ -5,15 +5,19 @@ Download history API router
 
 from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import case, desc, func
+from sqlalchemy import desc, func
 from typing import List, Optional
 
 from core.db import get_db
-from core.models import DownloadRequest, StatusEnum
+from core.models import DownloadRequest, DownloadTombstone, StatusEnum
 from core.error_messages import classify_failure_text
 from core.hoster_labels import hoster_label, hoster_slug
+from core import change_feed
+from core import download_stats
 from core import live_progress
+from core import search_index
 from core.simple_parser import derive_display_name
 
 
@@ -38,6 +42,106 @@ def _display_filename(download: DownloadRequest) -> str:
         return name
     return derive_display_name(download.url or "")
 
+
+# Every status the working tab shows.
+_WORKING_STATUSES = tuple(s for s in StatusEnum if s != StatusEnum.done)
+
+
+# What a grid row is built from. The list endpoints select these columns only:
+# attempts_json, save_path and the other wide or internal columns stay on disk.
+_GRID_COLUMNS = (
+    DownloadRequest.id,
+    DownloadRequest.url,
+    DownloadRequest.original_url,
+    DownloadRequest.file_name,
+    DownloadRequest.file_size,
+    DownloadRequest.status,
+    DownloadRequest.requested_at,
+    DownloadRequest.finished_at,
+    DownloadRequest.error,
+    DownloadRequest.downloaded_size,
+    DownloadRequest.total_size,
+    DownloadRequest.use_proxy,
+    DownloadRequest.failure_kind,
+    DownloadRequest.attempt_count,
+    DownloadRequest.next_retry_at,
+    DownloadRequest.updated_seq,
+)
+
+
+def _grid_row(download, live_speeds: dict) -> dict:
+    """One row as the working/completed grid and the change feed send it.
+
+    ``download`` is a ``DownloadRequest`` or a row of ``_GRID_COLUMNS``.
+    """
+    done = download.status == StatusEnum.done
+    return {
+        "id": download.id,
+        "url": download.url,
+        "filename": _display_filename(download),
+        "status": download.status.value if download.status else "unknown",
+        # completed items are always 100%
+        "progress": 100 if done else (
+            round((download.downloaded_size / download.total_size * 100), 1)
+            if download.total_size and download.total_size > 0 else 0),
+        "use_proxy": download.use_proxy or False,
+        "error_message": download.error,
+        "failure_kind": _failure_kind_of(download),
+        # The URL actually being fetched — after an ouo unwrap the
+        # original is a shortlink, which says nothing about where
+        # the bytes come from.
+        "hoster": hoster_label(download.url or download.original_url),
+        "hoster_key": hoster_slug(download.url or download.original_url),
+        "total_size": download.total_size,
+        "downloaded_size": download.downloaded_size,
+        "file_size": download.file_size,
+        "requested_at": download.requested_at.isoformat() if download.requested_at else None,
+        # Alias for the frontend grid — kept alongside requested_at for legacy callers
+        "created_at": download.requested_at.isoformat() if download.requested_at else None,
+        # Retry state so the grid can show "재시도 대기 (N회, 다음 HH:MM)" on load,
+        # not only when an SSE event happens to arrive.
+        "next_retry_at": download.next_retry_at.isoformat() if getattr(download, "next_retry_at", None) else None,
+        "attempt_count": getattr(download, "attempt_count", 0) or 0,
+        # Live reading, so a refetch does not blank the column mid-transfer.
+        "download_speed": live_speeds.get(download.id, 0),
+        "finished_at": download.finished_at.isoformat() if download.finished_at else None,
+        "updated_seq": download.updated_seq,
+    }
+
+
+def _grid_page(query, page: int, page_size: int, after_id: Optional[int]) -> dict:
+    """One grid page, newest first.
+
+    With ``after_id`` (the last id of the previous page) the page is a keyset
+    range — ``id < after_id`` on the primary key — so page 400 costs what page 1
+    does; an OFFSET has to walk past every row before it. ``page`` alone still
+    works for a jump to an arbitrary page. ``next_after_id`` is the key for the
+    page after this one. ``cursor`` is the change-feed version the page is at
+    least as new as: the grid follows it with ``/downloads/changes``.
+    """
+    # Read before the rows, as the feed does: later writes come back from it.
+    cursor = change_feed.cursor(query.session.connection())
+    total_count = query.count()
+
+    rows_query = query.with_entities(*_GRID_COLUMNS).order_by(desc(DownloadRequest.id))
+    if after_id is not None:
+        rows_query = rows_query.filter(DownloadRequest.id < after_id)
+    else:
+        rows_query = rows_query.offset((page - 1) * page_size)
+    rows = rows_query.limit(page_size).all()
+
+    live_speeds = live_progress.snapshot()
+    return {
+        "downloads": [_grid_row(row, live_speeds) for row in rows],
+        "total_count": total_count,
+        "current_page": page,
+        "page_size": page_size,
+        "total_pages": (total_count + page_size - 1) // page_size,
+        "next_after_id": rows[-1].id if len(rows) == page_size else None,
+        "cursor": cursor,
+    }
+
+
 router = APIRouter(prefix="/api", tags=["history"])
 
 
@@ -103,20 +207,25 @@ def get_download_history(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/downloads/working")
+@router.get("/downloads/working", response_class=ORJSONResponse)
 def get_working_downloads(
     db: Session = Depends(get_db),
     page: int = 1,
     page_size: int = 50,
     search: Optional[str] = None,
     start_date: Optional[str] = None,
-    end_date: Optional[str] = None
+    end_date: Optional[str] = None,
+    after_id: Optional[int] = None,
 ):
     """Get in-progress downloads (all statuses except done)"""
     try:
-        # Base query (excludes done)
+        # Base query (excludes done). Spelled as an IN list, since SQLite
+        # cannot use the status index for "!=". ANALYZE only records the
+        # average rows per status, which makes the IN look like most of the
+        # table; unlikely() tells the planner what is true in practice — the
+        # done rows are nearly all of it.
         query = db.query(DownloadRequest).filter(
-            DownloadRequest.status != StatusEnum.done
+            func.unlikely(DownloadRequest.status.in_(_WORKING_STATUSES))
         )
 
         # Apply optional period filter (mirrors /history/period parsing)
@@ -136,59 +245,9 @@ def get_working_downloads(
 
         # Add search condition
         if search and search.strip():
-            search_term = f"%{search.strip()}%"
-            query = query.filter(
-                (DownloadRequest.file_name.ilike(search_term)) |
-                (DownloadRequest.url.ilike(search_term))
-            )
+            query = query.filter(search_index.search_filter(db, search))
 
-        # Get total count
-        total_count = query.count()
-
-        # Apply paging and query
-        offset = (page - 1) * page_size
-        downloads = query.order_by(desc(DownloadRequest.id)).offset(offset).limit(page_size).all()
-
-        live_speeds = live_progress.snapshot()
-        download_list = []
-        for download in downloads:
-            download_list.append({
-                "id": download.id,
-                "url": download.url,
-                "filename": _display_filename(download),
-                "status": download.status.value if download.status else "unknown",
-                "progress": round((download.downloaded_size / download.total_size * 100), 1) if download.total_size and download.total_size > 0 else 0,
-                "use_proxy": download.use_proxy or False,
-                "error_message": download.error,
-                "failure_kind": _failure_kind_of(download),
-                # The URL actually being fetched — after an ouo unwrap the
-                # original is a shortlink, which says nothing about where
-                # the bytes come from.
-                "hoster": hoster_label(download.url or download.original_url),
-                "hoster_key": hoster_slug(download.url or download.original_url),
-                "total_size": download.total_size,
-                "downloaded_size": download.downloaded_size,
-                "file_size": download.file_size,
-                "requested_at": download.requested_at.isoformat() if download.requested_at else None,
-                # Alias for the frontend grid — kept alongside requested_at for legacy callers
-                "created_at": download.requested_at.isoformat() if download.requested_at else None,
-                # Retry state so the grid can show "재시도 대기 (N회, 다음 HH:MM)" on load,
-                # not only when an SSE event happens to arrive.
-                "next_retry_at": download.next_retry_at.isoformat() if getattr(download, "next_retry_at", None) else None,
-                "attempt_count": getattr(download, "attempt_count", 0) or 0,
-                # Live reading, so a refetch does not blank the column mid-transfer.
-                "download_speed": live_speeds.get(download.id, 0),
-            })
-
-        total_pages = (total_count + page_size - 1) // page_size
-
-        return {
-            "downloads": download_list,
-            "total_count": total_count,
-            "current_page": page,
-            "page_size": page_size,
-            "total_pages": total_pages
-        }
+        return _grid_page(query, page, page_size, after_id)
 
     except HTTPException:
         raise
@@ -197,14 +256,15 @@ def get_working_downloads(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/downloads/completed")
+@router.get("/downloads/completed", response_class=ORJSONResponse)
 def get_completed_downloads(
     db: Session = Depends(get_db),
     page: int = 1,
     page_size: int = 50,
     search: Optional[str] = None,
     start_date: Optional[str] = None,
-    end_date: Optional[str] = None
+    end_date: Optional[str] = None,
+    after_id: Optional[int] = None,
 ):
     """Get completed downloads (done status only)"""
     try:
@@ -230,63 +290,79 @@ def get_completed_downloads(
 
         # Add search condition
         if search and search.strip():
-            search_term = f"%{search.strip()}%"
-            query = query.filter(
-                (DownloadRequest.file_name.ilike(search_term)) |
-                (DownloadRequest.url.ilike(search_term))
-            )
+            query = query.filter(search_index.search_filter(db, search))
 
-        # Get total count
-        total_count = query.count()
+        return _grid_page(query, page, page_size, after_id)
 
-        # Apply paging and query
-        offset = (page - 1) * page_size
-        downloads = query.order_by(desc(DownloadRequest.id)).offset(offset).limit(page_size).all()
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Get completed downloads failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        live_speeds = live_progress.snapshot()
-        download_list = []
-        for download in downloads:
-            download_list.append({
-                "id": download.id,
-                "url": download.url,
-                "filename": _display_filename(download),
-                "status": download.status.value if download.status else "unknown",
-                "progress": 100,  # completed items are always 100%
-                "use_proxy": download.use_proxy or False,
-                "error_message": download.error,
-                "failure_kind": _failure_kind_of(download),
-                # The URL actually being fetched — after an ouo unwrap the
-                # original is a shortlink, which says nothing about where
-                # the bytes come from.
-                "hoster": hoster_label(download.url or download.original_url),
-                "hoster_key": hoster_slug(download.url or download.original_url),
-                "total_size": download.total_size,
-                "downloaded_size": download.downloaded_size,
-                "file_size": download.file_size,
-                "requested_at": download.requested_at.isoformat() if download.requested_at else None,
-                # Alias for the frontend grid — kept alongside requested_at for legacy callers
-                "created_at": download.requested_at.isoformat() if download.requested_at else None,
-                "next_retry_at": download.next_retry_at.isoformat() if getattr(download, "next_retry_at", None) else None,
-                "attempt_count": getattr(download, "attempt_count", 0) or 0,
-                # Live reading, so a refetch does not blank the column mid-transfer.
-                "download_speed": live_speeds.get(download.id, 0),
-                "finished_at": download.finished_at.isoformat() if download.finished_at else None
-            })
 
-        total_pages = (total_count + page_size - 1) // page_size
+# Rows per change-feed response; a client with more to catch up on pages
+# through with the returned cursor.
+CHANGES_PAGE_LIMIT = 500
+
+
+@router.get("/downloads/changes", response_class=ORJSONResponse)
+def get_download_changes(
+    db: Session = Depends(get_db),
+    since: int = 0,
+    limit: int = CHANGES_PAGE_LIMIT,
+):
+    """Rows written and ids deleted after version ``since``.
+
+    The grid used to refetch its whole page after an SSE event to find the
+    one row that changed. This is an index range scan on ``updated_seq``
+    instead (see core/change_feed.py). Pass the returned ``cursor`` as the
+    next ``since``; ``has_more`` means another page is waiting right now.
+    Rows may repeat across calls — apply them by id.
+
+    A ``since`` older than the tombstone horizon gets ``resync`` and nothing
+    else: deletions before it have been pruned, so refetch the page.
+    """
+    try:
+        limit = max(1, min(int(limit), CHANGES_PAGE_LIMIT))
+        # Read before the rows: anything committed after this is at or above
+        # it and comes back on the next call.
+        cursor = change_feed.cursor(db.connection())
+        if since < change_feed.horizon(db.connection()):
+            return {"changes": [], "deleted": [], "cursor": cursor,
+                    "has_more": False, "resync": True}
+        rows = (
+            db.query(DownloadRequest)
+            .with_entities(*_GRID_COLUMNS)
+            .filter(DownloadRequest.updated_seq > since)
+            .order_by(DownloadRequest.updated_seq.asc())
+            .limit(limit + 1)
+            .all()
+        )
+        has_more = len(rows) > limit
+        if has_more:
+            rows = rows[:limit]
+            cursor = min(cursor, rows[-1].updated_seq)
+        deleted = [
+            download_id for (download_id,) in
+            db.query(DownloadTombstone.download_id)
+            .filter(DownloadTombstone.deleted_seq > since,
+                    DownloadTombstone.deleted_seq <= max(cursor, since))
+            .order_by(DownloadTombstone.deleted_seq.asc())
+            .all()
+        ]
 
+        live_speeds = live_progress.snapshot()
         return {
-            "downloads": download_list,
-            "total_count": total_count,
-            "current_page": page,
-            "page_size": page_size,
-            "total_pages": total_pages
+            "changes": [_grid_row(download, live_speeds) for download in rows],
+            "deleted": deleted,
+            "cursor": max(cursor, since),
+            "has_more": has_more,
+            "resync": False,
         }
 
-    except HTTPException:
-        raise
     except Exception as e:
-        print(f"[ERROR] Get completed downloads failed: {e}")
+        print(f"[ERROR] Get download changes failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -398,78 +474,58 @@ def get_history_stats(
     db: Session = Depends(get_db)
 ):
     try:
-        query = db.query(DownloadRequest)
-        start_dt = None
-        end_dt = None
+        start_day = None
+        end_day = None
 
         if start_date:
             try:
-                start_dt = datetime.strptime(start_date, "%Y-%m-%d")
+                start_day = datetime.strptime(start_date, "%Y-%m-%d").date().isoformat()
             except ValueError:
                 raise HTTPException(status_code=400, detail="Invalid start_date format. Use YYYY-MM-DD")
-            query = query.filter(DownloadRequest.requested_at >= start_dt)
 
         if end_date:
             try:
-                end_dt = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+                end_day = datetime.strptime(end_date, "%Y-%m-%d").date().isoformat()
             except ValueError:
                 raise HTTPException(status_code=400, detail="Invalid end_date format. Use YYYY-MM-DD")
-            query = query.filter(DownloadRequest.requested_at < end_dt)
 
-        # One grouped pass instead of a COUNT per status plus two more for the
-        # proxy split. The tab badges refresh off every SSE status update, so
-        # this endpoint runs while downloads are writing — each extra full scan
-        # here is time the writer spends waiting.
-        status_rows = query.with_entities(
-            DownloadRequest.status,
-            func.count(DownloadRequest.id),
-            func.coalesce(func.sum(DownloadRequest.total_size), 0),
-            func.sum(case((DownloadRequest.use_proxy == True, 1), else_=0)),
-        ).group_by(DownloadRequest.status).all()
+        # The tab badges refresh off every SSE status update, so this runs
+        # while downloads are writing. It reads the trigger-kept totals
+        # (core/download_stats.py) — a few small rows per day in the period —
+        # instead of grouping the whole history twice.
+        totals = download_stats.summary(db.connection(), start_day, end_day)
 
         status_counts = {status_enum.value: 0 for status_enum in StatusEnum}
         total = 0
         total_bytes = 0
         proxy_count = 0
-        for status, count, size_sum, proxy_sum in status_rows:
-            # A pre-migration row can carry a NULL status. It belongs in the
-            # totals but must not invent a status key the UI would then render
-            # as a badge.
-            if status is not None:
-                status_counts[status.value if hasattr(status, "value") else str(status)] = count
+        for status, use_proxy, count, size_sum in totals["by_status"]:
+            count = int(count or 0)
+            # A pre-migration row can carry a NULL status (''). It belongs in
+            # the totals but must not invent a status key the UI would then
+            # render as a badge.
+            if status:
+                status_counts[status] = status_counts.get(status, 0) + count
             total += count
             total_bytes += int(size_sum or 0)
-            proxy_count += int(proxy_sum or 0)
+            if use_proxy:
+                proxy_count += count
         local_count = total - proxy_count
 
         done_count = status_counts.get("done", 0)
         success_rate = round(done_count / total * 100, 1) if total > 0 else 0.0
 
-        trend_query = db.query(
-            func.date(DownloadRequest.requested_at).label("date"),
-            func.count(DownloadRequest.id).label("count"),
-            func.coalesce(func.sum(DownloadRequest.total_size), 0).label("bytes")
-        )
-
-        if start_date:
-            trend_query = trend_query.filter(DownloadRequest.requested_at >= start_dt)
-        if end_date:
-            trend_query = trend_query.filter(DownloadRequest.requested_at < end_dt)
-
-        trend_query = trend_query.group_by(func.date(DownloadRequest.requested_at)).order_by(func.date(DownloadRequest.requested_at))
-
-        daily_trend_raw = trend_query.all()
+        daily_trend_raw = totals["by_day"]
 
         daily_trend = []
         if len(daily_trend_raw) <= 365:
-            for row in daily_trend_raw:
-                daily_trend.append({"date": str(row.date), "count": row.count, "bytes": int(row.bytes)})
+            for day, count, size_sum in daily_trend_raw:
+                daily_trend.append({"date": day, "count": int(count), "bytes": int(size_sum or 0)})
         else:
             step = len(daily_trend_raw) / 365
             for i in range(365):
-                idx = int(i * step)
-                row = daily_trend_raw[idx]
-                daily_trend.append({"date": str(row.date), "count": row.count, "bytes": int(row.bytes)})
+                day, count, size_sum = daily_trend_raw[int(i * step)]
+                daily_trend.append({"date": day, "count": int(count), "bytes": int(size_sum or 0)})
 
         return {
             "total": total,
@@ -485,4 +541,18 @@ def get_history_stats(
         raise
     except Exception as e:
         print(f"[ERROR] Get history stats failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/history/stats/rebuild")
+def rebuild_history_stats(db: Session = Depends(get_db)):
+    """Recompute the stats totals from the download rows (drift repair)."""
+    try:
+        buckets = download_stats.rebuild(db.connection())
+        db.commit()
+        print(f"[LOG] History stats rebuilt: {buckets} buckets")
+        return {"success": True, "buckets": buckets}
+    except Exception as e:
+        db.rollback()
+        print(f"[ERROR] Rebuild history stats failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
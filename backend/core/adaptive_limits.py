@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""Per-(host, egress) download limits that follow what the host tolerates.
+
+``SITE_DOWNLOAD_LIMITS`` and ``max_per_host_downloads`` were guesses made once:
+megaup 2, datanodes 3, everyone else 3. A host that throttles at two parallel
+downloads kept getting three and answering the third with 429s, and a CDN that
+would happily serve six was held to three.
+
+The controller here is AIMD — the same rule TCP uses for its window:
+
+* **Additive increase.** Once per :data:`SAMPLE_INTERVAL_SEC`, a slot that is
+  full and has a queue behind it gets one more place — but only while the
+  slot's *aggregate* throughput keeps rising. If the extra download did not
+  add at least :data:`MIN_GAIN` to the total, the host was already the limit:
+  the place is taken back, and the limit where it stopped paying is remembered.
+* **Multiplicative decrease.** A 429, a block verdict from ``error_messages`` or
+  a TLS/connection reset halves the slot at once — at most once per
+  :data:`DECREASE_HOLD_SEC`, because one overload usually fails several
+  downloads together — and the limit that failed becomes the learned maximum.
+
+A learned maximum is not forever: after :data:`RELAX_SEC` without a failure it
+is allowed one step back up. Nothing ever goes above the static table (or the
+per-host setting for unlisted hosts); that stays the starting point and the
+ceiling. What was learned is kept in ``host_limits.json`` in the config
+directory, so a restart does not rediscover a host's limit by failing at it.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from core.error_messages import KIND_BLOCKED, KIND_RATE_LIMITED
+
+SAMPLE_INTERVAL_SEC = 30.0
+
+# An added download must raise the slot's total throughput by at least this
+# fraction to keep its place.
+MIN_GAIN = 0.10
+
+# One halving per overload, however many downloads it failed at once.
+DECREASE_HOLD_SEC = 60.0
+
+# A clean stretch this long lets a learned maximum rise by one again.
+RELAX_SEC = 3600.0
+
+# Verdicts that mean "too much at once" rather than a bad link.
+CONGESTION_KINDS = (KIND_RATE_LIMITED, KIND_BLOCKED)
+
+# Raw error fragments for the same thing below the HTTP layer.
+CONGESTION_MARKERS = (
+    "429",
+    "too many requests",
+    "connection reset",
+    "server disconnected",
+    "eof occurred in violation of protocol",
+    "ssl handshake",
+    "tls handshake",
+)
+
+STATE_FILE_NAME = "host_limits.json"
+
+
+def is_congestion(kind: Optional[str], raw_error: Optional[str]) -> bool:
+    """Does this failure say the host wants fewer parallel downloads?"""
+    if kind in CONGESTION_KINDS:
+        return True
+    text = (raw_error or "").lower()
+    return any(marker in text for marker in CONGESTION_MARKERS)
+
+
+@dataclass
+class _SlotState:
+    limit: int
+    learned_max: int
+    # Aggregate rate measured before the last increase, and whether that
+    # increase is still on trial.
+    last_rate: float = 0.0
+    probing: bool = False
+    last_decrease: float = 0.0
+    clean_since: float = 0.0
+
+
+class AdaptiveLimits:
+    """AIMD state for every slot key, persisted as JSON."""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path is not None else None
+        self._lock = threading.Lock()
+        self._slots: Dict[str, _SlotState] = {}
+        self._dirty = False
+        self._load()
+
+    def limit_for(self, slot_key: str, ceiling: int) -> int:
+        """The current limit for a slot, never above its static ceiling."""
+        ceiling = max(1, int(ceiling))
+        with self._lock:
+            state = self._slots.get(slot_key)
+            return ceiling if state is None else max(1, min(state.limit, ceiling))
+
+    def record_failure(self, slot_key: str, ceiling: int, kind: Optional[str],
+                       raw_error: Optional[str], now: Optional[float] = None) -> Optional[int]:
+        """Halve the slot on a congestion failure; the new limit, or ``None``."""
+        if not is_congestion(kind, raw_error):
+            return None
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._state(slot_key, ceiling, now)
+            state.clean_since = now
+            state.probing = False
+            if now - state.last_decrease < DECREASE_HOLD_SEC and state.last_decrease:
+                return None
+            state.last_decrease = now
+            failed_at = min(state.limit, ceiling)
+            state.learned_max = max(1, failed_at - 1)
+            state.limit = max(1, failed_at // 2)
+            self._dirty = True
+            return state.limit
+
+    def sample(self, slot_key: str, ceiling: int, rate: float, running: int,
+               queued: int, now: Optional[float] = None) -> Optional[int]:
+        """One periodic reading of a slot; the new limit if it changed, else ``None``."""
+        now = time.monotonic() if now is None else now
+        ceiling = max(1, int(ceiling))
+        with self._lock:
+            state = self._state(slot_key, ceiling, now)
+            before = state.limit = min(state.limit, ceiling)
+
+            if state.probing:
+                state.probing = False
+                if rate < state.last_rate * (1 + MIN_GAIN):
+                    # The extra download did not pay: the host is the limit.
+                    state.limit = state.learned_max = max(1, state.limit - 1)
+            elif now - state.clean_since >= RELAX_SEC and state.learned_max < ceiling:
+                state.learned_max += 1
+                state.clean_since = now
+
+            if (state.limit == before and running >= state.limit and queued > 0
+                    and state.limit < min(ceiling, state.learned_max)
+                    and now - state.last_decrease >= DECREASE_HOLD_SEC):
+                state.limit += 1
+                state.probing = True
+            state.last_rate = rate
+
+            if state.limit != before:
+                self._dirty = True
+                return state.limit
+            return None
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {k: {"limit": s.limit, "learned_max": s.learned_max} for k, s in self._slots.items()}
+
+    def save_if_dirty(self) -> None:
+        """Write the learned limits out if anything changed. Blocking file I/O."""
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {k: {"limit": s.limit, "learned_max": s.learned_max} for k, s in self._slots.items()}
+            self._dirty = False
+        tmp = self.path.with_suffix(".json.tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[WARNING] 호스트별 동시 다운로드 학습값 저장 실패: {e}")
+
+    def _state(self, slot_key: str, ceiling: int, now: float) -> _SlotState:
+        state = self._slots.get(slot_key)
+        if state is None:
+            state = _SlotState(limit=ceiling, learned_max=ceiling, clean_since=now)
+            self._slots[slot_key] = state
+        elif not state.clean_since:
+            state.clean_since = now
+        return state
+
+    def _load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for key, values in data.items():
+                limit = max(1, int(values["limit"]))
+                learned = max(limit, int(values.get("learned_max", limit)))
+                self._slots[str(key)] = _SlotState(limit=limit, learned_max=learned)
+        except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+            # A damaged file only costs the learning; start from the table.
+            print(f"[WARNING] 호스트별 동시 다운로드 학습값 읽기 실패, 기본값 사용: {e}")
+            self._slots = {}
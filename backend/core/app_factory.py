@@ -30,6 +30,7 @@ from api.routes.history import router as history_router
 from api.routes.system import router as system_router
 from api.routes.audit import router as audit_router
 from core.db import engine
+from core import change_feed, http_sessions, schema_versions
 from core.models import Base
 from core.i18n import load_all_translations
 from core.db import get_db
@@ -155,6 +156,7 @@ async def lifespan(app: FastAPI):
 
     await _shutdown_step("Download service", download_service.stop)
     await _shutdown_step("SSE manager", sse_manager.stop)
+    await _shutdown_step("HTTP connection pools", http_sessions.close_all)
 
     # Clean up running tasks (exclude the current task to avoid infinite recursion)
     try:
@@ -371,6 +373,14 @@ async def _run_migrations():
         ("attempts_json", "TEXT"),
         # 사용자가 직접 만진 프록시 스위치 (2026-08)
         ("proxy_pinned", "BOOLEAN DEFAULT 0"),
+        # Explicit queue order (2026-10)
+        ("priority", "INTEGER DEFAULT 0"),
+        ("queue_pinned", "BOOLEAN DEFAULT 0"),
+        ("queue_position", "REAL"),
+        # Row version for the change feed (2026-10)
+        ("updated_seq", "INTEGER"),
+        # Duplicate-check key of url (2026-10); filled by schema step 1
+        ("url_hash", "INTEGER"),
     ]
 
     try:
@@ -398,12 +408,29 @@ async def _run_migrations():
                 "CREATE INDEX IF NOT EXISTS ix_download_requests_next_retry_at "
                 "ON download_requests(next_retry_at)"
             ))
+            db.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_download_requests_updated_seq "
+                "ON download_requests(updated_seq)"
+            ))
+            # Rows from before the column get a version once; every write
+            # after this stamps its own (core/change_feed.py).
+            db.execute(text(
+                "UPDATE download_requests SET updated_seq = id WHERE updated_seq IS NULL"
+            ))
             db.commit()
+            change_feed.reset()
         except Exception as e:
             print(f"[ERROR] Migration failed: {e}")
             db.rollback()
         finally:
             db.close()
 
+        # One-time steps (backfills, new indexes + ANALYZE), after the columns
+        # they rely on exist.
+        try:
+            schema_versions.upgrade(engine)
+        except Exception as e:
+            print(f"[ERROR] Schema step failed: {e}")
+
     except Exception as e:
         print(f"[ERROR] Migration setup failed: {e}")
@@ -16,18 +16,31 @@ Race-safe:
   returns an Event that is already ready to wake.
 - When the countdown finishes or the download completes/fails, ``clear``
   cleans it up.
+
+The transfer loops use it the same way: a per-buffer ``is_cancelled`` check is
+a dict lookup where the old per-megabyte ``db.refresh`` was a SQLite SELECT on
+a worker thread. A read already parked on a silent socket would still sit
+there until the next byte, so a transfer also registers its body with
+``interrupt_reads`` — the stop fails that read on the spot with
+``DownloadCancelled``.
 """
 
 from __future__ import annotations
 
+import asyncio
 import threading
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional
 
 
 _events: Dict[int, threading.Event] = {}
+_callbacks: Dict[int, List[Callable[[], None]]] = {}
 _lock = threading.Lock()
 
 
+class DownloadCancelled(Exception):
+    """A transfer's read was cut short because the download was stopped."""
+
+
 def get_event(download_id: int) -> threading.Event:
     """Return the cancel Event for ``download_id``. Create it if missing."""
     with _lock:
@@ -50,6 +63,12 @@ def signal_cancel(download_id: int) -> None:
             event = threading.Event()
             _events[download_id] = event
         event.set()
+        callbacks = _callbacks.pop(download_id, [])
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception as callback_error:
+            print(f"[WARNING] 취소 콜백 실패: {callback_error}")
 
 
 def clear(download_id: int) -> None:
@@ -60,6 +79,54 @@ def clear(download_id: int) -> None:
     """
     with _lock:
         _events.pop(download_id, None)
+        _callbacks.pop(download_id, None)
+
+
+def on_cancel(download_id: int, callback: Callable[[], None]) -> Callable[[], None]:
+    """Run ``callback`` when ``download_id`` is cancelled; returns the unregister.
+
+    Runs at once if the signal is already set. The callback runs on whatever
+    thread signals, so it must be thread-safe.
+    """
+    with _lock:
+        event = _events.get(download_id)
+        fire_now = event is not None and event.is_set()
+        if not fire_now:
+            _callbacks.setdefault(download_id, []).append(callback)
+    if fire_now:
+        callback()
+
+    def unregister() -> None:
+        with _lock:
+            registered = _callbacks.get(download_id)
+            if registered and callback in registered:
+                registered.remove(callback)
+                if not registered:
+                    _callbacks.pop(download_id, None)
+
+    return unregister
+
+
+def interrupt_reads(download_id: int, stream) -> Callable[[], None]:
+    """Fail ``stream``'s pending and future reads once ``download_id`` is stopped.
+
+    ``stream`` is an aiohttp ``StreamReader`` (``response.content``). Must be
+    called on the loop that reads it; returns the unregister.
+    """
+    loop = asyncio.get_running_loop()
+
+    def fail_stream() -> None:
+        set_exception = getattr(stream, "set_exception", None)
+        if set_exception is not None:
+            set_exception(DownloadCancelled(f"download {download_id} stopped"))
+
+    def interrupt() -> None:
+        try:
+            loop.call_soon_threadsafe(fail_stream)
+        except RuntimeError:
+            pass  # loop already closed; nothing is reading
+
+    return on_cancel(download_id, interrupt)
 
 
 def is_cancelled(download_id: int) -> bool:
@@ -73,3 +140,4 @@ def reset_all_for_tests() -> None:
     """Reset global state for tests. Do not call from production code."""
     with _lock:
         _events.clear()
+        _callbacks.clear()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Row versions for the download grid's change feed.
+
+The grid refetched a whole page — a COUNT, an OFFSET query and a dict per row —
+after almost every SSE event, to learn about the one or two rows that had
+changed. ``DownloadRequest.updated_seq`` lets it ask only for those:
+``GET /api/downloads/changes?since=<seq>`` returns the rows written after that
+version, plus the ids deleted since (``download_tombstones``).
+
+Every write gets a fresh number from one in-process counter, seeded from the
+database on first use:
+
+* ORM writes are stamped in ``before_flush`` — inserts, updates and deletes
+  alike (a delete leaves a tombstone), so no call site has to remember it.
+* The progress writer's raw UPDATE asks :func:`allocate` itself.
+
+A number is handed out before its transaction commits, so two writers can
+commit out of order. :func:`cursor` therefore only advances to just below the
+oldest number still in flight: a client polling from there may see a row twice,
+but never misses one.
+
+The value is set on the instance as well as in the row — it is Python-side
+like every other default here, so nothing has to read it back.
+
+Tombstones would otherwise pile up forever. :func:`prune_tombstones` drops the
+ones more than :data:`TOMBSTONE_HORIZON` versions behind the cursor, and a
+client whose ``since`` is older than :func:`horizon` is told to refetch its
+page instead of being handed a feed with deletions missing. The horizon is
+relative to the cursor, which only grows, so it needs no stored state: every
+pruned tombstone is at or below the horizon of any later call.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+_SESSION_KEY = "change_feed_seqs"
+
+_MAX_SEQ_SQL = text(
+    "SELECT MAX(v) FROM ("
+    "SELECT MAX(updated_seq) AS v FROM download_requests "
+    "UNION ALL SELECT MAX(deleted_seq) FROM download_tombstones)"
+)
+
+# How many versions behind the cursor a deletion is still reported. Progress
+# writes take a version too, so this is hours of a busy queue, not a count of
+# deletions.
+TOMBSTONE_HORIZON = 200_000
+TOMBSTONE_PRUNE_INTERVAL_SEC = 3600
+
+_PRUNE_SQL = text("DELETE FROM download_tombstones WHERE deleted_seq <= :horizon")
+
+_lock = threading.Lock()
+_last: Optional[int] = None
+_inflight: Set[int] = set()
+
+
+def _seed(connection) -> None:
+    """Start the counter after the highest version already stored."""
+    global _last
+    try:
+        value = connection.execute(_MAX_SEQ_SQL).scalar()
+    except Exception as e:
+        print(f"[WARNING] 변경 순번 초기화 실패, 0부터 시작: {e}")
+        value = None
+    with _lock:
+        if _last is None:
+            _last = int(value or 0)
+
+
+def allocate(connection, count: int = 1) -> List[int]:
+    """Hand out ``count`` new versions; they stay in flight until released."""
+    global _last
+    if _last is None:
+        _seed(connection)
+    with _lock:
+        seqs = list(range(_last + 1, _last + 1 + count))
+        _last += count
+        _inflight.update(seqs)
+    return seqs
+
+
+def release(seqs: Iterable[int]) -> None:
+    """The transaction that used these versions has ended either way."""
+    with _lock:
+        _inflight.difference_update(seqs)
+
+
+def cursor(connection) -> int:
+    """The newest version a client can safely resume from."""
+    if _last is None:
+        _seed(connection)
+    with _lock:
+        return min(_inflight) - 1 if _inflight else _last
+
+
+def horizon(connection) -> int:
+    """The oldest ``since`` the feed can still answer completely."""
+    return max(0, cursor(connection) - TOMBSTONE_HORIZON)
+
+
+def prune_tombstones(engine=None) -> int:
+    """Delete the tombstones behind :func:`horizon`; returns how many. Blocking."""
+    if engine is None:
+        from core.db import engine
+    with engine.begin() as conn:
+        return conn.execute(_PRUNE_SQL, {"horizon": horizon(conn)}).rowcount or 0
+
+
+def reset() -> None:
+    """Forget the counter; the next write re-reads it from the database."""
+    global _last
+    with _lock:
+        _last = None
+        _inflight.clear()
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_downloads(session, flush_context, instances):
+    from core.models import DownloadRequest, DownloadTombstone
+
+    written = [
+        obj for obj in session.new
+        if isinstance(obj, DownloadRequest)
+    ] + [
+        obj for obj in session.dirty
+        if isinstance(obj, DownloadRequest) and session.is_modified(obj, include_collections=False)
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, DownloadRequest)]
+    if not written and not deleted:
+        return
+
+    seqs = allocate(session.connection(), len(written) + len(deleted))
+    session.info.setdefault(_SESSION_KEY, []).extend(seqs)
+    for obj, seq in zip(written, seqs):
+        obj.updated_seq = seq
+    for obj, seq in zip(deleted, seqs[len(written):]):
+        session.add(DownloadTombstone(download_id=obj.id, deleted_seq=seq))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _release_session_seqs(session, transaction):
+    if transaction.parent is None:
+        release(session.info.pop(_SESSION_KEY, ()))
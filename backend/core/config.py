@@ -79,6 +79,21 @@ DEFAULT_CONFIG = {
     # small files on another host (each host gets its own queue). See download_core.
     "max_concurrent_downloads": 8,
     "max_per_host_downloads": 3,
+    # Order the queue starts waiting downloads in, after pins and priority:
+    # "fifo" (request order, or a manual reorder) or "smallest_first" (known
+    # sizes ascending, unknown last). See core/scheduler.py.
+    "queue_order": "fifo",
+    # Seconds between progress_batch frames: one SSE message carrying every
+    # download whose progress moved since the last one (0.25-30). See
+    # core/live_progress.py.
+    "progress_interval_sec": 1.0,
+    # Byte-range connections per download, by host substring, overriding the
+    # shipped table (download_core.SITE_SEGMENT_COUNTS). Set a host to 1 if it
+    # starts refusing parallel ranges. {} keeps the shipped values.
+    "download_segments": {},
+    # Receive buffer size in KB for the transfer loops (256-4096). 0 sizes it
+    # from the measured rate instead. See utils/receive_buffers.py.
+    "receive_buffer_kb": 0,
     # Below this size (MB), the Telegram start notification is suppressed so a
     # small file sends only one (completion) message instead of a near-
     # simultaneous start+complete pair. 0 disables the suppression.
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Disk space promised to running downloads, and preallocation of ``.part`` files.
+
+A full disk used to be found the hard way: mid-write, as an ENOSPC string match
+in the transfer loop, which then swept the database to stop everything else.
+By then several downloads had each written part of a file that could never
+fit, and all of them had to be cleaned up by hand.
+
+Two things move that check to the front:
+
+* A ledger of bytes each admitted download still needs. A download is admitted
+  only if its remaining size fits the free space *minus what the others have
+  already been promised* — free space alone says yes to five 40 GB files on a
+  60 GB disk, because none of them has written anything yet.
+* Preallocation. Once a transfer opens its ``.part`` and the size is known, the
+  whole file is allocated up front. The space is then really taken (the free
+  figure already counts it), so the reservation is settled to zero; and the
+  HDD stripe gets one contiguous extent instead of a file grown 8 KB at a time
+  around everybody else's.
+
+Preallocation keeps the file size as it is (``FALLOC_FL_KEEP_SIZE``): the size
+of a ``.part`` is its resume offset, and a file that claimed its full length up
+front would look finished. That rules out ``posix_fallocate``, which also
+fakes support by writing zeros over the whole length on filesystems without a
+native fallocate — minutes of disk I/O on a NAS share. Where the native call is
+missing, nothing is preallocated and the reservation simply stands until the
+download ends.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import shutil
+import threading
+from typing import Dict, Optional
+
+# Kept free beyond every reservation: metadata, the segment map, the config
+# and database files all live on the same disks.
+HEADROOM_BYTES = 256 * 1024 * 1024
+
+FALLOC_FL_KEEP_SIZE = 0x01
+
+_lock = threading.Lock()
+_reserved: Dict[int, int] = {}
+
+
+def reserved_bytes(exclude: Optional[int] = None) -> int:
+    """Bytes promised to downloads other than ``exclude``."""
+    with _lock:
+        return sum(v for k, v in _reserved.items() if k != exclude)
+
+
+def free_bytes(directory) -> Optional[int]:
+    """Free space where downloads land, or ``None`` if it cannot be read."""
+    try:
+        return shutil.disk_usage(str(directory)).free
+    except OSError:
+        return None
+
+
+def reserve(download_id: int, nbytes: int, directory) -> bool:
+    """Promise ``nbytes`` to a download, or return ``False`` if they do not fit.
+
+    Replaces any earlier reservation of the same download — a restart asks for
+    what is left, not for the whole file again. Blocking (``statvfs``), so
+    callers on the loop run it in a thread.
+    """
+    nbytes = max(0, int(nbytes or 0))
+    free = free_bytes(directory)
+    with _lock:
+        if free is not None and nbytes > 0:
+            others = sum(v for k, v in _reserved.items() if k != download_id)
+            if nbytes + others + HEADROOM_BYTES > free:
+                return False
+        _reserved[int(download_id)] = nbytes
+    return True
+
+
+def allocated_bytes(part_path: Optional[str]) -> int:
+    """Bytes the ``.part`` already holds on disk, preallocated blocks included."""
+    if not part_path:
+        return 0
+    try:
+        st = os.stat(part_path)
+    except OSError:
+        return 0
+    blocks = getattr(st, "st_blocks", None)  # not on Windows
+    return blocks * 512 if blocks is not None else st.st_size
+
+
+def reserve_remaining(download_id: int, total: int, part_path: Optional[str], directory) -> bool:
+    """Reserve what ``part_path`` still lacks of ``total`` bytes."""
+    return reserve(download_id, max(0, int(total or 0) - allocated_bytes(part_path)), directory)
+
+
+def settle(download_id: int) -> None:
+    """The space is allocated on disk now; the free figure already counts it."""
+    with _lock:
+        if int(download_id) in _reserved:
+            _reserved[int(download_id)] = 0
+
+
+def release(download_id: int) -> None:
+    """Drop a download's reservation — it finished, failed or was stopped."""
+    with _lock:
+        _reserved.pop(int(download_id), None)
+
+
+def _load_fallocate():
+    # Linux only; elsewhere there is no fallocate(2) to find.
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fn = libc.fallocate
+    except (OSError, AttributeError, TypeError):
+        return None
+    fn.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+    fn.restype = ctypes.c_int
+    return fn
+
+
+_fallocate = _load_fallocate()
+
+
+def preallocate(fd: int, length: int) -> bool:
+    """Allocate ``length`` bytes for ``fd`` without changing its size.
+
+    ``False`` when the platform or filesystem cannot — the download goes on
+    without it, it only loses the early guarantee. A disk that is too full
+    raises ENOSPC right here, before a single byte is fetched.
+    """
+    if _fallocate is None or length <= 0:
+        return False
+    if _fallocate(fd, FALLOC_FL_KEEP_SIZE, 0, int(length)) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err == errno.ENOSPC:
+        raise OSError(err, os.strerror(err))
+    if err not in (errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL):
+        print(f"[LOG] .part 사전 할당 실패(무시): {os.strerror(err)}")
+    return False
@@ -15,20 +15,31 @@ import datetime
 import json
 import re
 import traceback
-import shutil
+from collections import deque
 from pathlib import Path
-from typing import Optional, Dict, Any, AsyncGenerator, Tuple
+from typing import Optional, Dict, Any, AsyncGenerator, Deque, Tuple
 from sqlalchemy.orm import Session
 
 from .models import DownloadRequest, StatusEnum
-from .config import get_download_path, get_config
+from .config import get_download_path, get_config, CONFIG_DIR
 from .db import SessionLocal
 from services.sse_manager import sse_manager
 from services.notification_service import send_telegram_start_notification, send_telegram_notification
-from utils.file_helpers import PART_SUFFIX, download_file_content, generate_file_path, get_final_file_path
+from utils.file_helpers import (
+    PART_SUFFIX,
+    download_file_content,
+    download_segmented_content,
+    generate_file_path,
+    get_final_file_path,
+)
+from utils.finalize import move_into_place
 from core import db_async
 from core import live_progress
-from core.slots import slot_without_session
+from core import progress_writer
+from core import http_sessions
+from core.adaptive_limits import AdaptiveLimits, STATE_FILE_NAME as ADAPTIVE_STATE_FILE
+from core.scheduler import DownloadScheduler, QueuedDownload, ORDER_FIFO, QUEUE_ORDERS
+from core.segments import MIN_SEGMENT_BYTES, collapse_to_prefix, discard_segment_map, resume_offset
 from core.resume import (
     PROBE_RANGE,
     RANGE_NOT_SATISFIABLE,
@@ -63,13 +74,13 @@ from core.executors import parse_executor_for
 from core.mega_hoster import (
     MegaApiError,
     download_mega_file,
-    fetch_mega_file_info,
     is_mega_url,
     mega_error_message,
-    parse_mega_url,
+    resolve_mega_file,
 )
 from core import fichier_auth
 from core import cancel_signal
+from core import disk_reserve
 from core.config import get_config
 from core.i18n import get_translations
 
@@ -98,7 +109,7 @@ FICHIER_HOST_BACKOFF_SECONDS = (120, 300, 900, 1800)  # 2m → 5m → 15m → 30
 # Per-site concurrent-download limits (host substring -> max concurrent).
 # Different hosts tolerate different parallelism, so each gets its own queue
 # instead of sharing one global limit. Unlisted hosts use MAX_PER_HOST_DOWNLOADS.
-# (1fichier local has its own dedicated semaphore — max 1 — handled separately.)
+# (1fichier local has its own dedicated slot — max 1 — handled separately.)
 SITE_DOWNLOAD_LIMITS = {
     "megaup.net": 2,
     "datanodes.to": 3,
@@ -107,6 +118,30 @@ SITE_DOWNLOAD_LIMITS = {
     "send.now": 1,
 }
 
+# Per-site connections per download (host substring -> byte-range segments).
+# A node that shapes each TCP stream caps one big file at whatever a single
+# connection gets, so range-capable hosts fetch several segments side by side.
+# Only hosts measured to tolerate it are listed above 1: 1fichier's free tier
+# and rapidgator count every connection as a download and answer the second
+# with a block. Each segment is a connection the hoster sees, so the real
+# per-IP load is SITE_DOWNLOAD_LIMITS x this. Unlisted hosts get one stream;
+# config "download_segments" overrides per host without a release.
+SITE_SEGMENT_COUNTS = {
+    "1fichier.com": 1,
+    "megaup.net": 1,
+    "rapidgator.net": 1,
+    "send.now": 1,
+    "datanodes.to": 4,
+    "gofile.io": 4,
+    # MEGA's temporary content URLs serve ranges; the chunk groups are fetched
+    # side by side (core/mega_hoster._download_parallel).
+    "mega.nz": 4,
+    "mega.co.nz": 4,
+    "pixeldrain.com": 4,
+}
+DEFAULT_SEGMENTS_PER_DOWNLOAD = 1
+MAX_SEGMENTS_PER_DOWNLOAD = 8
+
 # Smart-download concurrency defaults (overridable via config.json).
 # - GLOBAL ceiling: hard cap on total simultaneous downloads (the "max download
 #   count"). Held only AFTER a per-host slot is acquired, so it bounds the total
@@ -126,7 +161,7 @@ CONCURRENCY_MAX = 32
 # slots are a property of (host, egress), not of the host alone. Adding a proxy
 # egress therefore adds a second set of slots instead of splitting the first.
 # `use_proxy` on the request is what selects the egress; these names key the
-# semaphores and the 1fichier backoff state.
+# scheduler slots and the 1fichier backoff state.
 EGRESS_DIRECT = "direct"
 EGRESS_VPN = "vpn"
 # "manual" is the default and means the app does not choose: whatever the item's
@@ -169,6 +204,33 @@ def egress_denied_for_host(host_key: str, egress: str) -> bool:
     return egress in denied
 
 
+def segment_count_for_host(url: Optional[str]) -> int:
+    """How many ranged connections one download from ``url`` may open.
+
+    Config first, so a host can be tuned (or set to 1 after it starts refusing
+    parallel ranges) without a release; then the shipped table. A non-numeric
+    config value is ignored rather than allowed to break the download path.
+    """
+    host = (urlparse(url or "").hostname or "").lower()
+    if not host:
+        return DEFAULT_SEGMENTS_PER_DOWNLOAD
+    overrides = get_config().get("download_segments")
+    candidates = []
+    if isinstance(overrides, dict):
+        candidates.append(overrides)
+    candidates.append(SITE_SEGMENT_COUNTS)
+    for table in candidates:
+        key = next((k for k in table if k in host), None)
+        if key is None:
+            continue
+        try:
+            count = int(table[key])
+        except (TypeError, ValueError):
+            continue
+        return max(1, min(MAX_SEGMENTS_PER_DOWNLOAD, count))
+    return DEFAULT_SEGMENTS_PER_DOWNLOAD
+
+
 def _read_download_route() -> str:
     """Read the configured route, falling back to direct on anything unknown."""
     route = str(get_config().get("download_route", DEFAULT_DOWNLOAD_ROUTE) or "").strip().lower()
@@ -200,6 +262,17 @@ def _read_concurrency_limits() -> tuple:
     per_host_default = min(per_host_default, global_ceiling)
     return global_ceiling, per_host_default
 
+
+def _read_queue_order() -> str:
+    """Read ``queue_order``, falling back to FIFO on anything unknown."""
+    order = str(get_config().get("queue_order", ORDER_FIFO) or "").strip().lower()
+    return order if order in QUEUE_ORDERS else ORDER_FIFO
+
+
+# Slot key prefix for 1fichier's free tier (one download per IP, outside the
+# global ceiling). Never a hostname, so it cannot collide with a host slot.
+FICHIER_LOCAL_SLOT = "1fichier-local"
+
 # Wait limit for when the SSE callback pushes a message to the main loop's event queue.
 # Too long blocks the sync executor thread; too short drops SSE under heavy load.
 SSE_CALLBACK_TIMEOUT_SEC = 1.0
@@ -449,7 +522,7 @@ def _status_after_failure(verdict) -> StatusEnum:
     queue is working through a backlog" and "everything is broken".
 
     It still carries next_retry_at, which is what the sweeper keys on to tell a
-    scheduled wait from a download parked behind a semaphore by a live task.
+    scheduled wait from a download waiting in the scheduler's queue.
     """
     return StatusEnum.pending if verdict.kind == KIND_QUEUED else StatusEnum.failed
 
@@ -463,21 +536,30 @@ class DownloadCore:
         # One slot PER EGRESS: the free-tier cap is per IP, so a proxy egress gets
         # its own slot rather than queueing behind the direct one.
         self.MAX_FICHIER_LOCAL_DOWNLOADS = 1
-        self._fichier_semaphores: Dict[str, asyncio.Semaphore] = {}
-        # Smart-download admission control. Every non-1fichier-local download
-        # acquires its per-host semaphore first (host isolation), then the global
-        # ceiling (total cap). Limits come from config so the user can tune them.
+        # Smart-download admission control. A waiting download is an entry in
+        # the scheduler, not a parked task: each (host, egress) slot has its own
+        # queue (host isolation) and all of them share the global ceiling
+        # (total cap). A task is created only once its slot has room. Limits
+        # come from config so the user can tune them.
         self.MAX_CONCURRENT_DOWNLOADS, self.MAX_PER_HOST_DOWNLOADS = _read_concurrency_limits()
-        self.total_download_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_DOWNLOADS)
-        # Per-host semaphores (lazily created in the running loop), keyed by the
-        # SITE_DOWNLOAD_LIMITS host substring or, for unlisted hosts, the hostname.
-        self._site_semaphores: Dict[str, asyncio.Semaphore] = {}
-        # Up-front name/size resolution for special hosters runs OUTSIDE the
-        # download slots, so a queued item shows its real name while it waits its
-        # turn (no perpetual skeleton). Bounded so 85 queued items don't fan out
-        # into 85 simultaneous page GETs against the same host.
+        self.QUEUE_ORDER = _read_queue_order()
+        live_progress.set_interval(get_config().get("progress_interval_sec"))
+        # What each (host, egress) slot has shown it tolerates, within the
+        # static limits above (see core/adaptive_limits.py).
+        self.adaptive = AdaptiveLimits(CONFIG_DIR / ADAPTIVE_STATE_FILE)
+        self.scheduler = DownloadScheduler(
+            launch=lambda entry: self._launch_queued(entry),
+            ceiling=self.MAX_CONCURRENT_DOWNLOADS,
+            order=lambda: self.QUEUE_ORDER,
+        )
+        # Up-front name/size resolution runs OUTSIDE the download slots, so a
+        # queued item shows its real name while it waits its turn (no perpetual
+        # skeleton). Bounded so 85 queued items don't fan out into 85
+        # simultaneous page GETs against the same host.
         self.MAX_SPECIAL_PREPARSE = 4
         self.special_preparse_semaphore = asyncio.Semaphore(self.MAX_SPECIAL_PREPARSE)
+        self._preparse_backlog: Deque[int] = deque()
+        self._preparse_workers = 0
         # For throttling SSE message frequency
         self.last_sse_time: Dict[int, float] = {}  # Last SSE send time per download
         self.SSE_THROTTLE_INTERVAL = 10.0  # Send SSE only every 10 seconds
@@ -497,16 +579,21 @@ class DownloadCore:
         self._fichier_block_streak: Dict[str, int] = {}
 
     def refresh_concurrency_settings(self) -> None:
-        """Re-read concurrency limits from config and apply them to NEW downloads.
+        """Re-read concurrency limits and queue order from config and apply them.
 
         Called when settings are saved so changes take effect without a restart.
-        In-flight downloads keep the semaphore objects they already acquired, so
-        the new caps bind as those drain — total concurrency may briefly exceed a
-        lowered limit, then self-corrects. Per-host semaphores are rebuilt lazily.
+        The progress_batch cadence is picked up here as well.
+        The limiters are resized in place, so a raised limit starts queued
+        downloads right away. A lowered one admits nothing new until enough
+        running downloads finish — they are never stopped to make room.
         """
         self.MAX_CONCURRENT_DOWNLOADS, self.MAX_PER_HOST_DOWNLOADS = _read_concurrency_limits()
-        self.total_download_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_DOWNLOADS)
-        self._site_semaphores = {}
+        self.QUEUE_ORDER = _read_queue_order()
+        live_progress.set_interval(get_config().get("progress_interval_sec"))
+        self.scheduler.set_ceiling(self.MAX_CONCURRENT_DOWNLOADS)
+        for slot_key in self.scheduler.slot_keys():
+            self.scheduler.set_limit(slot_key, self._slot_limit(slot_key))
+        self.scheduler.resort()
         print(
             f"[LOG] 동시 다운로드 설정 갱신 → 전체 {self.MAX_CONCURRENT_DOWNLOADS}개 / "
             f"호스트당 {self.MAX_PER_HOST_DOWNLOADS}개"
@@ -518,7 +605,7 @@ class DownloadCore:
         Listed hosts (SITE_DOWNLOAD_LIMITS) keep their tuned limit and are keyed
         by the matched substring; every other host is keyed by its hostname and
         shares the default per-host cap. The key is what gives each host its own
-        semaphore, so one host's queue never blocks another's.
+        queue, so one host's queue never blocks another's.
         """
         host = (urlparse(url or "").hostname or "").lower()
         site_key = next((k for k in SITE_DOWNLOAD_LIMITS if k in host), None)
@@ -526,13 +613,128 @@ class DownloadCore:
             return site_key, SITE_DOWNLOAD_LIMITS[site_key]
         return (host or "_default"), self.MAX_PER_HOST_DOWNLOADS
 
-    def _fichier_sem(self, egress: str) -> asyncio.Semaphore:
-        """The 1fichier-local slot for one egress (created on first use)."""
-        sem = self._fichier_semaphores.get(egress)
-        if sem is None:
-            sem = asyncio.Semaphore(self.MAX_FICHIER_LOCAL_DOWNLOADS)
-            self._fichier_semaphores[egress] = sem
-        return sem
+    def _slot_for(self, req: DownloadRequest, egress: Optional[str] = None) -> Tuple[str, int, bool]:
+        """(slot_key, limit, shares_ceiling) of the queue ``req`` waits in.
+
+        1fichier over the direct egress is the free tier — one per IP and not
+        counted against the global ceiling. Everything else is keyed by (host,
+        egress): the hoster counts slots per IP, so the proxy egress gets its
+        own queue instead of sharing the direct one.
+        """
+        egress = egress or egress_of(req.use_proxy)
+        if "1fichier.com" in (req.url or "") and egress == EGRESS_DIRECT:
+            return f"{FICHIER_LOCAL_SLOT}@{egress}", self.MAX_FICHIER_LOCAL_DOWNLOADS, False
+        host_key, _ = self._resolve_host_limit(req.original_url or req.url)
+        slot_key = f"{host_key}@{egress}"
+        return slot_key, self._slot_limit(slot_key), True
+
+    def _static_slot_limit(self, slot_key: str) -> int:
+        """The configured limit for a slot key — the adaptive one's ceiling."""
+        host_key = slot_key.rpartition("@")[0]
+        if host_key == FICHIER_LOCAL_SLOT:
+            return self.MAX_FICHIER_LOCAL_DOWNLOADS
+        return SITE_DOWNLOAD_LIMITS.get(host_key, self.MAX_PER_HOST_DOWNLOADS)
+
+    def _slot_limit(self, slot_key: str) -> int:
+        """The limit a slot runs at now: the learned one, capped by the static one."""
+        static = self._static_slot_limit(slot_key)
+        if slot_key.startswith(FICHIER_LOCAL_SLOT):
+            return static  # the free tier's one-per-IP is a rule, not a guess
+        return self.adaptive.limit_for(slot_key, static)
+
+    def tune_host_limits(self) -> bool:
+        """One AIMD reading of every busy slot; True if any limit changed."""
+        speeds = live_progress.snapshot()
+        changed = False
+        for slot_key, req_ids in self.scheduler.running_by_slot().items():
+            if slot_key.startswith(FICHIER_LOCAL_SLOT):
+                continue
+            limit = self.adaptive.sample(
+                slot_key, self._static_slot_limit(slot_key),
+                rate=sum(speeds.get(i, 0) for i in req_ids),
+                running=len(req_ids),
+                queued=self.scheduler.queued_in(slot_key),
+            )
+            if limit is not None:
+                print(f"[LOG] 호스트 동시 다운로드 조정: {slot_key} → {limit}개 (처리량 기준)")
+                self.scheduler.set_limit(slot_key, limit)
+                changed = True
+        return changed
+
+    async def _feed_adaptive_limit(self, req_id: int, slot_key: str, db: Session) -> None:
+        """Tell the slot's controller how this download ended."""
+        if slot_key.startswith(FICHIER_LOCAL_SLOT):
+            return
+        row = await db_async.first(
+            db.query(DownloadRequest.status, DownloadRequest.failure_kind, DownloadRequest.error)
+            .filter(DownloadRequest.id == req_id)
+        )
+        if not row or row.status not in (StatusEnum.failed, StatusEnum.pending) or not row.failure_kind:
+            return
+        limit = self.adaptive.record_failure(
+            slot_key, self._static_slot_limit(slot_key), row.failure_kind, row.error)
+        if limit is not None:
+            print(f"[LOG] 호스트 동시 다운로드 축소: {slot_key} → {limit}개 ({row.failure_kind})")
+            self.scheduler.set_limit(slot_key, limit)
+
+    def _queue_entry(self, req: DownloadRequest, skip_parsing: bool) -> QueuedDownload:
+        slot_key, limit, shares_ceiling = self._slot_for(req)
+        position = getattr(req, "queue_position", None)
+        if position is None:
+            requested_at = getattr(req, "requested_at", None) or datetime.datetime.now()
+            position = requested_at.timestamp()
+        return QueuedDownload(
+            req_id=req.id,
+            slot_key=slot_key,
+            limit=limit,
+            shares_ceiling=shares_ceiling,
+            skip_parsing=skip_parsing,
+            priority=getattr(req, "priority", None) or 0,
+            pinned=bool(getattr(req, "queue_pinned", False)),
+            size=req.total_size or 0,
+            position=position,
+        )
+
+    def _launch_queued(self, entry: QueuedDownload) -> None:
+        """Scheduler callback: the entry's slot is free, start its task."""
+        task = asyncio.create_task(self._download_task(entry.req_id, entry.skip_parsing))
+        self.download_tasks[entry.req_id] = task
+        task.add_done_callback(lambda t, req_id=entry.req_id: self._task_cleanup(req_id))
+
+    def _queue_preparse(self, req_id: int) -> None:
+        """Resolve a queued item's name/size in the background, a few at a time."""
+        self._preparse_backlog.append(req_id)
+        while self._preparse_workers < self.MAX_SPECIAL_PREPARSE and self._preparse_backlog:
+            self._preparse_workers += 1
+            asyncio.create_task(self._preparse_worker())
+
+    async def _preparse_worker(self):
+        try:
+            while self._preparse_backlog:
+                req_id = self._preparse_backlog.popleft()
+                if not self.scheduler.is_queued(req_id):
+                    continue  # started, stopped or deleted in the meantime
+                await self._preparse_queued(req_id)
+        finally:
+            self._preparse_workers -= 1
+
+    async def _preparse_queued(self, req_id: int):
+        db = SessionLocal()
+        try:
+            req = await db_async.first(db.query(DownloadRequest).filter(DownloadRequest.id == req_id))
+            if not req or req.status != StatusEnum.pending:
+                return
+            if "1fichier.com" in (req.url or ""):
+                await self._perform_preparse(req, db)
+            else:
+                await self._perform_special_preparse(req, db)
+            # A size learned here matters to smallest-first ordering.
+            if req.total_size:
+                self.scheduler.update(req_id, size=req.total_size)
+        except Exception as e:
+            print(f"[WARNING] 대기열 사전파싱 실패: {req_id} ({e})")
+        finally:
+            db.close()
 
     def _proxy_egress_available(self, db: Session) -> bool:
         """Is there at least one active proxy to send the VPN egress through?
@@ -675,13 +877,8 @@ class DownloadCore:
         elif route == "auto":
             want = bool((req.attempt_count or 0) % 2)
         else:  # balance
-            is_fichier = "1fichier.com" in (req.url or "")
-
             def free(egress: str) -> bool:
-                if is_fichier:
-                    return self._fichier_sem(egress)._value > 0
-                sem = self._site_semaphores.get(f"{host_key}@{egress}")
-                return sem is None or sem._value > 0
+                return self.scheduler.has_room(*self._slot_for(req, egress))
 
             direct_free, vpn_free = free(EGRESS_DIRECT), free(EGRESS_VPN)
             if direct_free == vpn_free:
@@ -737,7 +934,7 @@ class DownloadCore:
                                       egress: str = EGRESS_DIRECT):
         """If a 1fichier-local host backoff is active, wait it out before
         attempting, so a flagged IP isn't hammered by the queue. Cancellable via
-        the stopped status. Holding the (max-1) semaphore here serializes the
+        the stopped status. Holding the (max-1) slot here serializes the
         backoff across all queued 1fichier-local downloads."""
         cooldown_until = self._fichier_cooldown_until.get(egress)
         if not cooldown_until or cooldown_until <= datetime.datetime.now():
@@ -764,6 +961,7 @@ class DownloadCore:
 
     async def send_download_update(self, req_id: int, update_data: Dict[str, Any]):
         """Send a unified download-status-update SSE"""
+        live_progress.note_status(req_id, update_data.get("status"))
         try:
             await sse_manager.broadcast_message("status_update", {
                 "id": req_id,
@@ -795,7 +993,7 @@ class DownloadCore:
         return sse_callback
 
     async def _perform_preparse(self, req: DownloadRequest, db: Session):
-        """Run preparsing (executed outside the semaphore)"""
+        """Run preparsing (executed outside the download slot for queued rows)"""
         # Skip preparsing if file info is already present
         if req.file_name and req.file_size and req.total_size and req.total_size > 0:
             print(f"[LOG] 파일 정보가 이미 있음, 사전파싱 건너뜀: {req.id} - {req.file_name} ({req.file_size})")
@@ -922,8 +1120,7 @@ class DownloadCore:
         try:
             # Guard against duplicate tasks for the same download. Retry presses,
             # auto-start-next, and restart-after-reboot can all re-enter here for an
-            # id that is already running — e.g. a download parked in the pending
-            # state while it waits on a per-site semaphore still holds a live task.
+            # id that is already running or already waiting in the scheduler.
             # Creating a second task would orphan the first (download_tasks only
             # tracks one per id), letting both write the same .part file and even
             # resurrect a deleted row. If a live task exists, this call is a no-op.
@@ -931,11 +1128,20 @@ class DownloadCore:
             if existing is not None and not existing.done():
                 print(f"[LOG] 이미 실행 중인 다운로드 태스크 존재, 중복 시작 방지: {req.id}")
                 return True
+            if self.scheduler.is_queued(req.id):
+                print(f"[LOG] 이미 대기열에 있음, 중복 시작 방지: {req.id}")
+                return True
 
             # Stop-then-restart case — if a previous cancel signal is left set,
             # it becomes a bug where the new download's countdown wakes up immediately.
             cancel_signal.clear(req.id)
 
+            # A known size that cannot fit next to what the running downloads
+            # were already promised is refused here, not found mid-write.
+            if not await self._reserve_disk_space(req):
+                await self._refuse_for_disk_space(req, db)
+                return False
+
             # Pick the egress before anything queues on a slot.
             # Sync helper doing three commits and a query. Called straight from
             # here it blocked the loop exactly like an inline commit would —
@@ -965,19 +1171,27 @@ class DownloadCore:
                 has_file_info and not is_1fichier and not is_special_hoster and not is_mega
             )
 
-            # For a 1fichier local download with a file name present (restart), check the semaphore
-            if is_1fichier and not req.use_proxy and has_file_info:
-                if self._fichier_sem(egress_of(req.use_proxy))._value == 0:
-                    # If the semaphore is unavailable, wait in the pending state
-                    req.status = StatusEnum.pending
-                    await self.send_download_update(req.id, {
-                        "status": "pending",
-                        "progress": 0,
-                        "message": "대기중..."
-                    })
-                    await db_async.commit(db)
-                    print(f"[LOG] 1fichier 로컬 세마포어 대기: {req.id}")
-                    return True
+            entry = self._queue_entry(req, skip_parsing)
+            if not self.scheduler.has_room(entry.slot_key, entry.limit, entry.shares_ceiling):
+                # The slot is full: wait in the queue as a row, not as a task.
+                # The status is committed before submitting, so a slot freeing
+                # up during the commit cannot start the task under us.
+                req.status = StatusEnum.pending
+                await db_async.commit(db)
+                await self.send_download_update(req.id, {
+                    "status": "pending",
+                    "progress": 0,
+                    "message": (
+                        f"다운로드 순서를 기다리는 중... "
+                        f"(호스트당 {entry.limit}개 / 전체 {self.MAX_CONCURRENT_DOWNLOADS}개 동시 실행)"
+                    ),
+                })
+                # Nothing is written while queued; the task reserves again at launch.
+                disk_reserve.release(req.id)
+                if not self.scheduler.submit(entry) and not skip_parsing:
+                    self._queue_preparse(req.id)
+                print(f"[LOG] 대기열 등록: {req.id} ({entry.slot_key})")
+                return True
 
             if skip_parsing:
                 print(f"[LOG] 파일 정보가 이미 있음, 파싱 건너뛰고 바로 다운로드 시작: {req.id} - {req.file_name} ({req.file_size})")
@@ -1005,17 +1219,19 @@ class DownloadCore:
                 print(f"[LOG] 기존 다운로드 정보 보존: total_size={req.total_size}, downloaded_size={req.downloaded_size}")
             await db_async.commit(db)
 
-            # Create the async download task
-            task = asyncio.create_task(self._download_task(req.id, skip_parsing))
-            self.download_tasks[req.id] = task
-
-            # Register the task completion callback
-            task.add_done_callback(lambda t, req_id=req.id: self._task_cleanup(req_id))
+            # The slot had room a moment ago; submitting starts the task now
+            # (or, if the commit let someone else take it, queues it).
+            self.scheduler.submit(entry)
 
             return True
 
         except Exception as e:
             print(f"[ERROR] 다운로드 시작 실패: {e}")
+            # No task took over the reservation made above, so nothing else
+            # would ever release it.
+            task = self.download_tasks.get(req.id)
+            if task is None or task.done():
+                disk_reserve.release(req.id)
             await self.send_download_update(req.id, {
                 "status": "failed",
                 "message": f"다운로드 시작 실패: {str(e)}"
@@ -1032,6 +1248,11 @@ class DownloadCore:
                 return
 
             print(f"[DEBUG] 다운로드 태스크 시작: ID={req_id}, URL={req.url}, USE_PROXY={req.use_proxy}")
+            if req.status == StatusEnum.stopped:
+                # Stopped while it sat in the queue (a bulk stop only writes
+                # the row). The scheduler launched it anyway; do nothing.
+                print(f"[LOG] 대기 중 정지됨, 시작 안 함: {req_id}")
+                return
 
             # Proceed with the download - branch based on URL and proxy settings
             is_1fichier = "1fichier.com" in req.url
@@ -1039,153 +1260,82 @@ class DownloadCore:
             if is_1fichier and not req.use_proxy:
                 # 1fichier local download (to work around the free-tier limit - max 1)
                 print(f"[DEBUG] 1fichier 로컬 다운로드 시작: {req_id}")
+                fichier_egress = egress_of(req.use_proxy)
 
-                # Run preparsing after checking the skip-parsing condition
+                # Run preparsing after checking the skip-parsing condition. A
+                # row that waited in the queue was already preparsed there, and
+                # this returns at once.
                 if not skip_parsing:
                     await self._perform_preparse(req, db)
                 else:
                     print(f"[LOG] 파일 정보 존재로 사전파싱 건너뜀: {req_id}")
 
-                # Apply the 1fichier local download concurrency limit
-                # Check whether to wait on the semaphore
-                fichier_egress = egress_of(req.use_proxy)
-                fichier_semaphore = self._fichier_sem(fichier_egress)
-                if fichier_semaphore._value == 0:  # The semaphore is already in use
-                    print(f"[DEBUG] 1fichier 로컬 다운로드 제한 도달, 순서 대기 중: {req_id}")
+                # Honor an active host backoff before touching 1fichier again
+                # (avoids cascading the same form-rejection across the queue).
+                await self._await_fichier_cooldown(req, db, fichier_egress)
+                await db_async.refresh(db, req)
+                if req.status == StatusEnum.stopped:
+                    print(f"[LOG] 1fichier 백오프 후 정지 상태, 시작 안 함: {req_id}")
+                    return
+
+                if skip_parsing:
+                    # File info is present, so skip parsing and start downloading immediately
                     await self.send_download_update(req_id, {
-                        "status": "pending",
-                        "message": f"다운로드 순서를 기다리는 중... (최대 {self.MAX_FICHIER_LOCAL_DOWNLOADS}개 동시 실행)"
+                        "status": "downloading",
+                        "message": "다운로드 시작 중..."
                     })
-                    # Update the status in the DB
-                    req.status = StatusEnum.pending
-                    await db_async.commit(db)
-
-                async with slot_without_session(db, fichier_semaphore):
-                    print(f"[DEBUG] 1fichier 로컬 다운로드 세마포어 획득: {req_id}")
-
-                    # The wait detached everything the session held, so the row
-                    # has to be read again before it can be used or written.
-                    req = await db_async.first(
-                        db.query(DownloadRequest).filter(DownloadRequest.id == req_id))
-                    if not req:
-                        return
-
-                    # Honor an active host backoff before touching 1fichier again
-                    # (avoids cascading the same form-rejection across the queue).
-                    await self._await_fichier_cooldown(req, db, fichier_egress)
-                    await db_async.refresh(db, req)
-                    if req.status == StatusEnum.stopped:
-                        print(f"[LOG] 1fichier 백오프 후 정지 상태, 시작 안 함: {req_id}")
-                        return
-
-                    if skip_parsing:
-                        # File info is present, so skip parsing and start downloading immediately
-                        await self.send_download_update(req_id, {
-                            "status": "downloading",
-                            "message": "다운로드 시작 중..."
-                        })
-                        req.status = StatusEnum.downloading
-                    else:
-                        # When parsing is required
-                        await self.send_download_update(req_id, {
-                            "status": "parsing",
-                            "message": "대기 완료, 1fichier 로컬 다운로드 시작 중..."
-                        })
-                        req.status = StatusEnum.parsing
-                    await db_async.commit(db)
+                    req.status = StatusEnum.downloading
+                else:
+                    # When parsing is required
+                    await self.send_download_update(req_id, {
+                        "status": "parsing",
+                        "message": "대기 완료, 1fichier 로컬 다운로드 시작 중..."
+                    })
+                    req.status = StatusEnum.parsing
+                await db_async.commit(db)
 
-                    await self._download_with_proxy_async(req, db, skip_preparse=skip_parsing)  # Depends on whether parsing is skipped
+                await self._download_with_proxy_async(req, db, skip_preparse=skip_parsing)  # Depends on whether parsing is skipped
 
-                    # Feed the result into the host backoff: a block/quota signal
-                    # extends the cooldown for the whole queue; a success resets it.
-                    await db_async.refresh(db, req)
-                    if req.status == StatusEnum.done:
-                        self._register_fichier_success(fichier_egress)
-                    elif getattr(req, "failure_kind", None) in (KIND_BLOCKED, KIND_RATE_LIMITED):
-                        self._register_fichier_block(fichier_egress)
-                    print(f"[DEBUG] 1fichier 로컬 다운로드 세마포어 해제: {req_id}")
+                # Feed the result into the host backoff: a block/quota signal
+                # extends the cooldown for the whole queue; a success resets it.
+                await db_async.refresh(db, req)
+                if req.status == StatusEnum.done:
+                    self._register_fichier_success(fichier_egress)
+                elif getattr(req, "failure_kind", None) in (KIND_BLOCKED, KIND_RATE_LIMITED):
+                    self._register_fichier_block(fichier_egress)
             else:
-                # General download (includes 1fichier proxy and plain URLs - max 5)
+                # General download (includes 1fichier proxy and plain URLs)
                 if is_1fichier:
                     download_type = "1fichier 프록시"
                 else:
                     download_type = "일반"
                 print(f"[DEBUG] {download_type} 다운로드 시작: {req_id}")
 
-                # Resolve the special-hoster name/size BEFORE queueing on the
-                # download slot, so a queued item shows its real filename instead
-                # of a stuck skeleton while it waits its turn.
+                # Resolve the special-hoster name/size if the queue did not
+                # already (a download that started without waiting).
                 if not skip_parsing:
                     await self._perform_special_preparse(req, db)
 
-                # Smart admission: every host gets its OWN queue, so several big
-                # files on one host never starve a small file on another host.
-                host_key, per_host_max = self._resolve_host_limit(req.original_url or req.url)
-                # Key by (host, egress): the hoster counts slots per IP, so the
-                # proxy egress gets its own queue instead of sharing this one.
-                slot_key = f"{host_key}@{egress_of(req.use_proxy)}"
-                host_semaphore = self._site_semaphores.get(slot_key)
-                if host_semaphore is None:
-                    host_semaphore = asyncio.Semaphore(per_host_max)
-                    self._site_semaphores[slot_key] = host_semaphore
-
-                # If either the host queue or the global ceiling is full, mark the
-                # download pending so the UI shows it is waiting its turn.
-                if host_semaphore._value == 0 or self.total_download_semaphore._value == 0:
-                    print(f"[DEBUG] {download_type} 다운로드 제한 도달, 순서 대기 중: {req_id}")
+                if skip_parsing:
+                    # File info is present, so skip parsing and start downloading immediately
                     await self.send_download_update(req_id, {
-                        "status": "pending",
-                        "message": (
-                            f"다운로드 순서를 기다리는 중... "
-                            f"(호스트당 {per_host_max}개 / 전체 {self.MAX_CONCURRENT_DOWNLOADS}개 동시 실행)"
-                        )
+                        "status": "downloading",
+                        "message": f"{download_type} 다운로드 시작 중..."
                     })
-                    # Update the status in the DB
-                    req.status = StatusEnum.pending
-                    await db_async.commit(db)
-
-                # Acquire the host slot FIRST, then the global ceiling. A task
-                # waiting on the global cap holds only its own host slot, so it can
-                # never block a different host from starting.
-                async with slot_without_session(
-                    db, host_semaphore, self.total_download_semaphore
-                ):
-                    print(f"[DEBUG] {download_type} 다운로드 세마포어 획득: {req_id}")
-
-                    # The wait detached everything the session held, so the
-                    # row has to be read again before it can be used.
-                    req = await db_async.first(
-                        db.query(DownloadRequest).filter(DownloadRequest.id == req_id))
-                    if not req:
-                        return
-                    if req.status == StatusEnum.stopped:
-                        # Stopped while it sat in the queue. The 1fichier
-                        # branch already refused to start in this case; this
-                        # one used to start anyway.
-                        print(f"[LOG] 대기 중 정지됨, 시작 안 함: {req_id}")
-                        return
-
-                    if skip_parsing:
-                        # File info is present, so skip parsing and start downloading immediately
-                        await self.send_download_update(req_id, {
-                            "status": "downloading",
-                            "message": f"{download_type} 다운로드 시작 중..."
-                        })
-                        req.status = StatusEnum.downloading
-                    else:
-                        # When parsing is required
-                        await self.send_download_update(req_id, {
-                            "status": "parsing",
-                            "message": f"대기 완료, {download_type} 다운로드 시작 중..."
-                        })
-                        req.status = StatusEnum.parsing
-                    await db_async.commit(db)
+                    req.status = StatusEnum.downloading
+                else:
+                    # When parsing is required
+                    await self.send_download_update(req_id, {
+                        "status": "parsing",
+                        "message": f"대기 완료, {download_type} 다운로드 시작 중..."
+                    })
+                    req.status = StatusEnum.parsing
+                await db_async.commit(db)
 
-                    if is_1fichier:
-                        await self._download_with_proxy_async(req, db, skip_preparse=skip_parsing)  # 1fichier proxy download
-                    else:
-                        await self._download_local_async(req, db)  # Plain URL download
-                    print(f"[DEBUG] {download_type} 다운로드 세마포어 해제: {req_id}")
+                if is_1fichier:
+                    await self._download_with_proxy_async(req, db, skip_preparse=skip_parsing)  # 1fichier proxy download
+                else:
+                    await self._download_local_async(req, db)  # Plain URL download
 
         except asyncio.CancelledError:
             # Download cancelled
@@ -1214,6 +1364,19 @@ class DownloadCore:
                     "attempt_count": verdict.attempt_count,
                 })
         finally:
+            # Whatever the transfer marked last goes to the row now, not on
+            # the next writer tick.
+            try:
+                await progress_writer.flush([req_id])
+            except Exception as e:
+                print(f"[WARNING] 진행률 최종 기록 실패: {e}")
+            # A 429 or a block here says the slot is set too wide.
+            slot_key = self.scheduler.slot_of(req_id)
+            if slot_key:
+                try:
+                    await self._feed_adaptive_limit(req_id, slot_key, db)
+                except Exception as e:
+                    print(f"[WARNING] 동시 다운로드 학습 갱신 실패: {e}")
             db.close()
 
     async def _download_with_proxy_async(self, req: DownloadRequest, db: Session, skip_preparse: bool = False):
@@ -1720,8 +1883,16 @@ class DownloadCore:
         response,
         initial_size: int,
         download_mode: str,
+        session=None,
+        url: Optional[str] = None,
+        headers: Optional[dict] = None,
+        proxy=None,
     ):
-        """After receiving a 200/206 response, read the body and run completion handling."""
+        """After receiving a 200/206 response, read the body and run completion handling.
+
+        ``session``/``url``/``headers``/``proxy`` are the context the response
+        was fetched in; given them, a range-capable host is fetched in segments.
+        """
         # Prefer the server-provided filename (Content-Disposition) when ours is
         # missing, a placeholder, or a bare file code without an extension. Only
         # when nothing has been written yet (initial_size == 0) so resume isn't broken.
@@ -1766,8 +1937,8 @@ class DownloadCore:
 
         # Actual file download
         print(f"[DEBUG] 파일 다운로드 시작 - 초기크기: {initial_size}, 총크기: {req.total_size}")
-        downloaded_size = await download_file_content(
-            response, req.save_path, initial_size, req.total_size, req, db
+        downloaded_size = await self._transfer_body(
+            req, db, response, initial_size, session, url, headers, proxy
         )
         print(f"[DEBUG] 파일 다운로드 완료 - 최종크기: {downloaded_size}")
 
@@ -1779,6 +1950,90 @@ class DownloadCore:
 
         await self._finalize_completed_file(req, db, downloaded_size, download_mode)
 
+    def _segments_for(self, req: DownloadRequest, response, initial_size: int) -> int:
+        """Segments to fetch this body in, or 1 for a plain single stream.
+
+        Splitting needs three things: a host allowed more than one connection, a
+        known length with enough left to be worth it, and a server that says it
+        serves ranges — a ``206`` to our resume, or ``Accept-Ranges: bytes``.
+        A server that claims ranges and then ignores them is caught by the first
+        segment request and dropped back to one stream there.
+        """
+        count = segment_count_for_host(req.original_url or req.url)
+        total = req.total_size or 0
+        if count <= 1 or total - initial_size < 2 * MIN_SEGMENT_BYTES:
+            return 1
+        accepts = (response.headers.get("Accept-Ranges") or "").strip().lower()
+        if response.status != 206 and accepts != "bytes":
+            return 1
+        return count
+
+    async def _reserve_disk_space(self, req: DownloadRequest) -> bool:
+        """Reserve the rest of ``req``'s file in ``core.disk_reserve``.
+
+        True when it fits, or when the size is not known yet — then the
+        transfer asks again once the response has told it.
+        """
+        if not req.total_size or req.total_size <= 0:
+            return True
+        directory = os.path.dirname(req.save_path) if req.save_path else get_download_path()
+        return await asyncio.to_thread(
+            disk_reserve.reserve_remaining, req.id, req.total_size, req.save_path, directory
+        )
+
+    @staticmethod
+    def _disk_full_message() -> str:
+        translations = get_translations(get_config().get("language", "ko"))
+        return translations.get("disk_full_error", "디스크 용량이 부족합니다. 저장 공간을 확보한 후 다시 시도해주세요.")
+
+    async def _refuse_for_disk_space(self, req: DownloadRequest, db: Session) -> None:
+        """Fail a download that was refused admission for lack of space.
+
+        Failed, not pending: the pending sweep would otherwise pick it straight
+        back up every time another download finished.
+        """
+        message = self._disk_full_message()
+        print(f"[LOG] 디스크 여유 공간 부족으로 시작 거부: {req.id} ({req.total_size} bytes)")
+        verdict = apply_failure_to_request(req, "다운로드", message)
+        req.status = StatusEnum.failed
+        await db_async.commit(db)
+        await self.send_download_update(req.id, {
+            "status": "failed",
+            "message": verdict.user_message,
+            "stage": "다운로드",
+            "raw_error": message,
+            "failure_kind": verdict.kind,
+        })
+
+    async def _transfer_body(self, req, db, response, initial_size, session=None,
+                             url=None, headers=None, proxy=None) -> int:
+        """Write the response body into ``req.save_path``; returns bytes on disk."""
+        # The size may only be known now, from this response.
+        if not await self._reserve_disk_space(req):
+            raise Exception(self._disk_full_message())
+        count = self._segments_for(req, response, initial_size) if session is not None else 1
+        if count > 1:
+            def fetch_range(range_header):
+                return session.get(url, headers={**headers, "Range": range_header}, proxy=proxy)
+
+            downloaded = await download_segmented_content(
+                response, fetch_range, req.save_path, initial_size,
+                req.total_size, count, req, db,
+            )
+        else:
+            # One stream appends from the prefix, so whatever an earlier
+            # segmented attempt wrote ahead of it has to go first.
+            await asyncio.to_thread(collapse_to_prefix, req.save_path, initial_size)
+            downloaded = await download_file_content(
+                response, req.save_path, initial_size, req.total_size, req, db
+            )
+        if cancel_signal.is_cancelled(req.id):
+            # The loop stopped on the signal and handed back a partial size.
+            # Unwind the way stop_download_async's task.cancel() does, instead
+            # of letting the callers judge a half file as truncated or done.
+            raise asyncio.CancelledError()
+        return downloaded
+
     async def _probe_line_block(self, url: str) -> str:
         """Ask :80 what intercepted :443, or return "" if nothing did.
 
@@ -1791,7 +2046,7 @@ class DownloadCore:
         plain = urlunparse(("http", parts.hostname or "", parts.path, "", "", ""))
         timeout = aiohttp.ClientTimeout(total=_BLOCK_PROBE_TIMEOUT_SEC)
         try:
-            async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with http_sessions.session(timeout=timeout) as session:
                 async with session.get(plain, allow_redirects=False) as response:
                     preview = await response.content.read(_BLOCK_PAGE_SNIFF_BYTES)
         except Exception as probe_error:
@@ -1904,6 +2159,43 @@ class DownloadCore:
         os.remove(req.save_path)
         return False
 
+    async def _move_part_into_place(self, req: DownloadRequest) -> None:
+        """Rename the finished ``.part`` to its final name, off the event loop.
+
+        A rename when both paths are on one device; otherwise a chunked copy in
+        a worker thread that reports progress as "finalizing". Raises when the
+        move fails — the ``.part`` is left intact and the download must not be
+        marked done with a file that is not where the UI says it is.
+        """
+        discard_segment_map(req.save_path)
+        final_path = get_final_file_path(req.save_path)
+        if req.save_path == final_path:
+            return
+
+        loop = asyncio.get_running_loop()
+        last_sent = [0.0]
+
+        def progress(copied: int, total: int):
+            # Called from the worker thread, once per chunk.
+            now = time.monotonic()
+            if copied < total and now - last_sent[0] < 1.0:
+                return
+            last_sent[0] = now
+            pct = round(copied / total * 100, 1) if total else 100
+            asyncio.run_coroutine_threadsafe(self.send_download_update(req.id, {
+                "status": "downloading",
+                "progress": 100,
+                "finalizing": pct,
+                "message": f"최종 위치로 이동 중... {pct}%",
+            }), loop)
+
+        try:
+            how = await asyncio.to_thread(move_into_place, req.save_path, final_path, progress)
+        except Exception as move_error:
+            raise Exception(f"완료 파일 이동 실패: {move_error}") from move_error
+        print(f"[DEBUG] 파일 리네임({how}): {req.save_path} -> {final_path}")
+        req.save_path = final_path
+
     async def _finalize_completed_file(
         self,
         req: DownloadRequest,
@@ -1917,18 +2209,10 @@ class DownloadCore:
         reaches the same end state without a response body to read: the file was
         already on disk in full, only the bookkeeping was missing.
         """
-        # Rename .part → final file name
-        final_path = get_final_file_path(req.save_path)
-        if req.save_path != final_path:
-            try:
-                shutil.move(req.save_path, final_path)
-                print(f"[DEBUG] 파일 리네임: {req.save_path} -> {final_path}")
-                req.save_path = final_path
-                await db_async.commit(db)
-            except Exception as rename_error:
-                print(f"[WARNING] 파일 리네임 실패: {rename_error}")
+        # Rename .part → final file name; done is only written after it.
+        await self._move_part_into_place(req)
 
-        # Completion handling
+        # Completion handling (the new path is committed together with done)
         print(f"[LOG] 다운로드 완료 처리 시작: {req.id}")
         req.status = StatusEnum.done
         req.downloaded_size = downloaded_size
@@ -2077,13 +2361,14 @@ class DownloadCore:
 
             while True:
                 try:
-                    async with aiohttp.ClientSession(timeout=timeout, cookies=current_cookies) as session:
+                    async with http_sessions.session(timeout=timeout, cookies=current_cookies) as session:
                         headers = build_download_headers(user_agent=current_ua, referer=current_referer)
                         initial_size = 0
 
-                        # Check for an existing file (resume support)
-                        if os.path.exists(req.save_path):
-                            initial_size = os.path.getsize(req.save_path)
+                        # Check for an existing file (resume support). A
+                        # segmented .part resumes from its contiguous prefix.
+                        initial_size = resume_offset(req.save_path)
+                        if initial_size > 0:
                             headers['Range'] = f'bytes={initial_size}-'
                             print(f"[DEBUG] 이어받기: {initial_size} bytes")
 
@@ -2138,6 +2423,7 @@ class DownloadCore:
                             await self._consume_response_and_finish(
                                 req, db, response, initial_size,
                                 download_mode="proxy" if req.use_proxy else "local",
+                                session=session, url=current_url, headers=headers,
                             )
                             return  # Exit immediately on success
                 except Exception as e:
@@ -2374,7 +2660,6 @@ class DownloadCore:
 
                 try:
                     # Proxy setup
-                    connector = None
                     if req.use_proxy and proxy_addr:
                         print(f"[LOG] 다운로드 프록시 시도 {retry_count + 1}: {proxy_addr}")
 
@@ -2394,21 +2679,22 @@ class DownloadCore:
                             total_failed_count = await proxy_manager.get_total_failed_count(db)
                             print(f"[LOG] SSE 다운로드시도 스킵: {retry_count + 1}/{total_proxies} (실패: {total_failed_count})")
 
-                        connector = aiohttp.TCPConnector()
-
                     proxy_url = f"http://{proxy_addr}" if req.use_proxy and proxy_addr else None
                     session_cookies = cookies or {}
-                    async with aiohttp.ClientSession(
+                    # Pooled per egress: a retry through the same proxy reuses
+                    # its warm connection instead of handshaking again.
+                    async with http_sessions.session(
+                        proxy_addr if proxy_url else None,
                         timeout=timeout,
-                        connector=connector,
                         cookies=session_cookies,
                     ) as session:
                             headers = build_download_headers(user_agent=user_agent, referer=referer)
                             initial_size = 0
 
-                            # Check for an existing file (resume support)
-                            if os.path.exists(req.save_path):
-                                initial_size = os.path.getsize(req.save_path)
+                            # Check for an existing file (resume support). A
+                            # segmented .part resumes from its contiguous prefix.
+                            initial_size = resume_offset(req.save_path)
+                            if initial_size > 0:
                                 headers['Range'] = f'bytes={initial_size}-'
                                 print(f"[DEBUG] 이어받기: {initial_size} bytes")
 
@@ -2456,8 +2742,9 @@ class DownloadCore:
 
                                 # Actual file download
                                 print(f"[DEBUG] 파일 다운로드 시작 - 초기크기: {initial_size}, 총크기: {req.total_size}")
-                                downloaded_size = await download_file_content(
-                                    response, req.save_path, initial_size, req.total_size, req, db
+                                downloaded_size = await self._transfer_body(
+                                    req, db, response, initial_size,
+                                    session, actual_url, headers, proxy_url,
                                 )
                                 print(f"[DEBUG] 파일 다운로드 완료 - 최종크기: {downloaded_size}")
 
@@ -2468,15 +2755,7 @@ class DownloadCore:
                                 )
 
                                 # Rename the .part file to the final file name
-                                final_path = get_final_file_path(req.save_path)
-                                if req.save_path != final_path:
-                                    try:
-                                        shutil.move(req.save_path, final_path)
-                                        print(f"[DEBUG] 파일 리네임: {req.save_path} -> {final_path}")
-                                        req.save_path = final_path
-                                        await db_async.commit(db)  # Commit the file path change immediately
-                                    except Exception as rename_error:
-                                        print(f"[WARNING] 파일 리네임 실패: {rename_error}")
+                                await self._move_part_into_place(req)
 
                                 # Completion handling
                                 print(f"[LOG] 다운로드 완료 처리 시작: {req.id}")
@@ -2869,9 +3148,8 @@ class DownloadCore:
         await db_async.commit(db)
 
         try:
-            file_id, key = parse_mega_url(req.url)
-            async with aiohttp.ClientSession() as session:
-                info = await fetch_mega_file_info(session, file_id, key)
+            async with http_sessions.session() as session:
+                info = await resolve_mega_file(session, req.url)
 
                 # MEGA's decrypted attributes are the authoritative name — apply
                 # unconditionally. (The URL alone only yields a host/id
@@ -2898,33 +3176,31 @@ class DownloadCore:
                     "status": "downloading", "progress": 0, "message": "MEGA 다운로드 중..."
                 })
 
-                # Throttled progress: keep downloaded_size live, push SSE ~1/s.
-                last_sse = [0.0]
+                # Keep downloaded_size live; the progress_batch ticker sends it.
+                # A refused resume restarts at 0, so this is a new attempt.
+                progress_writer.begin(req.id)
+                last_mark = [time.time(), 0]
 
                 def progress_cb(downloaded: int, total: int):
                     req.downloaded_size = downloaded
+                    progress_writer.mark(req.id, downloaded)
                     now = time.time()
-                    if now - last_sse[0] >= 1.0 or downloaded >= total:
-                        last_sse[0] = now
-                        pct = round(downloaded / total * 100, 1) if total else 0
-                        asyncio.create_task(self.send_download_update(
-                            req.id, {"status": "downloading", "progress": pct}
-                        ))
+                    elapsed = now - last_mark[0]
+                    if elapsed >= live_progress.interval() or downloaded >= total:
+                        speed = (downloaded - last_mark[1]) / elapsed if elapsed > 0 else 0
+                        last_mark[0], last_mark[1] = now, downloaded
+                        live_progress.record_progress(req.id, downloaded, total, speed)
 
                 written = await download_mega_file(
                     session, info, req.save_path,
                     progress_cb=progress_cb,
                     is_cancelled=lambda: cancel_signal.is_cancelled(req.id),
+                    download_id=req.id,
+                    connections=segment_count_for_host(req.url),
                 )
 
             # Rename .part → final name
-            final_path = get_final_file_path(req.save_path)
-            if req.save_path != final_path:
-                try:
-                    shutil.move(req.save_path, final_path)
-                    req.save_path = final_path
-                except Exception as rename_error:
-                    print(f"[WARNING] MEGA 파일 리네임 실패: {rename_error}")
+            await self._move_part_into_place(req)
 
             req.status = StatusEnum.done
             req.downloaded_size = written
@@ -2971,6 +3247,8 @@ class DownloadCore:
             # 0. Set the cancel signal immediately — the 1fichier countdown/wait
             #    loop wakes up without DB polling.
             cancel_signal.signal_cancel(req_id)
+            # A queued one has no task yet — it just leaves the queue.
+            self.scheduler.discard(req_id)
 
             # 1. Cancel the running task immediately
             task_cancelled = False
@@ -3088,7 +3366,7 @@ class DownloadCore:
             # Try extracting the file name from the Content-Disposition header
             try:
                 timeout = aiohttp.ClientTimeout(total=30, connect=10)
-                async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with http_sessions.session(timeout=timeout) as session:
                     async with session.head(req.url) as response:
                         if response.status == 200:
                             content_disposition = response.headers.get('Content-Disposition', '')
@@ -3125,6 +3403,8 @@ class DownloadCore:
         """Task cleanup"""
         # Clear the cancel signal too, to prevent in-memory leaks.
         cancel_signal.clear(req_id)
+        # Whatever it did not write, it no longer needs.
+        disk_reserve.release(req_id)
         # Drop the live speed reading. A stale one is worse than none: the grid
         # would keep advertising throughput for a download that has stopped.
         live_progress.clear(req_id)
@@ -3133,39 +3413,35 @@ class DownloadCore:
         # Free this download's proxy-rotation index so the dict can't grow forever.
         proxy_manager.release_download(req_id)
         print(f"[LOG] 다운로드 태스크 정리: {req_id}")
+        # Frees the slot and starts whatever is next in its queue.
+        self.scheduler.finished(req_id)
 
-        # Always try to start the next pending download. A slot frees up whether
-        # this one completed, failed, or was *stopped* — and the sweep only starts
-        # rows still in 'pending' state, so the just-finished/stopped download is
-        # never itself restarted here. (Previously a stop returned early and left
-        # other queued downloads stranded until an unrelated download finished.)
+        # Also sweep for pending rows that are not in the queue at all (a
+        # retry or a restart that lost its entry). The sweep only starts rows
+        # still in 'pending' state, so the just-finished/stopped download is
+        # never itself restarted here.
         asyncio.create_task(self._delayed_start_next_pending())
 
     async def _delayed_start_next_pending(self):
-        """Start a pending download after a delay for the semaphore to release"""
+        """Sweep for pending rows missing from the queue, after a short delay"""
         try:
-            # Wait briefly for the semaphore to release (waiting for the async with block to exit)
+            # Let the stop/finish handler commit the row first.
             await asyncio.sleep(0.5)
-            print(f"[DEBUG] 세마포어 해제 대기 완료, 자동 시작 체크")
 
-            # Log the current semaphore state
-            fichier_state = {k: v._value for k, v in self._fichier_semaphores.items()} or "미사용"
-            print(f"[DEBUG] 현재 세마포어 상태 - 1fichier(출구별): {fichier_state}, 전체: {self.total_download_semaphore._value}")
+            queue = self.scheduler.snapshot()
+            print(f"[DEBUG] 대기열 상태 - 실행 {queue['running']}개 / 대기 {queue['queued']}개 (전체 {queue['ceiling']}개)")
 
             await self._start_next_pending_download()
         except Exception as e:
             print(f"[ERROR] 지연된 자동 시작 실패: {e}")
 
     async def _start_next_pending_download(self):
-        """(Re)launch pending downloads that have no live task.
-
-        Each download task queues itself on the correct semaphore (per-site or
-        the shared general/1fichier one), so a freed slot is picked up by an
-        already-parked task automatically. This sweep only needs to relaunch
-        pendings that lost their task (e.g. after a server restart); ones still
-        parked on a semaphore are skipped to avoid duplicate tasks. We therefore
-        do NOT gate on semaphore values here — that old check used the wrong
-        (general) semaphore for per-site hosts and left pendings unstarted."""
+        """(Re)queue pending downloads that have neither a live task nor an entry.
+
+        A freed slot is handed to the next queued entry by the scheduler
+        itself, so this sweep only needs to pick up pendings that are in
+        neither place (e.g. after a server restart). start_download_async
+        queues them; it never starts more than the slots allow."""
         try:
             db = SessionLocal()
 
@@ -3180,10 +3456,12 @@ class DownloadCore:
 
             started_count = 0
             for req in pending_downloads:
-                # Skip ones already parked on a semaphore (live task present).
+                # Skip ones already running or waiting in the queue.
                 existing = self.download_tasks.get(req.id)
                 if existing is not None and not existing.done():
                     continue
+                if self.scheduler.is_queued(req.id):
+                    continue
                 success = await self.start_download_async(req, db)
                 if success:
                     started_count += 1
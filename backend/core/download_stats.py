@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Running totals behind ``/api/history/stats``.
+
+The stats endpoint grouped the whole history twice — once by status, once by
+day — and the tab badges call it after every SSE status update, so those two
+scans ran while downloads were writing, over and over, to report totals that
+had moved by one row.
+
+``download_daily_stats`` holds those totals already grouped: one row per
+(day requested, status, proxy or local) with a count and the summed
+``total_size``. Triggers on ``download_requests`` adjust it in the same
+transaction as the write that changed them:
+
+* an insert adds the new row to its bucket, a delete takes it out;
+* an update touching status, total_size, use_proxy or requested_at moves the
+  row from its old bucket to its new one. Other updates — progress above all —
+  never fire it.
+
+The endpoint then sums a few hundred small rows for any period. The
+``(day, status)`` buckets keep period filtering exact, since the period is
+whole days of ``requested_at``.
+
+Triggers see every write, the ORM's and raw SQL alike, so nothing can forget
+to call them. Should the table still drift (a restore from an old backup, a
+manual edit), :func:`rebuild` recomputes it from the rows; it is what schema
+step 3 runs and what ``POST /api/history/stats/rebuild`` calls. A database
+without the triggers is summed straight from ``download_requests``, as before.
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+from sqlalchemy import text
+
+TABLE = "download_daily_stats"
+
+# A row's bucket. NULLs become '' / 0: they are key columns.
+_DAY = "COALESCE(date({r}.requested_at), '')"
+_STATUS = "COALESCE({r}.status, '')"
+_PROXY = "COALESCE({r}.use_proxy, 0)"
+_BYTES = "COALESCE({r}.total_size, 0)"
+
+
+def _add(r: str) -> str:
+    return (
+        f"INSERT INTO {TABLE} (day, status, use_proxy, count, bytes) "
+        f"VALUES ({_DAY.format(r=r)}, {_STATUS.format(r=r)}, {_PROXY.format(r=r)}, 1, {_BYTES.format(r=r)}) "
+        "ON CONFLICT (day, status, use_proxy) DO UPDATE SET "
+        "count = count + 1, bytes = bytes + excluded.bytes; "
+    )
+
+
+def _remove(r: str) -> str:
+    bucket = (f"day = {_DAY.format(r=r)} AND status = {_STATUS.format(r=r)} "
+              f"AND use_proxy = {_PROXY.format(r=r)}")
+    return (
+        f"UPDATE {TABLE} SET count = count - 1, bytes = bytes - {_BYTES.format(r=r)} "
+        f"WHERE {bucket}; "
+        f"DELETE FROM {TABLE} WHERE {bucket} AND count <= 0; "
+    )
+
+
+_TRIGGERS = (
+    f"CREATE TRIGGER IF NOT EXISTS {TABLE}_ai AFTER INSERT ON download_requests "
+    f"BEGIN {_add('new')}END",
+    f"CREATE TRIGGER IF NOT EXISTS {TABLE}_ad AFTER DELETE ON download_requests "
+    f"BEGIN {_remove('old')}END",
+    f"CREATE TRIGGER IF NOT EXISTS {TABLE}_au "
+    "AFTER UPDATE OF status, total_size, use_proxy, requested_at ON download_requests "
+    "WHEN old.status IS NOT new.status OR old.total_size IS NOT new.total_size "
+    "OR old.use_proxy IS NOT new.use_proxy OR old.requested_at IS NOT new.requested_at "
+    f"BEGIN {_remove('old')}{_add('new')}END",
+)
+
+# The same buckets, computed from the rows.
+_GROUPED = (
+    f"SELECT {_DAY.format(r='d')} AS day, {_STATUS.format(r='d')} AS status, "
+    f"{_PROXY.format(r='d')} AS use_proxy, COUNT(*) AS count, SUM({_BYTES.format(r='d')}) AS bytes "
+    "FROM download_requests AS d GROUP BY 1, 2, 3"
+)
+
+# Databases (by URL) known to have the triggers.
+_ready = set()
+
+
+def install(conn) -> None:
+    """Create the triggers and fill the table from the current rows."""
+    for statement in _TRIGGERS:
+        conn.execute(text(statement))
+    rebuild(conn)
+
+
+def rebuild(conn) -> int:
+    """Recompute every bucket from ``download_requests``; returns the bucket count."""
+    conn.execute(text(f"DELETE FROM {TABLE}"))
+    conn.execute(text(f"INSERT INTO {TABLE} (day, status, use_proxy, count, bytes) {_GROUPED}"))
+    return int(conn.execute(text(f"SELECT COUNT(*) FROM {TABLE}")).scalar() or 0)
+
+
+def ready(conn) -> bool:
+    """Whether this database keeps the table up to date. Only a yes is remembered."""
+    key = str(conn.engine.url)
+    if key not in _ready and conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = :name"
+    ), {"name": f"{TABLE}_au"}).first() is not None:
+        _ready.add(key)
+    return key in _ready
+
+
+def summary(conn, start_day: Optional[str] = None, end_day: Optional[str] = None) -> dict:
+    """Totals for requests made between two days (ISO dates, both inclusive).
+
+    ``by_status`` rows are ``(status, use_proxy, count, bytes)``; ``by_day``
+    rows are ``(day, count, bytes)`` in date order.
+    """
+    source = TABLE if ready(conn) else f"({_GROUPED})"
+    where, params = [], {}
+    if start_day or end_day:
+        # A row with no requested_at has no day, so no period includes it.
+        where.append("day != ''")
+    if start_day:
+        where.append("day >= :start_day")
+        params["start_day"] = start_day
+    if end_day:
+        where.append("day <= :end_day")
+        params["end_day"] = end_day
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+    by_status = conn.execute(text(
+        f"SELECT status, use_proxy, SUM(count), SUM(bytes) FROM {source} AS s "
+        f"{where_sql} GROUP BY status, use_proxy"
+    ), params).all()
+    day_filter = f"{where_sql} AND day != ''" if where_sql else "WHERE day != ''"
+    by_day = conn.execute(text(
+        f"SELECT day, SUM(count), SUM(bytes) FROM {source} AS s "
+        f"{day_filter} GROUP BY day ORDER BY day"
+    ), params).all()
+    return {"by_status": by_status, "by_day": by_day}
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""Connection pools shared by every download, one per egress.
+
+Each attempt in the download paths used to open its own
+``aiohttp.ClientSession`` — and with it its own ``TCPConnector``. Every retry,
+re-parse and length probe therefore paid a DNS lookup, a TCP handshake and a
+TLS handshake to a host it had spoken to a second earlier, and then threw the
+warm connection away.
+
+The pool lives in the connector, so that is what is shared here: one
+``TCPConnector`` per egress — ``"direct"`` or a proxy address — with a TTL'd
+DNS cache, keep-alive and a single ``SSLContext`` (the CA store is loaded once,
+not per session). :func:`session` wraps the shared connector in a cheap,
+per-download ``ClientSession`` that does *not* own it. Cookies belong to that
+session, so one download's hoster cookies never ride along with another's, and
+closing it returns the connections to the pool instead of closing them.
+
+Connectors are bound to the loop that made them; a new loop (a test, a
+restart of the loop) simply gets new ones. :func:`close_all` runs at shutdown.
+
+Proxy lists run to thousands of addresses and rotate, so proxy pools do not
+live forever. A proxy marked failed has its pool dropped (:func:`discard`),
+and at most ``MAX_PROXY_POOLS`` are kept, least recently used first out. A
+pool is only closed once no download holds a connection from it; until then
+it waits in ``_retiring`` and is closed on a later call.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import ssl
+from collections import OrderedDict
+from typing import List, Optional
+
+import aiohttp
+
+EGRESS_DIRECT = "direct"
+
+# Total sockets per egress, and per (host, port). The scheduler already caps
+# downloads; these only need to fit a full set of segmented downloads.
+POOL_LIMIT = 128
+POOL_LIMIT_PER_HOST = 32
+
+DNS_CACHE_TTL_SEC = 300
+KEEPALIVE_TIMEOUT_SEC = 30
+
+# Proxy pools kept open at once; the direct pool is never evicted.
+MAX_PROXY_POOLS = 16
+
+_connectors: "OrderedDict[str, aiohttp.TCPConnector]" = OrderedDict()
+_retiring: List[aiohttp.TCPConnector] = []
+# close() tasks, held until done (the loop keeps only a weak reference).
+_closing: set = set()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_ssl_context: Optional[ssl.SSLContext] = None
+
+
+def egress_key(proxy_addr: Optional[str]) -> str:
+    """The pool a request belongs to: direct, or one per proxy address."""
+    return proxy_addr or EGRESS_DIRECT
+
+
+def _shared_ssl_context() -> ssl.SSLContext:
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+def connector(egress: str = EGRESS_DIRECT) -> aiohttp.TCPConnector:
+    """The shared connector for ``egress``, created on first use."""
+    global _loop
+    loop = asyncio.get_running_loop()
+    if loop is not _loop:
+        # Connectors from another loop cannot be used (or closed) here.
+        _connectors.clear()
+        _retiring.clear()
+        _loop = loop
+    conn = _connectors.get(egress)
+    if conn is not None:
+        _connectors.move_to_end(egress)
+    if conn is None or conn.closed:
+        conn = aiohttp.TCPConnector(
+            limit=POOL_LIMIT,
+            limit_per_host=POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=DNS_CACHE_TTL_SEC,
+            use_dns_cache=True,
+            keepalive_timeout=KEEPALIVE_TIMEOUT_SEC,
+            enable_cleanup_closed=True,
+            ssl=_shared_ssl_context(),
+        )
+        _connectors[egress] = conn
+    _trim()
+    return conn
+
+
+def _in_use(conn: aiohttp.TCPConnector) -> bool:
+    """Whether a live session still holds one of the pool's connections."""
+    return bool(getattr(conn, "_acquired", None))
+
+
+def _close_later(conn: aiohttp.TCPConnector) -> None:
+    if conn.closed:
+        return
+    if _in_use(conn):
+        _retiring.append(conn)
+    else:
+        task = asyncio.get_running_loop().create_task(conn.close())
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+
+
+def _trim() -> None:
+    """Close retired pools that went idle, and evict past MAX_PROXY_POOLS."""
+    for conn in list(_retiring):
+        if conn.closed or not _in_use(conn):
+            _retiring.remove(conn)
+            _close_later(conn)
+    proxies = [key for key in _connectors if key != EGRESS_DIRECT]
+    for key in proxies[:max(0, len(proxies) - MAX_PROXY_POOLS)]:
+        _close_later(_connectors.pop(key))
+
+
+def discard(proxy_addr: Optional[str]) -> None:
+    """Drop a proxy's pool — it failed or left the rotation. Loop only."""
+    if not proxy_addr:
+        return
+    conn = _connectors.pop(egress_key(proxy_addr), None)
+    if conn is not None:
+        _close_later(conn)
+    _trim()
+
+
+def session(proxy_addr: Optional[str] = None, **kwargs) -> aiohttp.ClientSession:
+    """A per-download session on the shared pool for this egress.
+
+    Use it like any ``ClientSession`` (``async with``); keyword arguments such
+    as ``timeout`` and ``cookies`` are passed through. The proxy is still given
+    per request — the address here only picks the pool.
+    """
+    return aiohttp.ClientSession(
+        connector=connector(egress_key(proxy_addr)),
+        connector_owner=False,
+        **kwargs,
+    )
+
+
+async def close_all() -> None:
+    """Close every pooled connection; called from the app's shutdown."""
+    conns = list(_connectors.values()) + _retiring
+    _connectors.clear()
+    _retiring.clear()
+    for conn in conns:
+        try:
+            await conn.close()
+        except Exception as e:
+            print(f"[WARNING] HTTP 연결 풀 종료 실패: {e}")
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""A concurrency limit whose capacity can change while it is in use.
+
+Settings used to be applied by swapping in a fresh ``asyncio.Semaphore`` and
+clearing the per-host ones. Whatever was already waiting on the old objects
+never saw the new number, and code that wanted to know how full a slot was had
+to read the semaphore's private ``_value``.
+
+:class:`ResizableLimiter` keeps the count itself. :meth:`resize` changes the
+capacity in place: raising it hands the new places to waiters at once, and
+lowering it below what is held simply stops new grants until enough holders
+have released — a running download is never taken back. ``holders``,
+``waiters`` and ``capacity`` are public for diagnostics.
+
+Not thread-safe: like ``asyncio.Semaphore``, it belongs to the event loop.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from typing import Deque
+
+
+class ResizableLimiter:
+    """A counting limit with runtime ``resize`` and FIFO waiters."""
+
+    def __init__(self, capacity: int, name: str = ""):
+        self.name = name
+        self._capacity = max(0, int(capacity))
+        self._holders = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def holders(self) -> int:
+        return self._holders
+
+    @property
+    def waiters(self) -> int:
+        return sum(1 for w in self._waiters if not w.done())
+
+    @property
+    def available(self) -> int:
+        """Places free right now; 0 while a lowered limit is still draining."""
+        return max(0, self._capacity - self._holders)
+
+    def try_acquire(self) -> bool:
+        """Take a place if one is free and nobody is queued ahead."""
+        if self.available and not self.waiters:
+            self._holders += 1
+            return True
+        return False
+
+    async def acquire(self) -> None:
+        if self.try_acquire():
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted in the same tick it was cancelled: give it back.
+                self.release()
+            raise
+
+    def release(self) -> None:
+        if self._holders <= 0:
+            raise ValueError(f"limiter {self.name or id(self)} released more than acquired")
+        self._holders -= 1
+        self._wake()
+
+    def resize(self, capacity: int) -> None:
+        """Change the capacity now; new places go straight to waiters."""
+        self._capacity = max(0, int(capacity))
+        self._wake()
+
+    def stats(self) -> dict:
+        return {"capacity": self._capacity, "holders": self._holders, "waiters": self.waiters}
+
+    def _wake(self) -> None:
+        # The place is handed over here, not re-contended when the waiter
+        # runs, so a try_acquire in between cannot take it.
+        while self._waiters and self._holders < self._capacity:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self._holders += 1
+            waiter.set_result(None)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+        return False
+
+    def __repr__(self) -> str:
+        return (f"<ResizableLimiter {self.name!r} {self._holders}/{self._capacity}"
+                f" waiters={self.waiters}>")
@@ -10,18 +10,51 @@ download showed a blank speed column most of the time.
 Speed is a live reading, not history: it is meaningless a minute later and has
 no business in the database. It lives here instead, keyed by download id, and
 the list endpoints read from it so a refetch keeps what the stream established.
+
+Progress lives here too. Every transfer used to schedule its own
+``status_update`` broadcast task on its own timer, each one encoded once per
+open tab. Now a transfer only records (downloaded, total, speed) with
+:func:`record_progress`, and one ticker in the download service takes what
+changed since the last tick with :func:`take_changed` and sends it as a single
+``progress_batch`` frame every :func:`interval` seconds. A row that has not
+moved since it was last sent is not sent again.
 """
 
 from __future__ import annotations
 
 import threading
-from typing import Dict
+from typing import Dict, List, Tuple
+
+# Cadence of the progress_batch frame; "progress_interval_sec" in settings.
+DEFAULT_INTERVAL_SEC = 1.0
+MIN_INTERVAL_SEC = 0.25
+MAX_INTERVAL_SEC = 30.0
 
 
 # Written from the transfer loop (worker threads / the event loop) and read by
 # request handlers, so it is guarded.
 _lock = threading.Lock()
 _speeds: Dict[int, float] = {}
+# Progress rows waiting for the next tick, and what was last sent per id.
+_pending: Dict[int, dict] = {}
+_sent: Dict[int, Tuple[int, int, int]] = {}
+_interval = DEFAULT_INTERVAL_SEC
+
+
+def set_interval(seconds) -> float:
+    """Set the batch cadence, clamped to a sane range; returns what was applied."""
+    global _interval
+    try:
+        value = float(seconds)
+    except (TypeError, ValueError):
+        value = DEFAULT_INTERVAL_SEC
+    _interval = min(MAX_INTERVAL_SEC, max(MIN_INTERVAL_SEC, value))
+    return _interval
+
+
+def interval() -> float:
+    """Seconds between progress_batch frames."""
+    return _interval
 
 
 def record_speed(download_id: int, bytes_per_second: float) -> None:
@@ -32,6 +65,39 @@ def record_speed(download_id: int, bytes_per_second: float) -> None:
         _speeds[int(download_id)] = max(0.0, float(bytes_per_second or 0))
 
 
+def record_progress(download_id: int, downloaded: int, total: int,
+                    bytes_per_second: float) -> None:
+    """Note a running download's progress for the next batch frame."""
+    if not download_id:
+        return
+    download_id = int(download_id)
+    downloaded, total = int(downloaded or 0), int(total or 0)
+    speed = int(max(0.0, float(bytes_per_second or 0)))
+    with _lock:
+        _speeds[download_id] = float(speed)
+        if _sent.get(download_id) == (downloaded, total, speed):
+            _pending.pop(download_id, None)
+            return
+        _pending[download_id] = {
+            "id": download_id,
+            "downloaded_size": downloaded,
+            "total_size": total,
+            "progress": round(min(100.0, downloaded / total * 100), 1) if total > 0 else 0.0,
+            "download_speed": speed,
+            "status": "downloading",
+        }
+
+
+def take_changed() -> List[dict]:
+    """Every row recorded since the last call that differs from what was sent."""
+    with _lock:
+        rows = list(_pending.values())
+        _pending.clear()
+        for row in rows:
+            _sent[row["id"]] = (row["downloaded_size"], row["total_size"], row["download_speed"])
+    return rows
+
+
 def speed_of(download_id: int) -> int:
     """Current speed in bytes/sec, or 0 when nothing is being transferred."""
     with _lock:
@@ -46,6 +112,25 @@ def clear(download_id: int) -> None:
     """
     with _lock:
         _speeds.pop(int(download_id), None)
+        # A queued row would arrive after the final status and flip it back.
+        _pending.pop(int(download_id), None)
+        _sent.pop(int(download_id), None)
+
+
+# Statuses a download sends no further progress after.
+FINAL_STATUSES = frozenset({"done", "failed", "stopped"})
+
+
+def note_status(download_id: int, status) -> None:
+    """Clear a download's reading when a status update says it has ended.
+
+    The last progress row is recorded moments before the final status goes
+    out, and the task's own :func:`clear` only runs after its cleanup. Left
+    queued, that row reaches the grid on the next tick, after the "done", and
+    its "downloading" flips the finished row back.
+    """
+    if download_id and getattr(status, "value", status) in FINAL_STATUSES:
+        clear(download_id)
 
 
 def snapshot() -> Dict[int, int]:
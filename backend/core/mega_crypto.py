@@ -8,7 +8,8 @@ MEGA's published algorithm (the same one in its open SDK / web client):
 - keys/IVs are handled as tuples of unsigned 32-bit big-endian words ("a32"),
 - the file key is the XOR-fold of an 8-word blob into a 4-word AES key,
 - file attributes (the filename) are AES-CBC encrypted with a ``MEGA{...}`` JSON
-  body, and file contents are AES-CTR encrypted with a chained CBC-MAC.
+  body, and file contents are AES-CTR encrypted with a chained CBC-MAC,
+- inside a shared folder every node key is AES-ECB wrapped with the folder key.
 
 Adapted from the MEGA protocol (ref: odwyersoftware/mega.py, Apache-2.0).
 """
@@ -16,7 +17,7 @@ Adapted from the MEGA protocol (ref: odwyersoftware/mega.py, Apache-2.0).
 import base64
 import json
 import struct
-from typing import Dict, Iterator, Tuple
+from typing import Dict, Iterator, List, Sequence, Tuple
 
 from Crypto.Cipher import AES
 
@@ -72,6 +73,23 @@ def unpack_file_key(file_key: A32) -> Tuple[A32, A32, A32]:
     return aes_key, iv, meta_mac
 
 
+def decrypt_node_keys(encrypted: Sequence[bytes], master_key: A32) -> List[A32]:
+    """Unwrap many node keys (AES-ECB under ``master_key``) in one AES call.
+
+    ECB treats every block on its own, so the keys of a whole folder can be
+    decrypted as one buffer and sliced apart again.
+    """
+    blob = b"".join(encrypted)
+    if len(blob) % 16:
+        raise ValueError("node keys must be whole AES blocks")
+    plain = AES.new(a32_to_bytes(master_key), AES.MODE_ECB).decrypt(blob)
+    keys, offset = [], 0
+    for item in encrypted:
+        keys.append(bytes_to_a32(plain[offset:offset + len(item)]))
+        offset += len(item)
+    return keys
+
+
 def decrypt_attr(attr: bytes, aes_key: A32) -> Dict[str, str]:
     """Decrypt MEGA file attributes (AES-CBC, zero IV) into a dict.
 
@@ -7,21 +7,37 @@ Flow (anonymous, no account):
 2. ``fetch_mega_file_info`` asks MEGA's API for the temporary content URL, size
    and encrypted attributes, then derives the AES key/IV and the real filename.
 3. ``download_mega_file`` streams the encrypted bytes and AES-CTR-decrypts them
-   on MEGA's chunk boundaries, verifying the chained CBC-MAC.
+   on MEGA's chunk boundaries, verifying the chained CBC-MAC. An interrupted
+   transfer resumes from the last chunk on disk (``.megamac`` sidecar).
+
+A folder link is not downloaded as such: ``list_mega_folder`` lists the whole
+tree in one call, and each file is queued as its own download of MEGA's
+per-file folder link (``/folder/<id>#<key>/file/<handle>``), which
+``resolve_mega_file`` turns into the same ``MegaFileInfo``.
 
 The decryption happens entirely client-side; MEGA never sees the key. See
 ``mega_crypto`` for the primitives. (Algorithm ref: odwyersoftware/mega.py.)
 """
 
 import asyncio
+import collections
+import functools
+import hashlib
+import json
+import os
 import random
+import time
 from dataclasses import dataclass
-from typing import Callable, Optional, Tuple
+from typing import Callable, List, Optional, Tuple
 
 import aiohttp
 from Crypto.Cipher import AES
 from Crypto.Util import Counter
 
+from core import cancel_signal
+from core.resume import PARTIAL_CONTENT
+from utils.part_writer import PartWriter
+
 from core.mega_crypto import (
     A32,
     a32_to_bytes,
@@ -29,12 +45,23 @@ from core.mega_crypto import (
     base64_url_decode,
     bytes_to_a32,
     decrypt_attr,
+    decrypt_node_keys,
     get_chunks,
     unpack_file_key,
 )
 
 MEGA_API_URL = "https://g.api.mega.co.nz/cs"
 
+# Sidecar next to the .part: good-byte offset + chained-MAC state for resume.
+MAC_STATE_SUFFIX = ".megamac"
+# It is rewritten at most this often while a transfer runs, and once more
+# when the transfer stops.
+MAC_STATE_SAVE_INTERVAL_SEC = 2.0
+# Bytes per ranged request when a file is fetched over several connections:
+# enough whole chunks (1 MiB each past the first 8) that a request's setup is
+# noise, few enough that a stop throws away little past the good prefix.
+MEGA_GROUP_BYTES = 16 * 1024 * 1024
+
 # Stream read timeout per socket read (the overall transfer has no total cap).
 _SOCK_READ_TIMEOUT = 300
 
@@ -81,11 +108,23 @@ class MegaFileInfo:
 
 
 def is_mega_url(url: str) -> bool:
-    """True for a MEGA *file* share link (folder links return False)."""
+    """True for a link to one MEGA file: a file share link, or a file inside a
+    shared folder (``/folder/<id>#<key>/file/<handle>``). A whole folder
+    returns False — see :func:`is_mega_folder_url`."""
     u = (url or "").lower()
     if not any(domain in u for domain in ("mega.nz", "mega.co.nz", "mega.io")):
         return False
-    return "/folder/" not in u and "#f!" not in u
+    if "/folder/" in u or "#f!" in u:
+        return "/file/" in u
+    return True
+
+
+def is_mega_folder_url(url: str) -> bool:
+    """True for a MEGA folder share link (the whole folder or a subfolder)."""
+    try:
+        return parse_mega_folder_url(url)[2] is None
+    except ValueError:
+        return False
 
 
 def mega_error_message(err: MegaApiError) -> str:
@@ -107,7 +146,7 @@ def parse_mega_url(url: str) -> Tuple[str, str]:
     if not any(domain in url for domain in ("mega.nz", "mega.co.nz", "mega.io")):
         raise ValueError("MEGA 링크가 아닙니다")
     if "/folder/" in url or "/#F!" in url or "#F!" in url:
-        raise ValueError("MEGA 폴더 링크는 지원하지 않습니다 (단일 파일 링크만)")
+        raise ValueError("MEGA 폴더 링크입니다 (parse_mega_folder_url)")
 
     # Current format: https://mega.nz/file/<id>#<key>
     if "/file/" in url:
@@ -128,28 +167,79 @@ def parse_mega_url(url: str) -> Tuple[str, str]:
     raise ValueError("MEGA 파일 링크 형식이 아닙니다")
 
 
-async def fetch_mega_file_info(
-    session: aiohttp.ClientSession, file_id: str, key: str
-) -> MegaFileInfo:
-    """Resolve the temp download URL, size and filename for a public file."""
-    seq_id = random.randint(0, 0xFFFFFFFF)
-    payload = [{"a": "g", "g": 1, "p": file_id}]
+def parse_mega_folder_url(url: str) -> Tuple[str, str, Optional[str], Optional[str]]:
+    """Return ``(folder_id, folder_key, file_handle, subfolder_handle)``.
+
+    ``https://mega.nz/folder/<id>#<key>`` is the whole folder; a trailing
+    ``/file/<handle>`` names one file in it (what a queued child downloads),
+    ``/folder/<handle>`` one subfolder. The legacy ``#F!<id>!<key>`` form is
+    accepted too. Raises ValueError for anything else.
+    """
+    url = (url or "").strip()
+    if not any(domain in url for domain in ("mega.nz", "mega.co.nz", "mega.io")):
+        raise ValueError("MEGA 링크가 아닙니다")
+
+    if "#F!" in url:
+        parts = url.split("#F!", 1)[1].split("!")
+        if len(parts) < 2 or not parts[1]:
+            raise ValueError("MEGA 폴더 링크에 복호화 키가 없습니다")
+        return parts[0], parts[1], None, None
+
+    if "/folder/" not in url:
+        raise ValueError("MEGA 폴더 링크가 아닙니다")
+    tail = url.split("/folder/", 1)[1]
+    if "#" not in tail:
+        raise ValueError("MEGA 폴더 링크에 복호화 키(#...)가 없습니다")
+    folder_id, fragment = tail.split("#", 1)
+    key, _, rest = fragment.partition("/")
+    file_handle = subfolder = None
+    if rest.startswith("file/"):
+        file_handle = rest[len("file/"):].split("/", 1)[0] or None
+    elif rest.startswith("folder/"):
+        subfolder = rest[len("folder/"):].split("/", 1)[0] or None
+    if not key:
+        raise ValueError("MEGA 폴더 링크에 복호화 키(#...)가 없습니다")
+    return folder_id.split("/", 1)[0], key, file_handle, subfolder
+
+
+def mega_folder_file_url(folder_id: str, folder_key: str, handle: str) -> str:
+    """The link MEGA itself uses for one file inside a shared folder."""
+    return f"https://mega.nz/folder/{folder_id}#{folder_key}/file/{handle}"
+
+
+async def _api_request(session: aiohttp.ClientSession, command: dict,
+                       folder_id: Optional[str] = None) -> dict:
+    """Send one API command; returns its result or raises MegaApiError.
+
+    Commands about a node inside a shared folder carry the folder id as ``n``.
+    """
+    params = {"id": str(random.randint(0, 0xFFFFFFFF))}
+    if folder_id:
+        params["n"] = folder_id
     async with session.post(
         MEGA_API_URL,
-        params={"id": str(seq_id)},
-        json=payload,
+        params=params,
+        json=[command],
         timeout=aiohttp.ClientTimeout(total=30),
     ) as response:
         response.raise_for_status()
         data = await response.json(content_type=None)
 
     # The API returns a bare negative int on a global error, or a list whose
-    # first element is the file dict (or a negative int for a per-file error).
+    # first element is the result (or a negative int for a per-command error).
     if isinstance(data, int):
         raise MegaApiError(data)
     item = data[0]
     if isinstance(item, int):
         raise MegaApiError(item)
+    return item
+
+
+async def fetch_mega_file_info(
+    session: aiohttp.ClientSession, file_id: str, key: str
+) -> MegaFileInfo:
+    """Resolve the temp download URL, size and filename for a public file."""
+    item = await _api_request(session, {"a": "g", "g": 1, "p": file_id})
     if "g" not in item:
         raise MegaApiError(-9)  # no content URL → treat as not accessible
 
@@ -165,31 +255,180 @@ async def fetch_mega_file_info(
     )
 
 
+@dataclass(frozen=True)
+class MegaFolderFile:
+    """One file of a shared folder, as the folder listing describes it."""
+
+    handle: str
+    name: str
+    size: int
+    path: Tuple[str, ...]   # folder names from the shared root down to its parent
+    key: A32                # the 8-word file key, already unwrapped
+
+
+# folder_id -> (monotonic time, files) of the last listing. Every child of a
+# folder needs its file key, and only the listing has it: a 300-file folder
+# would otherwise list itself 300 times as its children start.
+_folder_listings = {}
+FOLDER_LISTING_TTL_SEC = 30 * 60
+
+
+def _files_from_listing(nodes: List[dict], folder_key: A32,
+                        subfolder: Optional[str] = None) -> List[MegaFolderFile]:
+    """Decrypt a folder listing into its files, with their folder paths.
+
+    Every node key is wrapped with the folder key, so all of them are
+    unwrapped in one AES call. The attributes each use their own node's key;
+    they are small, and this runs in a worker thread.
+    """
+    usable = []
+    for node in nodes:
+        wrapped = str(node.get("k") or "").split("/", 1)[0].partition(":")[2]
+        if node.get("t") in (0, 1) and wrapped and node.get("h"):
+            usable.append((node, base64_url_decode(wrapped)))
+    keys = decrypt_node_keys([blob for _, blob in usable], folder_key) if usable else []
+
+    names, parents, files = {}, {}, []
+    for (node, _), key in zip(usable, keys):
+        is_file = node["t"] == 0
+        if is_file and len(key) != 8:
+            continue
+        attr_key = unpack_file_key(key)[0] if is_file else key
+        try:
+            attribs = decrypt_attr(base64_url_decode(node.get("a") or ""), attr_key)
+        except (ValueError, UnicodeDecodeError):
+            attribs = {}
+        name = attribs.get("n") or node["h"]
+        names[node["h"]] = name
+        parents[node["h"]] = node.get("p")
+        if is_file:
+            files.append((node, key, name))
+
+    def folders_above(handle: str) -> Tuple[str, ...]:
+        path = []
+        while handle in names and handle != subfolder:
+            path.append(names[handle])
+            handle = parents.get(handle)
+        if subfolder is not None:
+            if handle != subfolder:
+                return None
+            path.append(names[subfolder])
+        return tuple(reversed(path))
+
+    result = []
+    for node, key, name in files:
+        path = folders_above(node.get("p"))
+        if path is None:
+            continue  # outside the requested subfolder
+        result.append(MegaFolderFile(handle=node["h"], name=name, size=int(node.get("s") or 0),
+                                     path=path, key=key))
+    return result
+
+
+async def list_mega_folder(
+    session: aiohttp.ClientSession, folder_id: str, folder_key: str,
+    subfolder: Optional[str] = None, fresh: bool = True,
+) -> List[MegaFolderFile]:
+    """Every file in a shared folder (or one of its subfolders), in one call.
+
+    A single ``f`` command returns the whole tree; its keys and attributes
+    are decrypted off the event loop. With ``fresh=False`` a listing from the
+    last ``FOLDER_LISTING_TTL_SEC`` is reused.
+    """
+    cached = _folder_listings.get(folder_id)
+    if not fresh and cached and time.monotonic() - cached[0] < FOLDER_LISTING_TTL_SEC:
+        nodes = cached[1]
+    else:
+        item = await _api_request(session, {"a": "f", "c": 1, "r": 1, "ca": 1}, folder_id)
+        nodes = item.get("f") or []
+        _folder_listings[folder_id] = (time.monotonic(), nodes)
+    key = base64_to_a32(folder_key)
+    if len(key) != 4:
+        raise ValueError("MEGA 폴더 키 형식이 아닙니다")
+    return await asyncio.to_thread(_files_from_listing, nodes, key, subfolder)
+
+
+async def fetch_mega_folder_file_info(
+    session: aiohttp.ClientSession, folder_id: str, folder_key: str, handle: str
+) -> MegaFileInfo:
+    """Like :func:`fetch_mega_file_info`, for one file inside a shared folder."""
+    files = await list_mega_folder(session, folder_id, folder_key, fresh=False)
+    entry = next((f for f in files if f.handle == handle), None)
+    if entry is None:
+        # Gone from the folder, or added after the cached listing.
+        files = await list_mega_folder(session, folder_id, folder_key)
+        entry = next((f for f in files if f.handle == handle), None)
+    if entry is None:
+        raise MegaApiError(-9)
+
+    item = await _api_request(session, {"a": "g", "g": 1, "n": handle}, folder_id)
+    if "g" not in item:
+        raise MegaApiError(-9)
+    aes_key, iv, meta_mac = unpack_file_key(entry.key)
+    return MegaFileInfo(
+        download_url=item["g"],
+        size=int(item.get("s") or entry.size),
+        name=entry.name,
+        aes_key=a32_to_bytes(aes_key),
+        iv=iv,
+        meta_mac=meta_mac,
+    )
+
+
+async def resolve_mega_file(session: aiohttp.ClientSession, url: str) -> MegaFileInfo:
+    """File info for any single-file MEGA link, shared alone or in a folder."""
+    if "/folder/" in url or "#F!" in url:
+        folder_id, folder_key, handle, _ = parse_mega_folder_url(url)
+        if handle is None:
+            raise ValueError("MEGA 폴더 링크는 파일별로 등록됩니다")
+        return await fetch_mega_folder_file_info(session, folder_id, folder_key, handle)
+    file_id, key = parse_mega_url(url)
+    return await fetch_mega_file_info(session, file_id, key)
+
+
 class _ChainedCbcMac:
-    """MEGA's file MAC: a CBC-MAC per chunk, chained through a second CBC pass."""
+    """MEGA's file MAC: a CBC-MAC per chunk, chained through a second CBC pass.
 
-    def __init__(self, aes_key: bytes, iv: A32):
+    A chunk's CBC-MAC is the last block of the chunk's CBC encryption, so it
+    is computed with one ``encrypt`` call over the whole (zero-padded) chunk.
+    Looping over the 16-byte blocks in Python made one AES call per block —
+    about 650 million for a 10 GB file — and capped a MEGA download at a few
+    MB/s of CPU.
+    """
+
+    def __init__(self, aes_key: bytes, iv: A32, state: Optional[bytes] = None):
+        """``state`` (from :meth:`state`) continues a MAC stopped after a chunk:
+        the chaining pass is plain CBC, so its last output is all it carries."""
         self._key = aes_key
         self._block_iv = a32_to_bytes((iv[0], iv[1], iv[0], iv[1]))
-        self._chain = AES.new(aes_key, AES.MODE_CBC, b"\0" * 16)
-        self._mac = b"\0" * 16
+        self._mac = bytes(state) if state else b"\0" * 16
+        self._chain = AES.new(aes_key, AES.MODE_CBC, self._mac)
+
+    def state(self) -> bytes:
+        return self._mac
+
+    def chunk_mac(self, chunk: bytes) -> bytes:
+        """One chunk's CBC-MAC. Touches no state, so any thread may call it."""
+        if not chunk:
+            return b"\0" * 16
+        tail = len(chunk) % 16
+        if tail:
+            chunk = bytes(chunk) + b"\0" * (16 - tail)
+        return AES.new(self._key, AES.MODE_CBC, self._block_iv).encrypt(chunk)[-16:]
+
+    def absorb(self, chunk_mac: bytes) -> None:
+        """Chain the next chunk's MAC in; chunks must come in file order."""
+        self._mac = self._chain.encrypt(chunk_mac)
 
     def update(self, chunk: bytes) -> None:
-        inner = AES.new(self._key, AES.MODE_CBC, self._block_iv)
-        block_mac = b"\0" * 16
-        for i in range(0, len(chunk), 16):
-            block = chunk[i:i + 16]
-            if len(block) < 16:
-                block += b"\0" * (16 - len(block))
-            block_mac = inner.encrypt(block)
-        self._mac = self._chain.encrypt(block_mac)
+        self.absorb(self.chunk_mac(chunk))
 
     def result(self) -> A32:
         m = bytes_to_a32(self._mac)
         return (m[0] ^ m[1], m[2] ^ m[3])
 
 
-async def _read_exact(stream: aiohttp.StreamReader, n: int) -> bytes:
+async def _read_exact(stream: aiohttp.StreamReader, n: int) -> bytearray:
     """Read exactly ``n`` bytes (or fewer only at EOF) — chunk boundaries must
     line up with MEGA's for the MAC to validate."""
     buf = bytearray()
@@ -198,7 +437,88 @@ async def _read_exact(stream: aiohttp.StreamReader, n: int) -> bytes:
         if not part:
             break
         buf.extend(part)
-    return bytes(buf)
+    return buf
+
+
+def _ctr_cipher(info: MegaFileInfo, offset: int):
+    """AES-CTR positioned at byte ``offset`` (a multiple of 16) of the file."""
+    initial = ((((info.iv[0] << 32) + info.iv[1]) << 64) + offset // 16) % (1 << 128)
+    return AES.new(info.aes_key, AES.MODE_CTR, counter=Counter.new(128, initial_value=initial))
+
+
+def mac_state_path(part_path: str) -> str:
+    return part_path + MAC_STATE_SUFFIX
+
+
+def _fingerprint(info: MegaFileInfo) -> str:
+    """Ties a sidecar to one file without writing its key to disk."""
+    material = info.aes_key + a32_to_bytes(info.iv) + str(info.size).encode()
+    return hashlib.sha256(material).hexdigest()[:32]
+
+
+def save_mac_state(part_path: str, info: MegaFileInfo, offset: int, state: bytes) -> None:
+    """Record that the ``.part`` holds ``offset`` good bytes and the MAC after them."""
+    path = mac_state_path(part_path)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump({"file": _fingerprint(info), "offset": offset, "mac": state.hex()}, fh)
+    os.replace(tmp, path)
+
+
+def load_mac_state(part_path: str, info: MegaFileInfo) -> Optional[Tuple[int, bytes]]:
+    """``(offset, mac state)`` to resume from, or None to start over.
+
+    The sidecar must be for this file, point at one of MEGA's chunk
+    boundaries (the MAC is only defined there), and not claim more bytes than
+    the ``.part`` has.
+    """
+    try:
+        with open(mac_state_path(part_path), "r", encoding="utf-8") as fh:
+            payload = json.load(fh)
+        offset = int(payload["offset"])
+        state = bytes.fromhex(payload["mac"])
+        part_size = os.path.getsize(part_path)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if payload.get("file") != _fingerprint(info) or len(state) != 16:
+        return None
+    if offset <= 0 or offset > part_size:
+        return None
+    if offset != info.size and offset not in {o for o, _ in get_chunks(info.size)}:
+        return None
+    return offset, state
+
+
+def discard_mac_state(part_path: str) -> None:
+    try:
+        os.remove(mac_state_path(part_path))
+    except FileNotFoundError:
+        pass
+
+
+class _RangesRefused(Exception):
+    """MEGA answered a ranged request with the whole file."""
+
+
+def chunk_groups(size: int, start: int = 0, group_bytes: int = None) -> List[List[Tuple[int, int]]]:
+    """MEGA's chunks from ``start`` on, in runs of about ``group_bytes``.
+
+    Each run is one ranged request in the parallel path. Runs are made of
+    whole chunks, so every request starts and ends on a MAC boundary.
+    """
+    group_bytes = group_bytes or MEGA_GROUP_BYTES
+    groups, current, current_size = [], [], 0
+    for offset, length in get_chunks(size):
+        if offset < start:
+            continue
+        current.append((offset, length))
+        current_size += length
+        if current_size >= group_bytes:
+            groups.append(current)
+            current, current_size = [], 0
+    if current:
+        groups.append(current)
+    return groups
 
 
 async def download_mega_file(
@@ -207,40 +527,245 @@ async def download_mega_file(
     dest_path: str,
     progress_cb: Optional[Callable[[int, int], None]] = None,
     is_cancelled: Optional[Callable[[], bool]] = None,
+    download_id: Optional[int] = None,
+    connections: int = 1,
 ) -> int:
-    """Stream the encrypted file and AES-CTR-decrypt it to ``dest_path``.
+    """Download and decrypt ``info`` to ``dest_path``; returns the file size.
+
+    Raises ``asyncio.CancelledError`` if ``is_cancelled`` turns true,
+    ``IOError`` on a truncated stream. With a ``download_id`` a stop also
+    fails a read already waiting on the socket.
+
+    A stopped or dropped transfer resumes. The ``.megamac`` sidecar records
+    how many bytes of the ``.part`` are good from byte zero — always a chunk
+    boundary — and the chained MAC after them. The next attempt fetches only
+    the rest, moves the CTR counter to that offset and carries on with the
+    saved MAC, so the integrity check still covers the whole file.
+
+    With ``connections`` above one, a file with at least two chunk groups
+    left is fetched over that many ranged requests at once (see
+    :func:`_download_parallel`). One stream to MEGA is often throttled far
+    below the line. If MEGA ignores the ranges, the download continues as a
+    single stream from the last good byte.
+    """
+    resume = await asyncio.to_thread(load_mac_state, dest_path, info)
+    start, mac_state = resume if resume else (0, None)
+
+    mac = None
+    if connections > 1 and len(chunk_groups(info.size, start)) >= 2:
+        try:
+            mac = await _download_parallel(session, info, dest_path, start, mac_state, connections,
+                                           progress_cb, is_cancelled, download_id)
+        except _RangesRefused as refused:
+            print(f"[LOG] MEGA 가 Range 를 무시함({refused}) — 단일 연결로 계속: {info.name}")
+            resume = await asyncio.to_thread(load_mac_state, dest_path, info)
+            start, mac_state = resume if resume else (0, None)
+    if mac is None:
+        mac = await _download_stream(session, info, dest_path, start, mac_state,
+                                     progress_cb, is_cancelled, download_id)
+
+    await asyncio.to_thread(discard_mac_state, dest_path)
+    if mac.result() != tuple(info.meta_mac):
+        # The CTR-decrypted bytes are still correct; a mismatch only flags an
+        # integrity concern, so we keep the file and warn rather than fail.
+        print(f"[WARNING] MEGA MAC 불일치: {info.name} (파일은 보존)")
+    return info.size
 
-    Returns the number of bytes written. Raises ``asyncio.CancelledError`` if
-    ``is_cancelled`` turns true, ``IOError`` on a truncated stream.
+
+async def _download_stream(session, info, dest_path, start, mac_state,
+                           progress_cb, is_cancelled, download_id) -> _ChainedCbcMac:
+    """One stream from ``start`` to the end; returns the finished MAC.
+
+    The coroutine only reads: each encrypted chunk is queued to a
+    ``PartWriter`` whose thread decrypts it, feeds the MAC and writes it, in
+    order. Reading the next chunk never waits on AES or the disk — only on
+    the writer's byte budget once it falls that far behind — and the loop
+    stays free for the rest of the app. Both AES passes are single calls into
+    pycryptodome, which drop the GIL while they run.
+
+    A resumed stream asks for the rest with a ``Range``; a server that
+    ignores it (a plain 200) restarts the file from byte zero.
     """
-    counter = Counter.new(128, initial_value=((info.iv[0] << 32) + info.iv[1]) << 64)
-    cipher = AES.new(info.aes_key, AES.MODE_CTR, counter=counter)
-    mac = _ChainedCbcMac(info.aes_key, info.iv)
-    downloaded = 0
+    headers = {"Range": f"bytes={start}-"} if 0 < start < info.size else None
 
     async with session.get(
         info.download_url,
+        headers=headers,
         timeout=aiohttp.ClientTimeout(total=None, connect=60, sock_read=_SOCK_READ_TIMEOUT),
     ) as response:
         response.raise_for_status()
-        with open(dest_path, "wb") as out:
-            for _offset, length in get_chunks(info.size):
-                if is_cancelled and is_cancelled():
-                    raise asyncio.CancelledError()
-                encrypted = await _read_exact(response.content, length)
-                if len(encrypted) != length:
-                    raise IOError(
-                        f"MEGA 스트림이 일찍 끊김: {downloaded + len(encrypted)}/{info.size}"
-                    )
-                plain = cipher.decrypt(encrypted)
-                out.write(plain)
-                mac.update(plain)
-                downloaded += length
-                if progress_cb:
+        if headers and response.status != PARTIAL_CONTENT:
+            print(f"[WARNING] MEGA 이어받기 거부됨 (HTTP {response.status}), 처음부터: {info.name}")
+            start, mac_state = 0, None
+        elif start:
+            print(f"[LOG] MEGA 이어받기: {info.name} {start}/{info.size} bytes")
+
+        cipher = _ctr_cipher(info, start)
+        mac = _ChainedCbcMac(info.aes_key, info.iv, mac_state)
+        downloaded = start
+        # (offset, MAC state) after the last chunk the writer thread decrypted,
+        # and after the last one known to be in the file.
+        decrypted = [start, mac.state()]
+        on_disk = [start, mac.state()]
+        states = {}
+        last_saved = [time.monotonic(), start]
+
+        def decrypt_chunk(encrypted):
+            # Writer thread, one MEGA chunk per call, in file order.
+            plain = cipher.decrypt(encrypted)
+            mac.update(plain)
+            decrypted[0] += len(encrypted)
+            decrypted[1] = mac.state()
+            states[decrypted[0]] = decrypted[1]
+            return plain
+
+        def chunk_written(end, _data):
+            state = states.pop(end, None)
+            if state is not None and not writer.failed:
+                on_disk[0], on_disk[1] = end, state
+
+        unregister = (cancel_signal.interrupt_reads(download_id, response.content)
+                      if download_id is not None else (lambda: None))
+        writer = PartWriter(dest_path, truncate_to=start, transform=decrypt_chunk)
+        try:
+            async with writer:
+                if progress_cb and start:
                     progress_cb(downloaded, info.size)
-
-    if mac.result() != tuple(info.meta_mac):
-        # The CTR-decrypted bytes are still correct; a mismatch only flags an
-        # integrity concern, so we keep the file and warn rather than fail.
-        print(f"[WARNING] MEGA MAC 불일치: {info.name} (파일은 보존)")
-    return downloaded
+                for offset, length in get_chunks(info.size):
+                    if offset < start:
+                        continue
+                    if is_cancelled and is_cancelled():
+                        raise asyncio.CancelledError()
+                    encrypted = await _read_exact(response.content, length)
+                    if len(encrypted) != length:
+                        raise IOError(
+                            f"MEGA 스트림이 일찍 끊김: {downloaded + len(encrypted)}/{info.size}"
+                        )
+                    await writer.write(encrypted, offset,
+                                       on_written=functools.partial(chunk_written, offset + length))
+                    downloaded += length
+                    if progress_cb:
+                        progress_cb(downloaded, info.size)
+                    now = time.monotonic()
+                    if now - last_saved[0] >= MAC_STATE_SAVE_INTERVAL_SEC and on_disk[0] > last_saved[1]:
+                        last_saved[0], last_saved[1] = now, on_disk[0]
+                        await asyncio.to_thread(save_mac_state, dest_path, info, on_disk[0], on_disk[1])
+        except cancel_signal.DownloadCancelled:
+            raise asyncio.CancelledError()
+        finally:
+            unregister()
+            # The writer has flushed by now: unless it failed, everything it
+            # decrypted is in the file, so that is where the next attempt
+            # picks up.
+            if not writer.failed and 0 < decrypted[0] < info.size:
+                await asyncio.to_thread(save_mac_state, dest_path, info, decrypted[0], decrypted[1])
+    return mac
+
+
+async def _download_parallel(session, info, dest_path, start, mac_state, connections,
+                             progress_cb, is_cancelled, download_id) -> _ChainedCbcMac:
+    """Fetch the chunk groups over ``connections`` ranged requests at once.
+
+    MEGA's chunk layout is fixed, CTR can start at any block and a chunk's
+    MAC needs only that chunk, so groups are independent until the very last
+    step. Each worker takes the next group, reads it chunk by chunk, and
+    hands every chunk to the default thread pool to decrypt and MAC — AES
+    drops the GIL, so the workers really run side by side. The plaintext is
+    written at its offset.
+
+    Only the chaining of the chunk MACs needs file order. As chunks land on
+    disk, their MACs wait in a dict until the chain reaches them. The chain's
+    end is also the good prefix the sidecar records: chunks past a gap are
+    fetched again after a stop, at most one group per connection.
+
+    Raises :class:`_RangesRefused` when MEGA answers a range with anything
+    but 206, after saving the prefix so the stream can continue from it.
+    """
+    groups = collections.deque(chunk_groups(info.size, start))
+    mac = _ChainedCbcMac(info.aes_key, info.iv, mac_state)
+    landed = {}                 # offset -> (length, chunk MAC), past the prefix
+    prefix = [start]            # bytes on disk from zero, all chained into mac
+    downloaded = [start]
+    last_saved = [time.monotonic(), start]
+    timeout = aiohttp.ClientTimeout(total=None, connect=60, sock_read=_SOCK_READ_TIMEOUT)
+    workers = min(connections, len(groups))
+    print(f"[LOG] MEGA 분할 다운로드: {workers}개 연결, {len(groups)}개 구간 "
+          f"({start}/{info.size} bytes 완료)")
+
+    def decrypt(offset, encrypted):
+        # Worker thread: neither call touches shared state.
+        plain = _ctr_cipher(info, offset).decrypt(encrypted)
+        return plain, mac.chunk_mac(plain)
+
+    def chunk_written(offset, length, chunk_mac, _data):
+        if writer.failed:
+            return
+        landed[offset] = (length, chunk_mac)
+        while prefix[0] in landed:
+            length, chunk_mac = landed.pop(prefix[0])
+            mac.absorb(chunk_mac)
+            prefix[0] += length
+
+    async def save_prefix():
+        # Snapshot both on the loop: chunk_written moves them together.
+        offset, state = prefix[0], mac.state()
+        last_saved[0], last_saved[1] = time.monotonic(), offset
+        await asyncio.to_thread(save_mac_state, dest_path, info, offset, state)
+
+    async def fetch_group(group):
+        first, end = group[0][0], group[-1][0] + group[-1][1]
+        async with session.get(info.download_url, headers={"Range": f"bytes={first}-{end - 1}"},
+                               timeout=timeout) as response:
+            response.raise_for_status()
+            if response.status != PARTIAL_CONTENT:
+                raise _RangesRefused(f"HTTP {response.status}")
+            unregister = (cancel_signal.interrupt_reads(download_id, response.content)
+                          if download_id is not None else (lambda: None))
+            try:
+                for offset, length in group:
+                    if is_cancelled and is_cancelled():
+                        raise asyncio.CancelledError()
+                    encrypted = await _read_exact(response.content, length)
+                    if len(encrypted) != length:
+                        raise IOError(f"MEGA 스트림이 일찍 끊김: {offset + len(encrypted)}/{info.size}")
+                    plain, chunk_mac = await asyncio.to_thread(decrypt, offset, encrypted)
+                    await writer.write(plain, offset, on_written=functools.partial(
+                        chunk_written, offset, length, chunk_mac))
+                    downloaded[0] += length
+                    if progress_cb:
+                        progress_cb(downloaded[0], info.size)
+                    if (time.monotonic() - last_saved[0] >= MAC_STATE_SAVE_INTERVAL_SEC
+                            and prefix[0] > last_saved[1]):
+                        await save_prefix()
+            finally:
+                unregister()
+
+    async def worker():
+        while groups:
+            await fetch_group(groups.popleft())
+
+    writer = PartWriter(dest_path, truncate_to=start)
+    tasks = []
+    try:
+        async with writer:
+            if progress_cb and start:
+                progress_cb(start, info.size)
+            tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+    except cancel_signal.DownloadCancelled:
+        raise asyncio.CancelledError()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # The writer is closed: every callback for a written chunk is queued
+        # on the loop ahead of this point, so the prefix is final.
+        await asyncio.sleep(0)
+        if not writer.failed and 0 < prefix[0] < info.size:
+            await save_prefix()
+    if prefix[0] != info.size:
+        raise IOError(f"MEGA 분할 다운로드 불완전: {prefix[0]}/{info.size}")
+    return mac
@@ -1,10 +1,11 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Enum, Float, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import validates
 import datetime
 import enum
 
 from .site_tags import strip_site_tag
+from .url_key import url_hash
 
 
 class StatusEnum(str, enum.Enum):
@@ -64,13 +65,25 @@ class _AsDictMixin:
 
 class DownloadRequest(_AsDictMixin, Base):
     __tablename__ = "download_requests"
+    # Nearly every hot query filters on status: the pending sweeps order the
+    # pendings by requested_at, the tabs page through one status by period.
+    # Existing databases get these from core/schema_versions.py.
+    __table_args__ = (
+        Index("ix_download_requests_status_requested_at", "status", "requested_at"),
+        # Most rows have no original_url; left in, the NULLs make ANALYZE rate
+        # the index useless for an equality lookup.
+        Index("ix_download_requests_original_url", "original_url",
+              sqlite_where=text("original_url IS NOT NULL")),
+    )
     id = Column(Integer, primary_key=True, index=True)
     url = Column(String, nullable=False)
     original_url = Column(String, nullable=True)  # original URL (before parsing)
+    # Duplicate-check key of url (core/url_key.py), set by _hash_url below.
+    url_hash = Column(Integer, nullable=True, index=True)
     file_name = Column(String)
     file_size = Column(String, nullable=True)  # file size (e.g. "6.98 GB")
-    status = Column(Enum(StatusEnum), default=StatusEnum.pending)
-    requested_at = Column(DateTime, default=datetime.datetime.now)
+    status = Column(Enum(StatusEnum), default=StatusEnum.pending, index=True)
+    requested_at = Column(DateTime, default=datetime.datetime.now, index=True)
     started_at = Column(DateTime, nullable=True)  # actual download start time
     finished_at = Column(DateTime, nullable=True)
     error = Column(Text, nullable=True)
@@ -85,6 +98,17 @@ class DownloadRequest(_AsDictMixin, Base):
     # True 면 경로 자동 선택은 이 행을 건너뛴다.
     proxy_pinned = Column(Boolean, default=False)
 
+    # Queue order (core/scheduler.py): pinned rows start first, then higher
+    # priority, then queue_position. NULL position means "where requested_at
+    # puts it"; a reorder writes the places it handed out.
+    priority = Column(Integer, default=0)
+    queue_pinned = Column(Boolean, default=False)
+    queue_position = Column(Float, nullable=True)
+
+    # Row version for GET /api/downloads/changes, stamped on every write
+    # (core/change_feed.py). NULL only on rows from before the column existed.
+    updated_seq = Column(Integer, nullable=True, index=True)
+
     # Persist the failure classification / retry policy (same values as error_messages.KIND_*)
     # These columns prevent the problems of text re-classification (whose meaning
     # shifts whenever the classification rules change) and of pinning dead from a
@@ -108,6 +132,12 @@ class DownloadRequest(_AsDictMixin, Base):
         """
         return strip_site_tag(value) if isinstance(value, str) else value
 
+    @validates("url")
+    def _hash_url(self, _key, value):
+        """Keep url_hash in step with url, whichever code path sets it."""
+        self.url_hash = url_hash(value)
+        return value
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         # progress is a transient field, not a DB column — it is temporarily set
@@ -116,6 +146,28 @@ class DownloadRequest(_AsDictMixin, Base):
         self.progress = 0
 
 
+class DownloadTombstone(Base):
+    """A deleted download, kept so the change feed can report the deletion."""
+    __tablename__ = "download_tombstones"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    download_id = Column(Integer, nullable=False)
+    deleted_seq = Column(Integer, nullable=False, index=True)
+
+
+class DownloadDailyStat(Base):
+    """Running totals for /history/stats, one row per (day, status, egress).
+
+    Kept by triggers on download_requests (core/download_stats.py), never
+    written from Python.
+    """
+    __tablename__ = "download_daily_stats"
+    day = Column(String, primary_key=True)  # date(requested_at), '' when unknown
+    status = Column(String, primary_key=True)
+    use_proxy = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    bytes = Column(Integer, nullable=False, default=0)
+
+
 class UserProxy(_AsDictMixin, Base):
     __tablename__ = "user_proxies"
 
@@ -138,3 +190,7 @@ class ProxyStatus(Base):
     last_status = Column(String, nullable=True)  # 'success' or 'fail'
     last_failed_at = Column(DateTime, nullable=True)
     success = Column(Boolean, nullable=True)  # added for compatibility
+
+
+# Stamps updated_seq / writes tombstones on every flush (see the module).
+from . import change_feed  # noqa: E402,F401
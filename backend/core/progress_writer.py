@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""One writer for every download's ``downloaded_size``.
+
+Each running download used to commit its own ``downloaded_size`` on its own
+session every five seconds. Each of those commits took SQLite's write lock
+separately: with thirty transfers that is six lock acquisitions a second that
+an INSERT from the API, a stop, or a status change has to queue behind — the
+contention ``db_async`` was written to keep off the loop, still there, just in
+threads.
+
+Transfers now only :func:`mark` the latest value. The download service runs
+:func:`flush` once per :data:`FLUSH_INTERVAL_SEC`, which writes every value
+marked since the last flush as one ``executemany`` UPDATE in one transaction:
+one write lock per tick, however many downloads are running. A download's own
+value is flushed once more when its task ends (:func:`flush` with its id), so a
+stop or a failure leaves the last count in the row.
+
+Each written row also gets a new ``updated_seq`` (core/change_feed.py), the
+same as an ORM write would.
+
+Within one transfer attempt the UPDATE never lowers ``downloaded_size``: a
+value marked a moment before a download finished must not land on top of the
+final count the completion commit already wrote. An attempt that starts over
+(the host answered a Range with 200, MEGA refused the resume, the user hit
+"start over") legitimately counts up from 0 again, so each attempt calls
+:func:`begin` first: its first value is written whatever the row holds, unless
+the row is already ``done``, and the never-lower rule applies from there on.
+The reset endpoints :func:`discard` any value the previous attempt left behind.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+from core import change_feed
+
+FLUSH_INTERVAL_SEC = 2.0
+
+_UPDATE = text(
+    "UPDATE download_requests SET downloaded_size = :size, updated_seq = :seq "
+    "WHERE id = :id AND (COALESCE(downloaded_size, 0) < :size "
+    "OR (:fresh AND COALESCE(status, '') != 'done'))"
+)
+
+_lock = threading.Lock()
+_dirty: Dict[int, int] = {}
+# Downloads whose next written value opens a new attempt (see begin()).
+_fresh: Set[int] = set()
+
+
+def begin(download_id: int) -> None:
+    """Start a transfer attempt: its first value may lower the stored count."""
+    if not download_id:
+        return
+    with _lock:
+        _dirty.pop(int(download_id), None)
+        _fresh.add(int(download_id))
+
+
+def mark(download_id: int, downloaded: int) -> None:
+    """Note a download's byte count for the next flush."""
+    if not download_id:
+        return
+    with _lock:
+        _dirty[int(download_id)] = int(downloaded or 0)
+
+
+def discard(download_id: int) -> None:
+    """Forget an unflushed value (the row was reset or deleted)."""
+    with _lock:
+        _dirty.pop(int(download_id), None)
+        _fresh.discard(int(download_id))
+
+
+def pending() -> Dict[int, int]:
+    with _lock:
+        return dict(_dirty)
+
+
+def _take(ids: Optional[Iterable[int]]) -> Tuple[Dict[int, int], Set[int]]:
+    with _lock:
+        if ids is None:
+            taken = dict(_dirty)
+            _dirty.clear()
+        else:
+            taken = {i: _dirty.pop(i) for i in map(int, ids) if i in _dirty}
+        fresh = _fresh.intersection(taken)
+        _fresh.difference_update(fresh)
+    return taken, fresh
+
+
+def flush_sync(ids: Optional[Iterable[int]] = None, engine=None) -> int:
+    """Write the marked values (all, or just ``ids``) in one transaction.
+
+    Blocking; returns how many values were written. On a database error the
+    values are put back, unless a newer one was marked in the meantime.
+    """
+    taken, fresh = _take(ids)
+    if not taken:
+        return 0
+    if engine is None:
+        from core.db import engine
+    seqs = []
+    try:
+        with engine.begin() as conn:
+            # Each row gets its own version for the change feed.
+            seqs = change_feed.allocate(conn, len(taken))
+            params = [{"id": k, "size": v, "seq": seq, "fresh": k in fresh}
+                      for (k, v), seq in zip(taken.items(), seqs)]
+            conn.execute(_UPDATE, params)
+    except Exception:
+        with _lock:
+            for k, v in taken.items():
+                if k not in _dirty:
+                    _dirty[k] = v
+                    if k in fresh:
+                        _fresh.add(k)
+        raise
+    finally:
+        change_feed.release(seqs)
+    return len(params)
+
+
+async def flush(ids: Optional[Iterable[int]] = None) -> int:
+    """:func:`flush_sync`, off the loop."""
+    return await asyncio.to_thread(flush_sync, None if ids is None else list(ids))
@@ -7,6 +7,7 @@ Asynchronous proxy management module
 """
 
 from core import db_async
+from core import http_sessions
 import asyncio
 import aiohttp
 import datetime
@@ -185,6 +186,8 @@ class ProxyManager:
                 print(f"[LOG] 프록시 실패 새로 기록: {proxy_addr}")
 
             await db_async.commit(db)
+            # Its pooled connections go too; the address may never come back.
+            http_sessions.discard(proxy_addr)
 
             # Increment the failure count
             self.failed_count += 1
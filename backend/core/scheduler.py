@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""One dispatcher for every queued download.
+
+Every pending row used to get its own ``_download_task`` right away, which then
+parked on a per-(host, egress) semaphore and the global ceiling. A 2,000-row
+backlog meant 2,000 live tasks, and the order they started in was whatever
+order the semaphores happened to wake them in — not the order on screen, and
+nothing a user could change.
+
+Here a queued download is a small entry in a per-slot heap, not a task. The
+dispatcher starts a task only once its slot has room, so the number of tasks
+tracks the number of *running* downloads, whatever the backlog. The order is
+explicit:
+
+1. pinned entries first,
+2. then higher user priority,
+3. then — with ``queue_order: smallest_first`` — smaller known sizes,
+4. then the queue position (request time, or wherever a reorder put it).
+
+Slots are served round-robin, one start per slot per pass, so a deep queue on
+one host cannot take every free place under the global ceiling before another
+host gets one.
+
+The dispatcher is synchronous and runs on the event loop: ``submit`` and
+``finished`` dispatch in place, so there is no background task to keep alive.
+Every limit — each slot and the shared ceiling — is a
+:class:`~core.limiter.ResizableLimiter`, so a settings change resizes it in
+place and the queue starts whatever the new limits admit straight away.
+"""
+
+from __future__ import annotations
+
+import heapq
+import sys
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from core.limiter import ResizableLimiter
+
+ORDER_FIFO = "fifo"
+ORDER_SMALLEST_FIRST = "smallest_first"
+QUEUE_ORDERS = (ORDER_FIFO, ORDER_SMALLEST_FIRST)
+
+
+@dataclass
+class QueuedDownload:
+    """What the dispatcher needs to know about one waiting download."""
+
+    req_id: int
+    slot_key: str
+    limit: int
+    # 1fichier-local slots sit outside the global ceiling (their own cap is
+    # the free tier's one-per-IP), everything else counts against it.
+    shares_ceiling: bool = True
+    skip_parsing: bool = False
+    priority: int = 0
+    pinned: bool = False
+    size: int = 0
+    position: float = 0.0
+    version: int = field(default=0, compare=False)
+
+
+@dataclass
+class _Slot:
+    limiter: ResizableLimiter
+    heap: List[Tuple[tuple, int, int]] = field(default_factory=list)
+
+
+class DownloadScheduler:
+    """Per-slot priority queues plus the counts of what is running."""
+
+    def __init__(self, launch: Callable[[QueuedDownload], None],
+                 ceiling: int,
+                 order: Callable[[], str] = lambda: ORDER_FIFO):
+        self._launch = launch
+        self.ceiling = ResizableLimiter(ceiling, name="ceiling")
+        self._order = order
+        self._slots: Dict[str, _Slot] = {}
+        self._entries: Dict[int, QueuedDownload] = {}
+        # req_id -> (slot_key, shares_ceiling) for every launched download
+        self._running: Dict[int, Tuple[str, bool]] = {}
+        self._rr_offset = 0
+
+    # --- queue -------------------------------------------------------------
+
+    def submit(self, entry: QueuedDownload) -> bool:
+        """Queue ``entry`` and dispatch; True if it started right away."""
+        if entry.req_id in self._running:
+            return True
+        self._entries[entry.req_id] = entry
+        slot = self._slot(entry.slot_key, entry.limit)
+        self._push(slot, entry)
+        self.dispatch()
+        return entry.req_id in self._running
+
+    def discard(self, req_id: int) -> bool:
+        """Drop a queued entry (stopped or deleted); its heap item goes stale."""
+        return self._entries.pop(req_id, None) is not None
+
+    def finished(self, req_id: int) -> None:
+        """A launched download ended — free its slot and start the next."""
+        running = self._running.pop(req_id, None)
+        if running is None:
+            return
+        slot_key, shared = running
+        slot = self._slots.get(slot_key)
+        if slot is not None:
+            slot.limiter.release()
+        if shared:
+            self.ceiling.release()
+        self.dispatch()
+
+    def is_queued(self, req_id: int) -> bool:
+        return req_id in self._entries
+
+    def is_running(self, req_id: int) -> bool:
+        return req_id in self._running
+
+    def slot_of(self, req_id: int) -> Optional[str]:
+        """The slot a launched download holds a place in."""
+        running = self._running.get(req_id)
+        return running[0] if running else None
+
+    def running_by_slot(self) -> Dict[str, List[int]]:
+        by_slot: Dict[str, List[int]] = {}
+        for req_id, (slot_key, _shared) in list(self._running.items()):
+            by_slot.setdefault(slot_key, []).append(req_id)
+        return by_slot
+
+    def queued_in(self, slot_key: str) -> int:
+        return sum(1 for e in list(self._entries.values()) if e.slot_key == slot_key)
+
+    def has_room(self, slot_key: str, limit: int, shares_ceiling: bool = True) -> bool:
+        """Whether a download for ``slot_key`` could start now."""
+        slot = self._slots.get(slot_key)
+        if slot is not None and not slot.limiter.available:
+            return False
+        if slot is None and limit < 1:
+            return False
+        return not shares_ceiling or self.ceiling.available > 0
+
+    # --- explicit order ----------------------------------------------------
+
+    def update(self, req_id: int, *, priority: Optional[int] = None,
+               pinned: Optional[bool] = None, position: Optional[float] = None,
+               size: Optional[int] = None) -> bool:
+        """Change a queued entry's place; False if it is not queued."""
+        entry = self._entries.get(req_id)
+        if entry is None:
+            return False
+        if priority is not None:
+            entry.priority = int(priority)
+        if pinned is not None:
+            entry.pinned = bool(pinned)
+        if position is not None:
+            entry.position = float(position)
+        if size is not None:
+            entry.size = int(size)
+        self._push(self._slot(entry.slot_key, entry.limit), entry)
+        self.dispatch()
+        return True
+
+    def reorder(self, req_ids: Iterable[int]) -> Dict[int, float]:
+        """Put the given queued ids in this order, in the places they held.
+
+        Only their relative order changes: the positions the listed entries
+        occupied are handed back out in the requested order, so everything
+        not listed keeps its place. Returns the new positions to persist.
+        """
+        ids = [i for i in dict.fromkeys(req_ids) if i in self._entries]
+        positions = sorted(self._entries[i].position for i in ids)
+        moved = {}
+        for req_id, position in zip(ids, positions):
+            if self._entries[req_id].position != position:
+                moved[req_id] = position
+                self.update(req_id, position=position)
+        return moved
+
+    def resort(self) -> None:
+        """Rebuild every heap — the order policy or a slot limit changed."""
+        for slot in self._slots.values():
+            slot.heap = []
+        for entry in self._entries.values():
+            self._push(self._slot(entry.slot_key, entry.limit), entry)
+        self.dispatch()
+
+    def slot_keys(self) -> List[str]:
+        return list(self._slots)
+
+    def set_limit(self, slot_key: str, limit: int) -> None:
+        """Resize one slot in place; a raised limit starts its queue at once."""
+        slot = self._slots.get(slot_key)
+        if slot is not None:
+            slot.limiter.resize(max(1, int(limit)))
+        self.dispatch()
+
+    def set_ceiling(self, limit: int) -> None:
+        """Resize the shared ceiling in place.
+
+        Lowering it below what is running starts nothing new until enough
+        downloads finish; nothing running is stopped.
+        """
+        self.ceiling.resize(max(1, int(limit)))
+        self.dispatch()
+
+    # --- dispatch ----------------------------------------------------------
+
+    def dispatch(self) -> int:
+        """Start whatever fits, one per slot per pass; returns how many started."""
+        started = 0
+        progress = True
+        while progress:
+            progress = False
+            keys = list(self._slots)
+            if not keys:
+                break
+            offset = self._rr_offset % len(keys)
+            for key in keys[offset:] + keys[:offset]:
+                slot = self._slots[key]
+                entry = self._peek(slot)
+                if entry is None or not slot.limiter.available:
+                    continue
+                if entry.shares_ceiling and not self.ceiling.try_acquire():
+                    continue
+                slot.limiter.try_acquire()
+                heapq.heappop(slot.heap)
+                del self._entries[entry.req_id]
+                self._running[entry.req_id] = (key, entry.shares_ceiling)
+                # The next pass starts after this slot: round-robin.
+                self._rr_offset = keys.index(key) + 1
+                started += 1
+                progress = True
+                try:
+                    self._launch(entry)
+                except Exception as launch_error:
+                    print(f"[ERROR] 대기열 시작 실패: {entry.req_id} ({launch_error})")
+                    self.finished(entry.req_id)
+        self._drop_idle_slots()
+        return started
+
+    def snapshot(self) -> dict:
+        """The queue as the API shows it: slots, their load, ids in start order."""
+        # Copied first: the API may read this from a worker thread while the
+        # loop is dispatching, and list() of a dict is one atomic step.
+        entries = list(self._entries.values())
+        slots = []
+        for key, slot in sorted(list(self._slots.items())):
+            queued = sorted((e for e in entries if e.slot_key == key), key=self._sort_key)
+            slots.append({
+                "key": key,
+                "limit": slot.limiter.capacity,
+                "running": slot.limiter.holders,
+                "queued": [e.req_id for e in queued],
+            })
+        return {
+            "order": self._order_policy(),
+            "ceiling": self.ceiling.capacity,
+            "ceiling_running": self.ceiling.holders,
+            "running": len(self._running),
+            "queued": len(entries),
+            "slots": slots,
+        }
+
+    # --- internals ---------------------------------------------------------
+
+    def _order_policy(self) -> str:
+        order = self._order()
+        return order if order in QUEUE_ORDERS else ORDER_FIFO
+
+    def _sort_key(self, entry: QueuedDownload) -> tuple:
+        size = 0
+        if self._order_policy() == ORDER_SMALLEST_FIRST:
+            # An unknown size sorts after every known one.
+            size = entry.size if entry.size and entry.size > 0 else sys.maxsize
+        return (0 if entry.pinned else 1, -entry.priority, size, entry.position, entry.req_id)
+
+    def _slot(self, key: str, limit: int) -> _Slot:
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = _Slot(limiter=ResizableLimiter(max(1, int(limit)), name=key))
+            self._slots[key] = slot
+        return slot
+
+    def _push(self, slot: _Slot, entry: QueuedDownload) -> None:
+        # A changed entry is pushed again under a new version; the old heap
+        # item is skipped when it surfaces.
+        entry.version += 1
+        heapq.heappush(slot.heap, (self._sort_key(entry), entry.version, entry.req_id))
+
+    def _peek(self, slot: _Slot) -> Optional[QueuedDownload]:
+        while slot.heap:
+            _key, version, req_id = slot.heap[0]
+            entry = self._entries.get(req_id)
+            if entry is not None and entry.version == version:
+                return entry
+            heapq.heappop(slot.heap)
+        return None
+
+    def _drop_idle_slots(self) -> None:
+        for key in [k for k, s in self._slots.items() if not s.heap and not s.limiter.holders]:
+            del self._slots[key]
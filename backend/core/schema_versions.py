@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Numbered schema steps, applied once per database.
+
+``_run_migrations`` re-checks everything on every start: it adds whatever
+columns PRAGMA table_info says are missing, and its ``CREATE INDEX IF NOT
+EXISTS`` statements are free to repeat. That is fine for DDL, but not for work
+that reads the whole table — backfilling a key for every row, or ANALYZE.
+
+Steps here run in order, each in its own transaction, and each records its
+number in SQLite's ``PRAGMA user_version`` when it commits. A database already
+at a step's number skips it. When at least one step ran, ANALYZE refreshes the
+planner statistics so the new indexes are actually chosen.
+
+A step must also be safe on a brand-new database, where ``create_all`` already
+built the model's indexes.
+"""
+
+from __future__ import annotations
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from core import download_stats, search_index
+from core.url_key import url_hash
+
+# The indexes behind the hot queries, named as core/models.py declares them so
+# a database created from the models already has every one.
+_V1_INDEXES = (
+    "ix_download_requests_status ON download_requests(status)",
+    "ix_download_requests_status_requested_at ON download_requests(status, requested_at)",
+    "ix_download_requests_requested_at ON download_requests(requested_at)",
+    "ix_download_requests_original_url ON download_requests(original_url) "
+    "WHERE original_url IS NOT NULL",
+    "ix_download_requests_url_hash ON download_requests(url_hash)",
+)
+
+
+def _v1_query_indexes(conn) -> None:
+    """Indexes for status / period / duplicate lookups; url_hash for old rows."""
+    rows = conn.execute(text(
+        "SELECT id, url FROM download_requests WHERE url_hash IS NULL"
+    )).all()
+    params = [{"id": row_id, "h": url_hash(url)} for row_id, url in rows]
+    if params:
+        conn.execute(text("UPDATE download_requests SET url_hash = :h WHERE id = :id"), params)
+    for index in _V1_INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index}"))
+
+
+def _v2_search_index(conn) -> None:
+    """FTS5 index for the grid search (core/search_index.py)."""
+    try:
+        search_index.create(conn)
+    except OperationalError as e:
+        if "fts5" not in str(e).lower():
+            raise
+        # An SQLite built without FTS5: the search keeps using ILIKE.
+        print(f"[WARNING] FTS5 unavailable, search stays on ILIKE: {e}")
+
+
+def _v3_stats_totals(conn) -> None:
+    """Trigger-kept totals for /history/stats (core/download_stats.py)."""
+    download_stats.install(conn)
+
+
+def _v4_rekey_fragment_links(conn) -> None:
+    """Re-hash URLs whose fragment became part of the key (MEGA links)."""
+    rows = conn.execute(text(
+        "SELECT id, url FROM download_requests WHERE url LIKE '%#%'"
+    )).all()
+    params = [{"id": row_id, "h": url_hash(url)} for row_id, url in rows]
+    if params:
+        conn.execute(text("UPDATE download_requests SET url_hash = :h WHERE id = :id"), params)
+
+
+# (version, description, step). Append only; never renumber.
+STEPS = (
+    (1, "hot-query indexes and url_hash", _v1_query_indexes),
+    (2, "full-text search index", _v2_search_index),
+    (3, "history stats totals", _v3_stats_totals),
+    (4, "url_hash for MEGA fragment links", _v4_rekey_fragment_links),
+)
+
+
+def current_version(conn) -> int:
+    return int(conn.execute(text("PRAGMA user_version")).scalar() or 0)
+
+
+def upgrade(engine) -> int:
+    """Apply every step newer than the database; returns how many ran."""
+    with engine.connect() as conn:
+        version = current_version(conn)
+
+    applied = 0
+    for number, description, step in STEPS:
+        if number <= version:
+            continue
+        print(f"[LOG] Schema step {number}: {description}")
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(text(f"PRAGMA user_version = {int(number)}"))
+        applied += 1
+
+    if applied:
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+        print(f"[LOG] Schema at version {STEPS[-1][0]} ({applied} step(s) applied, statistics refreshed)")
+    return applied
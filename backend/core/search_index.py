@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Full-text index over download names and URLs.
+
+The grid's search box ran ``file_name ILIKE '%term%' OR url ILIKE '%term%'``
+for the page and again for its COUNT: two full scans of the history on every
+keystroke, since a leading ``%`` defeats any index.
+
+``download_search`` is an FTS5 table over ``download_requests.file_name`` and
+``url``. It is an external-content table, so it stores only the index, not a
+second copy of the text. Triggers on ``download_requests`` keep it in step —
+the update trigger fires only when one of those two columns changes, so the
+progress writes never touch it. Nothing here writes a column of
+``download_requests`` itself, so the rule that every column value is filled
+in Python (tests/test_expire_on_commit.py) still holds.
+
+The ``unicode61`` tokenizer splits on anything that is not a letter or a
+digit, so ``Foo.Bar-NSP-ES.part1.rar`` is indexed as ``foo bar nsp es part1
+rar``. A search for ``bar nsp`` or ``part1`` finds it. Every search word
+matches as a prefix, so a name can be found while it is still being typed.
+
+The table is created by schema step 2 (core/schema_versions.py). On a
+database without it — an SQLite built without FTS5, or the step not run yet
+— :func:`search_filter` falls back to the old ILIKE.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import List, Optional
+
+from sqlalchemy import text
+
+TABLE = "download_search"
+
+_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+    "file_name, url, content='download_requests', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS {TABLE}_ai AFTER INSERT ON download_requests BEGIN "
+    f"INSERT INTO {TABLE}(rowid, file_name, url) VALUES (new.id, new.file_name, new.url); "
+    "END",
+    f"CREATE TRIGGER IF NOT EXISTS {TABLE}_ad AFTER DELETE ON download_requests BEGIN "
+    f"INSERT INTO {TABLE}({TABLE}, rowid, file_name, url) "
+    "VALUES ('delete', old.id, old.file_name, old.url); "
+    "END",
+    f"CREATE TRIGGER IF NOT EXISTS {TABLE}_au AFTER UPDATE OF file_name, url ON download_requests BEGIN "
+    f"INSERT INTO {TABLE}({TABLE}, rowid, file_name, url) "
+    "VALUES ('delete', old.id, old.file_name, old.url); "
+    f"INSERT INTO {TABLE}(rowid, file_name, url) VALUES (new.id, new.file_name, new.url); "
+    "END",
+)
+
+# What unicode61 keeps as a token: letters and digits (any script), no "_".
+_WORD_RE = re.compile(r"[^\W_]+")
+
+# Databases (by URL) known to have the index.
+_ready = set()
+
+
+def create(conn) -> None:
+    """Create the index and its triggers, and fill it from the table."""
+    for statement in _DDL:
+        conn.execute(text(statement))
+    rebuild(conn)
+
+
+def rebuild(conn) -> None:
+    """Re-read every row into the index (drift repair)."""
+    conn.execute(text(f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')"))
+
+
+def ready(conn) -> bool:
+    """Whether this database has the index. Only a yes is remembered."""
+    key = str(conn.engine.url)
+    if key not in _ready and conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+    ), {"name": TABLE}).first() is not None:
+        _ready.add(key)
+    return key in _ready
+
+
+def search_words(term: Optional[str]) -> List[str]:
+    return _WORD_RE.findall((term or "").lower())
+
+
+def match_expression(term: Optional[str]) -> Optional[str]:
+    """FTS5 query for a search box term: every word, each as a prefix."""
+    words = search_words(term)
+    if not words:
+        return None
+    # Words are letters and digits only, so quoting them cannot break out.
+    return " AND ".join(f'"{word}"*' for word in words)
+
+
+def search_filter(db, term: str):
+    """WHERE clause for a grid search on ``term``."""
+    from core.models import DownloadRequest
+
+    expression = match_expression(term)
+    if expression is not None and ready(db.connection()):
+        return text(
+            f"download_requests.id IN (SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH :search_match)"
+        ).bindparams(search_match=expression)
+
+    like = f"%{term.strip()}%"
+    return DownloadRequest.file_name.ilike(like) | DownloadRequest.url.ilike(like)
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""Segment plan for multi-connection downloads.
+
+One TCP stream to a DataNodes/GoFile node tops out far below the line: the node
+shapes per connection, not per client. Splitting the file into byte ranges and
+fetching them side by side multiplies that, but it also breaks the one thing the
+single-stream resume relied on — that the ``.part`` is a contiguous prefix, so
+its size *is* the resume offset. With segments the file has holes, and its size
+says nothing about what is actually on disk.
+
+So the truth moves into a sidecar next to the ``.part``: the segment map. It is
+written before the first out-of-order byte lands and removed only once the file
+is whole, so a ``.part`` that has a map is always read through it, and one that
+has none is a plain prefix exactly as before.
+
+Everything here is pure bookkeeping (plus the sidecar I/O); the transfer itself
+lives in ``utils.file_helpers``.
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from typing import List, Optional
+
+SEGMENT_MAP_SUFFIX = ".segments"
+
+# Below this a segment is not worth its own connection — the TLS handshake and
+# the hoster's per-connection ramp-up eat whatever parallelism would have won.
+MIN_SEGMENT_BYTES = 16 * 1024 * 1024
+
+
+@dataclass
+class Segment:
+    """One byte range ``[start, end)`` of the file and how much of it is on disk."""
+
+    start: int
+    end: int
+    done: int = 0
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start
+
+    @property
+    def offset(self) -> int:
+        """The next byte this segment still needs."""
+        return self.start + self.done
+
+    @property
+    def complete(self) -> bool:
+        return self.done >= self.length
+
+    def range_header(self) -> str:
+        # HTTP ranges are inclusive at both ends.
+        return f"bytes={self.offset}-{self.end - 1}"
+
+
+def segment_map_path(part_path: str) -> str:
+    return part_path + SEGMENT_MAP_SUFFIX
+
+
+def plan_segments(total: int, count: int, start: int = 0,
+                  min_segment: int = MIN_SEGMENT_BYTES) -> List[Segment]:
+    """Split ``[start, total)`` into at most ``count`` segments.
+
+    Bytes before ``start`` are already on disk — a single-stream ``.part`` being
+    picked up by a segmented attempt — and become a completed leading segment,
+    so the map always covers the whole file and the contiguous prefix stays
+    meaningful. Fewer segments than asked for when the remainder is too small
+    to be worth splitting.
+    """
+    segments: List[Segment] = []
+    if start > 0:
+        segments.append(Segment(0, start, start))
+    remaining = max(0, total - start)
+    if remaining == 0:
+        return segments
+    count = max(1, min(count, remaining // max(1, min_segment)))
+    step = remaining // count
+    offset = start
+    for i in range(count):
+        end = total if i == count - 1 else offset + step
+        segments.append(Segment(offset, end))
+        offset = end
+    return segments
+
+
+def contiguous_prefix(segments: List[Segment]) -> int:
+    """Bytes guaranteed on disk from zero — the only safe single-stream offset."""
+    prefix = 0
+    for seg in sorted(segments, key=lambda s: s.start):
+        if seg.start != prefix:
+            break
+        prefix = seg.offset
+        if not seg.complete:
+            break
+    return prefix
+
+
+def downloaded_bytes(segments: List[Segment]) -> int:
+    return sum(min(seg.done, seg.length) for seg in segments)
+
+
+def save_segment_map(part_path: str, total: int, segments: List[Segment]) -> None:
+    """Persist the map atomically — a torn write here would corrupt the resume."""
+    path = segment_map_path(part_path)
+    tmp = path + ".tmp"
+    payload = {
+        "total": total,
+        "segments": [[s.start, s.end, s.done] for s in segments],
+    }
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(payload, fh)
+    os.replace(tmp, path)
+
+
+def load_segment_map(part_path: str, total: Optional[int] = None) -> Optional[List[Segment]]:
+    """The stored map, or ``None`` when there is none or it cannot be trusted.
+
+    A map for a different length belongs to a different file (the hoster swapped
+    it, or the row was re-pointed), and one that does not tile the file exactly
+    is damaged; either way the caller falls back to the prefix rule.
+    """
+    try:
+        with open(segment_map_path(part_path), "r", encoding="utf-8") as fh:
+            payload = json.load(fh)
+        stored_total = int(payload["total"])
+        segments = [Segment(int(a), int(b), int(c)) for a, b, c in payload["segments"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if total is not None and stored_total != total:
+        return None
+    cursor = 0
+    for seg in sorted(segments, key=lambda s: s.start):
+        if seg.start != cursor or seg.end <= seg.start or not 0 <= seg.done <= seg.length:
+            return None
+        cursor = seg.end
+    if cursor != stored_total:
+        return None
+    return segments
+
+
+def stored_total(part_path: str) -> Optional[int]:
+    """The file length recorded in the map, if a readable map exists."""
+    try:
+        with open(segment_map_path(part_path), "r", encoding="utf-8") as fh:
+            return int(json.load(fh)["total"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def discard_segment_map(part_path: str) -> None:
+    try:
+        os.remove(segment_map_path(part_path))
+    except FileNotFoundError:
+        pass
+
+
+def resume_offset(part_path: str) -> int:
+    """Where a single ``Range`` request may safely resume this ``.part``.
+
+    With a map that is the contiguous prefix — the file size counts the holes
+    that later segments skipped over. Without one it is the file size, as it
+    always was.
+    """
+    if not os.path.exists(part_path):
+        return 0
+    if os.path.exists(segment_map_path(part_path)):
+        # A map that cannot be read still means the file has holes, so its
+        # size is not an offset — start over rather than splice garbage in.
+        segments = load_segment_map(part_path, stored_total(part_path))
+        return contiguous_prefix(segments) if segments is not None else 0
+    return os.path.getsize(part_path)
+
+
+def collapse_to_prefix(part_path: str, prefix: int) -> None:
+    """Turn a segmented ``.part`` back into a plain prefix of ``prefix`` bytes.
+
+    Needed whenever a single stream takes over a segmented file: it appends, so
+    anything past the prefix — bytes later segments wrote ahead — has to go
+    first, and so does the map that described them.
+    """
+    if not os.path.exists(segment_map_path(part_path)):
+        return
+    if os.path.exists(part_path):
+        with open(part_path, "r+b") as fh:
+            fh.truncate(max(0, prefix))
+    discard_segment_map(part_path)
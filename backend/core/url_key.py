@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""The lookup key for "was this URL already downloaded?".
+
+Adding a link checked the whole history for a completed row with the same
+``url`` or ``original_url``. Neither column was indexed, so every add read
+every row — and ``url`` is a long string to compare even when it is indexed.
+``DownloadRequest.url_hash`` holds :func:`url_hash` of the row's ``url``,
+kept up to date by a validator on the column, and is indexed; the duplicate
+check probes it with the hash of the new link.
+
+The key is taken from a lightly normalised URL — scheme and host lower-cased,
+fragment dropped, an empty path or a trailing slash evened out — so the same
+link pasted two slightly different ways still hits. A hash can collide, so the
+caller compares the normalised URLs again before trusting a match.
+
+MEGA is the exception to dropping the fragment: its links carry the file (a
+legacy ``#!id!key``, a folder's ``#key/file/handle``) after the ``#``, so
+there the fragment is kept. Dropping it made every legacy MEGA link the same
+``https://mega.nz/`` and the second one added was skipped as a duplicate of
+the first. The host has to be MEGA's own or a subdomain of it; a host that
+merely contains the name (``omega.io``) gets the general rule.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
+
+
+# Hosts whose fragment names the file rather than a place on the page.
+_FRAGMENT_HOSTS = ("mega.nz", "mega.co.nz", "mega.io")
+
+
+def _keeps_fragment(hostname: str) -> bool:
+    return any(hostname == h or hostname.endswith("." + h) for h in _FRAGMENT_HOSTS)
+
+
+def normalize_url(url: Optional[str]) -> str:
+    """The form two URLs are compared in; '' for nothing."""
+    value = (url or "").strip()
+    if not value:
+        return ""
+    try:
+        parts = urlsplit(value)
+    except ValueError:
+        return value
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+    host = parts.netloc.lower()
+    fragment = parts.fragment if _keeps_fragment(parts.hostname or "") else ""
+    return urlunsplit((parts.scheme.lower(), host, path, parts.query, fragment))
+
+
+def url_hash(url: Optional[str]) -> Optional[int]:
+    """A 63-bit key of the normalised URL (fits SQLite's INTEGER), or None."""
+    normalized = normalize_url(url)
+    if not normalized:
+        return None
+    digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> 1
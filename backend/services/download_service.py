@@ -12,11 +12,15 @@ import time
 from typing import Dict, Any, Optional
 from sqlalchemy.orm import Session
 
+from core import change_feed
 from core import db_async
+from core import live_progress
+from core import progress_writer
 from core.models import DownloadRequest, StatusEnum
 from core.db import SessionLocal
 from core.config import get_config
 from core.download_core import download_core
+from core.adaptive_limits import SAMPLE_INTERVAL_SEC as HOST_LIMIT_SAMPLE_SEC
 from core.error_messages import is_retry_blocked_now, KIND_QUEUED
 from core.hoster_common import _host
 from core.proxy_manager import proxy_manager
@@ -56,6 +60,10 @@ class DownloadService:
         self.download_tasks: Dict[int, asyncio.Task] = {}
         self.is_running = False
         self._retry_sweeper_task: Optional[asyncio.Task] = None
+        self._host_limit_task: Optional[asyncio.Task] = None
+        self._progress_task: Optional[asyncio.Task] = None
+        self._progress_writer_task: Optional[asyncio.Task] = None
+        self._tombstone_task: Optional[asyncio.Task] = None
         # host -> monotonic time of the last retry sent there.
         self._last_retry_per_host: Dict[str, float] = {}
 
@@ -72,6 +80,14 @@ class DownloadService:
 
         # Start the background auto-retry sweeper
         self._retry_sweeper_task = asyncio.create_task(self._retry_sweeper_loop())
+        # And the per-host concurrency tuner
+        self._host_limit_task = asyncio.create_task(self._host_limit_loop())
+        # And the one sender of progress frames
+        self._progress_task = asyncio.create_task(self._progress_ticker_loop())
+        # And the one writer of downloaded_size
+        self._progress_writer_task = asyncio.create_task(self._progress_writer_loop())
+        # And the change feed's tombstone pruning
+        self._tombstone_task = asyncio.create_task(self._tombstone_prune_loop())
 
     async def stop(self):
         """Stop the service"""
@@ -85,10 +101,29 @@ class DownloadService:
         if self._retry_sweeper_task is not None:
             self._retry_sweeper_task.cancel()
             self._retry_sweeper_task = None
+        if self._host_limit_task is not None:
+            self._host_limit_task.cancel()
+            self._host_limit_task = None
+        if self._progress_task is not None:
+            self._progress_task.cancel()
+            self._progress_task = None
+        if self._tombstone_task is not None:
+            self._tombstone_task.cancel()
+            self._tombstone_task = None
+        await asyncio.to_thread(download_core.adaptive.save_if_dirty)
 
         # Clean up all download tasks
         await download_core.cleanup_all_tasks()
 
+        # The tasks are gone; write what they marked last.
+        if self._progress_writer_task is not None:
+            self._progress_writer_task.cancel()
+            self._progress_writer_task = None
+        try:
+            await progress_writer.flush()
+        except Exception as e:
+            print(f"[WARNING] 종료 시 진행률 기록 실패: {e}")
+
         print("[LOG] DownloadService stopped")
 
     async def _retry_sweeper_loop(self):
@@ -112,15 +147,81 @@ class DownloadService:
             except Exception as e:
                 print(f"[ERROR] 자동 재시도 스윕 실패: {e}")
 
+    async def _host_limit_loop(self):
+        """Let each busy (host, egress) slot's limit follow its throughput.
+
+        Every ``SAMPLE_INTERVAL_SEC`` the slots get one AIMD reading (see
+        core/adaptive_limits.py); failures feed in as downloads end. What
+        changed is written to disk here, off the loop.
+        """
+        while self.is_running:
+            await asyncio.sleep(HOST_LIMIT_SAMPLE_SEC)
+            if not self.is_running:
+                break
+            try:
+                download_core.tune_host_limits()
+                await asyncio.to_thread(download_core.adaptive.save_if_dirty)
+            except Exception as e:
+                print(f"[ERROR] 호스트 동시 다운로드 조정 실패: {e}")
+
+    async def _progress_ticker_loop(self):
+        """Send every download that moved as one ``progress_batch`` frame.
+
+        Transfers only record their progress (core/live_progress.py); this is
+        the single place it goes out, once per ``progress_interval_sec``, so
+        thirty active downloads cost one encode per tick instead of thirty
+        broadcast tasks.
+        """
+        while self.is_running:
+            await asyncio.sleep(live_progress.interval())
+            if not self.is_running:
+                break
+            await self.flush_progress()
+
+    async def _progress_writer_loop(self):
+        """Write every download's marked ``downloaded_size`` in one transaction.
+
+        See core/progress_writer.py: one write lock per tick instead of one
+        commit per running download.
+        """
+        while self.is_running:
+            await asyncio.sleep(progress_writer.FLUSH_INTERVAL_SEC)
+            try:
+                await progress_writer.flush()
+            except Exception as e:
+                print(f"[WARNING] 진행률 일괄 기록 실패: {e}")
+
+    async def _tombstone_prune_loop(self):
+        """Drop change-feed tombstones behind the horizon (core/change_feed.py)."""
+        while self.is_running:
+            await asyncio.sleep(change_feed.TOMBSTONE_PRUNE_INTERVAL_SEC)
+            try:
+                pruned = await asyncio.to_thread(change_feed.prune_tombstones)
+                if pruned:
+                    print(f"[LOG] 삭제 기록 {pruned}건 정리")
+            except Exception as e:
+                print(f"[WARNING] 삭제 기록 정리 실패: {e}")
+
+    async def flush_progress(self) -> int:
+        """Broadcast what changed since the last tick; returns the row count."""
+        rows = live_progress.take_changed()
+        if not rows:
+            return 0
+        try:
+            await sse_manager.broadcast_message("progress_batch", rows)
+        except Exception as e:
+            print(f"[WARNING] 진행률 배치 전송 실패: {e}")
+        return len(rows)
+
     async def _sweep_due_retries(self):
         """Restart every failed download whose ``next_retry_at`` has passed."""
         with SessionLocal() as db:
             now = datetime.datetime.now()
             # `pending` is here because a queue wait is not a failure and no
             # longer pretends to be one. next_retry_at is what separates a
-            # scheduled wait from a download parked behind a semaphore by a live
-            # task: the parked one has no retry time, so the sweep leaves it to
-            # the task that owns it.
+            # scheduled wait from a download waiting in the scheduler's queue:
+            # the queued one has no retry time, so the sweep leaves it to the
+            # scheduler.
             due = await db_async.all_rows(db.query(DownloadRequest).filter(
                 DownloadRequest.status.in_([StatusEnum.failed, StatusEnum.pending]),
                 DownloadRequest.next_retry_at.isnot(None),
@@ -222,11 +323,11 @@ class DownloadService:
 
             print(f"[LOG] 서버 재시작 후 {len(pending_downloads)}개 대기중인 다운로드 발견")
 
-            # Auto-start via download_core. Each task parks on its own semaphore
-            # (per-site or the shared general/1fichier one) and enforces the
-            # concurrency limit itself, so we simply launch every pending and let
-            # the semaphores throttle. Gating here on a single semaphore value
-            # would use the wrong limit for per-site hosts and starve pendings.
+            # Auto-start via download_core. start_download_async hands each
+            # row to the scheduler, which starts only what the (host, egress)
+            # slots and the global ceiling allow and queues the rest as plain
+            # entries — a long backlog costs no tasks, and the start order is
+            # the queue's, not whichever wait wakes first.
             from core.download_core import download_core
             started_count = 0
 
@@ -257,6 +358,7 @@ class DownloadService:
                     "stopped": base.filter(DownloadRequest.status == StatusEnum.stopped).count(),
                     "active_tasks": len(download_core.download_tasks),
                     "sse_connections": len(sse_manager.connections),
+                    "sse": sse_manager.stats(),
                 }
         except Exception as e:
             print(f"[ERROR] 통계 조회 실패: {e}")
@@ -1,54 +1,194 @@
 # -*- coding: utf-8 -*-
+"""Server-sent events: one queue of ready-to-send frames per browser tab.
+
+A broadcast used to hand the message dict to every connection, and every
+connection's stream ran ``json.dumps`` on it again — the same payload encoded
+once per open tab. ``broadcast_message`` also awaited each connection in turn
+while holding the manager lock.
+
+Now a message is encoded once, with orjson, into the complete ``data: ...``
+frame (:func:`encode_frame`), and that one ``bytes`` object is put on every
+connection's queue without awaiting. The streams write it out as-is. Encoding
+cost no longer grows with the number of tabs, and nothing a single client does
+can hold up a broadcast to the others.
+
+Every broadcast also gets an increasing event id (the ``id:`` line) and is
+kept in a ring of the last :data:`REPLAY_RING_SIZE`. A tab that reconnects with
+the id it saw last — the ``Last-Event-ID`` header, or ``last_event_id`` in the
+query for the frontend's own reconnects — is sent what it missed from the ring,
+and only a gap older than the ring costs it a ``resync`` and a refetch.
+"""
 import asyncio
-import json
 import time
-from typing import Dict, List, Optional, AsyncGenerator
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple, AsyncGenerator
+
+import orjson
 from fastapi import Request
 from fastapi.responses import StreamingResponse
-import weakref
-import queue
+
+
+def encode_frame(payload: dict, event_id: Optional[int] = None) -> bytes:
+    """One SSE ``data:`` frame for ``payload``, ready to write to any stream.
+
+    With ``event_id`` the frame carries an ``id:`` line, which the browser
+    keeps as ``lastEventId``.
+    """
+    # An int key, an Enum or a datetime left in a payload is sent as text
+    # instead of failing the whole frame.
+    body = orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS, default=str)
+    head = b"id: %d\n" % event_id if event_id is not None else b""
+    return head + b"data: " + body + b"\n\n"
+
+
+def encode_message(message_type: str, data, event_id: Optional[int] = None) -> bytes:
+    """The frame for a typed broadcast message."""
+    return encode_frame({
+        "type": message_type,
+        "data": data,
+        "timestamp": time.time()
+    }, event_id)
+
+
+# A connection this many frames behind its broadcasts is a slow consumer —
+# typically a phone tab in the background that stopped reading.
+SLOW_CONSUMER_DEPTH = 200
+# A slow consumer that has not caught up after this long is disconnected; the
+# tab reconnects and refetches when it wakes up.
+SLOW_CONSUMER_GRACE_SEC = 30.0
+# Past this many queued frames it is disconnected at once.
+MAX_QUEUED_FRAMES = 2000
+
+PROGRESS_BATCH = "progress_batch"
+RESYNC = "resync"
+
+# Broadcasts kept for replay to a client that reconnects with Last-Event-ID.
+# A gap older than this is answered with a "resync" event instead.
+REPLAY_RING_SIZE = 1000
+
+# Stands in the frame queue for the progress rows merged while behind.
+_COALESCED = object()
 
 
 class SSEConnection:
+    """One browser tab: a bounded queue of frames and the stream that sends them.
+
+    A client that keeps up gets every broadcast frame as the shared bytes. One
+    that falls behind gets its progress rows merged per download id — only the
+    latest row of each download is still worth sending — into a single pending
+    ``progress_batch``. Every other frame (added, done, failed, ...) is kept as
+    is. A client that stays :data:`SLOW_CONSUMER_DEPTH` frames behind for
+    :data:`SLOW_CONSUMER_GRACE_SEC`, or reaches :data:`MAX_QUEUED_FRAMES`, is
+    disconnected instead of holding that backlog in server memory.
+    """
+
     def __init__(self, request: Request):
         self.request = request
-        self.queue = asyncio.Queue()
+        self._frames: Deque = deque()
+        self._progress: Dict[int, dict] = {}
+        self._progress_event_id: Optional[int] = None
+        self._ready = asyncio.Event()
         self.connected = True
+        self.evicted = False
+        self.behind_since: Optional[float] = None
+        self.max_depth = 0
+        self.coalesced = 0
         self.last_heartbeat = time.time()
-        
+
+    @property
+    def depth(self) -> int:
+        """Frames queued and not yet sent."""
+        return len(self._frames)
+
+    def send_frame(self, frame: bytes, progress_rows: Optional[list] = None,
+                   event_id: Optional[int] = None) -> None:
+        """Queue an encoded frame; never waits.
+
+        ``progress_rows`` marks a progress_batch frame: if this client is
+        already behind, the rows are merged instead of queuing another frame.
+        """
+        if not self.connected:
+            return
+        if progress_rows is not None and self._frames:
+            if not self._progress:
+                self._frames.append(_COALESCED)
+                # The merged batch takes the id of the first frame it stands
+                # for: a reconnect from there replays whatever came after it.
+                self._progress_event_id = event_id
+            for row in progress_rows:
+                row_id = row.get("id")
+                if row_id in self._progress:
+                    self.coalesced += 1
+                self._progress[row_id] = row
+        else:
+            self._frames.append(frame)
+        self.max_depth = max(self.max_depth, len(self._frames))
+        self.check_backlog()
+        self._ready.set()
+
     async def send_message(self, message_type: str, data: dict):
         """Add a message to the queue"""
         if not self.connected:
             return
-            
-        message = {
-            "type": message_type,
-            "data": data,
-            "timestamp": time.time()
-        }
-        
-        try:
-            await self.queue.put(message)
-        except Exception:
-            self.connected = False
-            
+        self.send_frame(encode_message(message_type, data),
+                        progress_rows=data if message_type == PROGRESS_BATCH else None)
+
+    def check_backlog(self, now: Optional[float] = None) -> bool:
+        """Evict this client if it is too far behind; True if it was."""
+        if not self.connected:
+            return self.evicted
+        now = time.monotonic() if now is None else now
+        depth = len(self._frames)
+        if depth >= MAX_QUEUED_FRAMES:
+            self.evict(f"{depth} frames queued")
+        elif depth >= SLOW_CONSUMER_DEPTH:
+            if self.behind_since is None:
+                self.behind_since = now
+            elif now - self.behind_since >= SLOW_CONSUMER_GRACE_SEC:
+                self.evict(f"{depth} frames behind for {now - self.behind_since:.0f}s")
+        else:
+            self.behind_since = None
+        return self.evicted
+
+    def evict(self, reason: str) -> None:
+        """Drop a client that is not reading; its backlog goes with it."""
+        print(f"[WARNING] SSE slow consumer disconnected: {reason}")
+        self.evicted = True
+        self.disconnect()
+
     def disconnect(self):
         """Disconnect"""
         self.connected = False
+        self._frames.clear()
+        self._progress.clear()
+        self._ready.set()
 
-    async def get_stream(self) -> AsyncGenerator[str, None]:
+    def _next_frame(self) -> bytes:
+        item = self._frames.popleft()
+        if len(self._frames) < SLOW_CONSUMER_DEPTH:
+            self.behind_since = None
+        if item is _COALESCED:
+            rows = list(self._progress.values())
+            self._progress.clear()
+            return encode_message(PROGRESS_BATCH, rows, self._progress_event_id)
+        return item
+
+    async def get_stream(self) -> AsyncGenerator[bytes, None]:
         """Generate the SSE stream - safe handling"""
         try:
             # Connection confirmation message
-            yield f"data: {json.dumps({'type': 'connection', 'status': 'connected'})}\n\n"
+            yield encode_frame({'type': 'connection', 'status': 'connected'})
 
             while self.connected:
                 try:
-                    # Shorter timeout for a faster response
-                    message = await asyncio.wait_for(self.queue.get(), timeout=0.5)
+                    if not self._frames:
+                        self._ready.clear()
+                        # Shorter timeout for a faster response
+                        await asyncio.wait_for(self._ready.wait(), timeout=0.5)
+                        continue
 
-                    # Send the message
-                    yield f"data: {json.dumps(message)}\n\n"
+                    # Already encoded by the broadcast; sent as-is
+                    yield self._next_frame()
 
                 except asyncio.TimeoutError:
                     # Send a heartbeat every 60 seconds
@@ -58,7 +198,7 @@ class SSEConnection:
                                 "type": "heartbeat",
                                 "timestamp": time.time()
                             }
-                            yield f"data: {json.dumps(heartbeat)}\n\n"
+                            yield encode_frame(heartbeat)
                             self.last_heartbeat = time.time()
                         except Exception:
                             break
@@ -83,7 +223,15 @@ class SSEManager:
         self.connections: List[SSEConnection] = []
         self._cleanup_task: Optional[asyncio.Task] = None
         self._lock = asyncio.Lock()
-        
+        # Totals for connections already dropped; live ones add their own.
+        self.evictions = 0
+        self._coalesced_closed = 0
+        # Event ids start from the clock in ms, so ids from before a restart
+        # are always older than the ring and get a resync, never a replay of
+        # someone else's events.
+        self._last_event_id = time.time_ns() // 1_000_000
+        self._ring: Deque[Tuple[int, bytes, Optional[list]]] = deque(maxlen=REPLAY_RING_SIZE)
+
     async def start(self):
         """Start the SSE manager"""
         if not self._cleanup_task:
@@ -112,37 +260,89 @@ class SSEManager:
             
         print(f"[LOG] SSEManager stopped ({connection_count} connections closed)")
     
-    async def add_connection(self, request: Request) -> SSEConnection:
-        """Add a new SSE connection"""
+    async def add_connection(self, request: Request, last_event_id: Optional[int] = None) -> SSEConnection:
+        """Add a new SSE connection.
+
+        A client that says which event it saw last gets everything broadcast
+        since, from the replay ring, ahead of anything new — under the same
+        lock as the broadcasts, so nothing falls between the two.
+        """
         connection = SSEConnection(request)
-        
+
         async with self._lock:
+            replayed = self._replay_into(connection, last_event_id)
             self.connections.append(connection)
-            
-        print(f"[LOG] New SSE connection. Total: {len(self.connections)}")
+
+        print(f"[LOG] New SSE connection. Total: {len(self.connections)}"
+              + (f" (replayed {replayed})" if last_event_id is not None else ""))
         return connection
+
+    def _replay_into(self, conn: SSEConnection, last_event_id: Optional[int]):
+        """Queue the events after ``last_event_id``; a count, or ``"resync"``."""
+        if last_event_id is None:
+            return 0
+        oldest = self._ring[0][0] if self._ring else self._last_event_id + 1
+        if last_event_id > self._last_event_id or last_event_id < oldest - 1:
+            # Not ours (a restart) or older than the ring: the client has to
+            # refetch. The id brings it up to date for its next reconnect.
+            conn.send_frame(encode_message(RESYNC, {"last_event_id": self._last_event_id},
+                                           self._last_event_id))
+            return RESYNC
+        count = 0
+        for event_id, frame, rows in self._ring:
+            if event_id > last_event_id:
+                conn.send_frame(frame, rows, event_id)
+                count += 1
+        return count
         
     async def broadcast_message(self, message_type: str, data: dict, exclude_conn: Optional[SSEConnection] = None):
-        """Broadcast a message to all connections"""
-        if not self.connections:
-            return
-            
+        """Broadcast a message to all connections.
+
+        Encoded once, then queued on each connection without awaiting, so the
+        lock is only held for the list walk.
+        """
+        # Encoded and kept in the ring even with nobody connected: a tab in
+        # the middle of a reconnect is exactly who will ask for it.
+        progress_rows = data if message_type == PROGRESS_BATCH else None
         async with self._lock:
+            self._last_event_id += 1
+            event_id = self._last_event_id
+            frame = encode_message(message_type, data, event_id)
+            self._ring.append((event_id, frame, progress_rows))
             active_connections = []
-            
+
             for conn in self.connections:
-                if conn == exclude_conn or not conn.connected:
-                    continue
-                    
-                try:
-                    await conn.send_message(message_type, data)
+                if conn is not exclude_conn:
+                    conn.send_frame(frame, progress_rows, event_id)
+                if conn.connected:
                     active_connections.append(conn)
-                except Exception:
-                    conn.disconnect()
-                    
+                else:
+                    self._forget(conn)
+
             # Update the connection list
             self.connections = active_connections
 
+    def _forget(self, conn: SSEConnection) -> None:
+        """Fold a dropped connection's counters into the totals."""
+        if conn.evicted:
+            self.evictions += 1
+        self._coalesced_closed += conn.coalesced
+        conn.coalesced = 0
+
+    def stats(self) -> dict:
+        """Queue depth and slow-consumer metrics, for the health check."""
+        conns = list(self.connections)
+        depths = [c.depth for c in conns]
+        return {
+            "connections": len(conns),
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            "queue_depth_peak": max((c.max_depth for c in conns), default=0),
+            "slow_consumers": sum(1 for c in conns if c.behind_since is not None),
+            "evictions": self.evictions,
+            "coalesced_rows": self._coalesced_closed + sum(c.coalesced for c in conns),
+        }
+
     async def _cleanup_connections(self):
         """Clean up inactive connections (runs periodically)"""
         while True:
@@ -153,9 +353,13 @@ class SSEManager:
                     active_connections = []
 
                     for conn in self.connections:
+                        # A client behind with nothing new being broadcast is
+                        # only caught here.
+                        conn.check_backlog()
                         if conn.connected:
                             active_connections.append(conn)
                         else:
+                            self._forget(conn)
                             print(f"[LOG] Cleaning up disconnected SSE connection")
 
                     if len(active_connections) != len(self.connections):
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Tests for the adaptive (AIMD) per-host download limits.
+
+The static table held megaup to 2 and everyone else to 3 whatever the host
+said back. These pin the controller's rules: halve on a congestion verdict
+(once per burst), climb by one only while total throughput keeps climbing,
+never past the static value, and remember what was learned across a restart.
+"""
+
+from core.adaptive_limits import AdaptiveLimits, DECREASE_HOLD_SEC, is_congestion
+from core.error_messages import KIND_DEAD, KIND_RATE_LIMITED
+
+KEY = "host.example@direct"
+MB = 1024 * 1024
+
+
+def test_congestion_is_429s_blocks_and_resets_not_dead_links():
+    assert is_congestion(KIND_RATE_LIMITED, "")
+    assert is_congestion(None, "ClientOSError: Connection reset by peer")
+    assert not is_congestion(KIND_DEAD, "HTTP 404")
+
+
+def test_a_burst_of_429s_halves_once():
+    limits = AdaptiveLimits()
+    assert limits.record_failure(KEY, 6, KIND_RATE_LIMITED, "", now=1000.0) == 3
+    assert limits.record_failure(KEY, 6, KIND_RATE_LIMITED, "", now=1001.0) is None
+    assert limits.limit_for(KEY, 6) == 3
+
+
+def test_climbs_only_while_throughput_rises_and_never_past_the_ceiling():
+    limits = AdaptiveLimits()
+    limits.record_failure(KEY, 4, KIND_RATE_LIMITED, "", now=0.0)  # 4 -> 2, learned 3
+    t = DECREASE_HOLD_SEC + 1
+
+    assert limits.sample(KEY, 4, rate=10 * MB, running=2, queued=5, now=t) == 3
+    # The third download added nothing: take it back and stop there.
+    assert limits.sample(KEY, 4, rate=10 * MB, running=3, queued=5, now=t + 30) == 2
+    assert limits.sample(KEY, 4, rate=10 * MB, running=2, queued=5, now=t + 60) is None
+    assert limits.limit_for(KEY, 4) == 2
+
+
+def test_an_idle_slot_is_not_widened():
+    limits = AdaptiveLimits()
+    limits.record_failure(KEY, 4, KIND_RATE_LIMITED, "", now=0.0)
+    assert limits.sample(KEY, 4, rate=5 * MB, running=2, queued=0, now=500.0) is None
+
+
+def test_learned_limits_survive_a_restart(tmp_path):
+    path = tmp_path / "host_limits.json"
+    limits = AdaptiveLimits(path)
+    limits.record_failure(KEY, 6, KIND_RATE_LIMITED, "", now=10.0)
+    limits.save_if_dirty()
+
+    assert AdaptiveLimits(path).limit_for(KEY, 6) == 3
+    # A lowered static value still caps what was learned.
+    assert AdaptiveLimits(path).limit_for(KEY, 2) == 2
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 """``core.cancel_signal`` unit tests."""
 
+import asyncio
 import threading
+from types import SimpleNamespace
 
 import pytest
 
@@ -59,3 +61,68 @@ def test_independent_ids():
     cancel_signal.signal_cancel(1)
     assert cancel_signal.is_cancelled(1)
     assert not cancel_signal.is_cancelled(2)
+
+
+def test_on_cancel_runs_callbacks_once_and_can_be_unregistered():
+    fired = []
+    cancel_signal.on_cancel(1, lambda: fired.append("a"))
+    unregister = cancel_signal.on_cancel(1, lambda: fired.append("b"))
+    unregister()
+    cancel_signal.signal_cancel(1)
+    cancel_signal.signal_cancel(1)
+    assert fired == ["a"]
+
+
+def test_on_cancel_after_the_signal_runs_at_once():
+    fired = []
+    cancel_signal.signal_cancel(1)
+    cancel_signal.on_cancel(1, lambda: fired.append(True))
+    assert fired == [True]
+
+
+# --- the transfer loop ------------------------------------------------------
+
+class _SilentStream:
+    """One chunk, then a socket that never sends another byte."""
+
+    def __init__(self):
+        self._sent = False
+        self._waiter = None
+
+    async def read(self, _n):
+        if not self._sent:
+            self._sent = True
+            return b"x" * 1024
+        self._waiter = asyncio.get_running_loop().create_future()
+        return await self._waiter
+
+    def set_exception(self, exc):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_exception(exc)
+
+
+class _CountingDb:
+    def __init__(self):
+        self.refreshes = 0
+
+    def refresh(self, _):
+        self.refreshes += 1
+
+    def commit(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_a_stop_interrupts_a_read_parked_on_a_silent_socket(tmp_path):
+    import utils.file_helpers as fh
+
+    db = _CountingDb()
+    req = SimpleNamespace(id=1, status=None, downloaded_size=0)
+    transfer = asyncio.create_task(fh.download_file_content(
+        SimpleNamespace(content=_SilentStream()), str(tmp_path / "a.part"), 0, 10 ** 9, req, db,
+    ))
+    await asyncio.sleep(0.6)  # first buffer handed on, then parked on read()
+    cancel_signal.signal_cancel(1)
+
+    assert await asyncio.wait_for(transfer, 2) == 1024
+    assert db.refreshes == 0  # the stop never needed the database
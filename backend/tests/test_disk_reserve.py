@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Tests for disk reservations and ``.part`` preallocation.
+
+Free space alone admitted five 40 GB downloads onto a 60 GB disk, because none
+of them had written anything yet; the full disk was then found mid-write by
+all of them at once. These pin the ledger arithmetic, the admission refusal in
+``start_download_async``, and that preallocation never changes the ``.part``
+size — the size is the resume offset.
+"""
+
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from core import disk_reserve
+from core.download_core import DownloadCore
+from core.models import StatusEnum
+
+GB = 1024 ** 3
+
+
+@pytest.fixture(autouse=True)
+def _empty_ledger(monkeypatch):
+    monkeypatch.setattr(disk_reserve, "_reserved", {})
+
+
+@pytest.fixture
+def free_60gb(monkeypatch):
+    monkeypatch.setattr(disk_reserve, "free_bytes", lambda _d: 60 * GB)
+
+
+def test_reservations_of_others_count_against_free_space(free_60gb):
+    assert disk_reserve.reserve(1, 40 * GB, "/d")
+    assert not disk_reserve.reserve(2, 40 * GB, "/d")
+    assert disk_reserve.reserve(2, 19 * GB, "/d")
+
+
+def test_settled_and_released_space_is_free_again(free_60gb):
+    disk_reserve.reserve(1, 40 * GB, "/d")
+    disk_reserve.settle(1)  # preallocated: the free figure counts it now
+    assert disk_reserve.reserve(2, 40 * GB, "/d")
+    disk_reserve.release(2)
+    assert disk_reserve.reserved_bytes() == 0
+
+
+def test_a_restart_replaces_its_own_reservation(free_60gb):
+    disk_reserve.reserve(1, 50 * GB, "/d")
+    assert disk_reserve.reserve(1, 55 * GB, "/d")
+    assert disk_reserve.reserved_bytes() == 55 * GB
+
+
+def test_unknown_free_space_does_not_block(monkeypatch):
+    monkeypatch.setattr(disk_reserve, "free_bytes", lambda _d: None)
+    assert disk_reserve.reserve(1, 10 ** 15, "/d")
+
+
+@pytest.mark.skipif(disk_reserve._fallocate is None, reason="no fallocate(2) here")
+def test_preallocation_keeps_the_part_size(tmp_path):
+    part = tmp_path / "a.bin.part"
+    part.write_bytes(b"x" * 10)
+    with open(part, "r+b") as fh:
+        if not disk_reserve.preallocate(fh.fileno(), 8 * 1024 * 1024):
+            pytest.skip("filesystem cannot preallocate")
+    assert part.stat().st_size == 10
+    assert disk_reserve.allocated_bytes(str(part)) >= 8 * 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_start_refuses_a_download_that_does_not_fit(free_60gb, monkeypatch):
+    disk_reserve.reserve(99, 50 * GB, "/d")
+    monkeypatch.setattr("core.download_core.get_download_path", lambda: "/d")
+    monkeypatch.setattr("core.download_core.get_config", lambda: {"language": "en"})
+    dc = DownloadCore()
+    dc.send_download_update = AsyncMock()
+    req = SimpleNamespace(
+        id=5, url="https://example.com/big.iso", total_size=20 * GB, save_path=None,
+        status=StatusEnum.pending, error=None, attempts_json=None,
+        failure_kind=None, next_retry_at=None, attempt_count=0,
+    )
+
+    monkeypatch.setattr("core.db_async.commit", AsyncMock())
+    assert await dc.start_download_async(req, MagicMock()) is False
+
+    assert req.status == StatusEnum.failed
+    update = dc.send_download_update.await_args.args[1]
+    assert update["status"] == "failed"
+    assert update["raw_error"] == DownloadCore._disk_full_message()
+    assert 5 not in dc.download_tasks
+    assert disk_reserve.reserved_bytes(exclude=99) == 0
+
+
+@pytest.mark.asyncio
+async def test_a_start_that_fails_after_reserving_releases_it(free_60gb, monkeypatch):
+    monkeypatch.setattr("core.download_core.get_download_path", lambda: "/d")
+    dc = DownloadCore()
+    dc.send_download_update = AsyncMock()
+    dc._apply_download_route = MagicMock(side_effect=RuntimeError("db locked"))
+    req = SimpleNamespace(id=6, url="https://example.com/a.iso", total_size=20 * GB,
+                          save_path=None, status=StatusEnum.pending)
+
+    assert await dc.start_download_async(req, MagicMock()) is False
+    assert 6 not in dc.download_tasks
+    assert disk_reserve.reserved_bytes() == 0
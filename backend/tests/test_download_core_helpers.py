@@ -157,7 +157,6 @@ async def test_direct_download_passes_cookies_and_headers(fake_aiohttp, monkeypa
     monkeypatch.setattr(dc, "download_file_content", AsyncMock(return_value=0))
     monkeypatch.setattr(fh, "get_final_file_path", lambda p: p)
     monkeypatch.setattr(dc, "get_final_file_path", lambda p: p)
-    monkeypatch.setattr(dc.shutil, "move", lambda *a, **kw: None)
 
     # Set the fake response to 200
     def session_factory(*args, **kwargs):
@@ -324,7 +323,6 @@ async def test_special_hoster_403_uses_flaresolverr_cookies_then_retries(monkeyp
     monkeypatch.setattr(dc, "download_file_content", AsyncMock(return_value=0))
     monkeypatch.setattr(fh, "get_final_file_path", lambda p: p)
     monkeypatch.setattr(dc, "get_final_file_path", lambda p: p)
-    monkeypatch.setattr(dc.shutil, "move", lambda *a, **kw: None)
 
     class SequenceSession(_FakeAioSession):
         instances = []
@@ -373,7 +371,6 @@ async def test_direct_download_auto_reparses_on_404(monkeypatch):
     monkeypatch.setattr(dc, "download_file_content", AsyncMock(return_value=0))
     monkeypatch.setattr(fh, "get_final_file_path", lambda p: p)
     monkeypatch.setattr(dc, "get_final_file_path", lambda p: p)
-    monkeypatch.setattr(dc.shutil, "move", lambda *a, **kw: None)
 
     # First attempt → 404, second attempt → 200
     call_seq = {"i": 0}
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 """Unit tests for the module-level helpers in ``download_core``."""
 
+from types import SimpleNamespace
+
 from core.download_core import _build_proxy_dict
 
 
@@ -82,13 +84,13 @@ class TestFichierHostBackoff:
     def test_each_egress_gets_its_own_slot(self):
         # One 1fichier slot per egress, not one shared slot.
         dc = DownloadCore()
-        direct = dc._fichier_sem(EGRESS_DIRECT)
-        vpn = dc._fichier_sem(EGRESS_VPN)
+        req = SimpleNamespace(url="https://1fichier.com/?abc", original_url=None, use_proxy=False)
+        direct = dc._slot_for(req, EGRESS_DIRECT)
+        vpn = dc._slot_for(req, EGRESS_VPN)
 
-        assert direct is not vpn
-        assert dc._fichier_sem(EGRESS_DIRECT) is direct  # cached, not rebuilt
-        assert direct._value == dc.MAX_FICHIER_LOCAL_DOWNLOADS
-        assert vpn._value == dc.MAX_FICHIER_LOCAL_DOWNLOADS
+        assert direct[0] != vpn[0]
+        assert direct[1] == dc.MAX_FICHIER_LOCAL_DOWNLOADS
+        assert direct[2] is False  # the free tier sits outside the global ceiling
 
     def test_await_cooldown_returns_immediately_when_inactive(self):
         dc = DownloadCore()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Tests for the trigger-kept history stats totals.
+
+/history/stats grouped the whole history twice on every badge refresh, while
+downloads were writing. These pin the table that replaced those scans: every
+insert, status change, size change and delete lands in it in the same
+transaction, progress writes do not touch it, the endpoint reports exactly
+what the old GROUP BY did for any period, and a rebuild repairs drift.
+"""
+
+import datetime
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from core import download_stats, schema_versions
+from core.models import Base, DownloadRequest, StatusEnum
+from api.routes.history import get_history_stats, rebuild_history_stats
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stats.db'}")
+    Base.metadata.create_all(bind=engine)
+    schema_versions.upgrade(engine)
+    return sessionmaker(bind=engine)
+
+
+def _buckets(db):
+    return sorted(db.execute(text(
+        "SELECT day, status, use_proxy, count, bytes FROM download_daily_stats"
+    )).all())
+
+
+def _recomputed(db):
+    return sorted(db.execute(text(download_stats._GROUPED)).all())
+
+
+def _day(n):
+    return datetime.datetime(2026, 10, n, 12, 0)
+
+
+def test_every_write_moves_its_row_between_buckets(session_factory):
+    with session_factory() as db:
+        rows = [
+            DownloadRequest(url=f"https://example.com/{i}", status=status, use_proxy=proxy,
+                            total_size=size, requested_at=_day(day))
+            for i, (status, proxy, size, day) in enumerate([
+                (StatusEnum.done, True, 100, 1),
+                (StatusEnum.done, False, 50, 1),
+                (StatusEnum.pending, True, 0, 2),
+                (StatusEnum.failed, False, None, 3),
+            ])
+        ]
+        db.add_all(rows)
+        db.commit()
+        assert _buckets(db) == _recomputed(db)
+
+        rows[2].status = StatusEnum.downloading
+        rows[2].total_size = 700
+        rows[3].use_proxy = True
+        rows[1].requested_at = _day(5)
+        db.commit()
+        assert _buckets(db) == _recomputed(db)
+
+        before = _buckets(db)
+        rows[2].downloaded_size = 350
+        db.commit()
+        assert _buckets(db) == before
+
+        db.delete(rows[0])
+        db.commit()
+        assert _buckets(db) == _recomputed(db)
+        assert ("2026-10-01", "done", 1, 1, 100) not in _buckets(db)
+
+
+def test_the_endpoint_matches_a_full_recount_for_any_period(session_factory):
+    with session_factory() as db:
+        for i, (status, proxy, size, day) in enumerate([
+            (StatusEnum.done, True, 100, 1), (StatusEnum.done, False, 50, 2),
+            (StatusEnum.failed, True, 10, 2), (StatusEnum.stopped, False, 5, 4),
+        ]):
+            db.add(DownloadRequest(url=f"https://example.com/{i}", status=status,
+                                   use_proxy=proxy, total_size=size, requested_at=_day(day)))
+        db.commit()
+
+        stats = get_history_stats(start_date="2026-10-02", end_date="2026-10-04", db=db)
+        assert stats["total"] == 3 and stats["total_bytes"] == 65
+        assert stats["by_status"]["done"] == 1 and stats["by_status"]["failed"] == 1
+        assert stats["proxy_count"] == 1 and stats["local_count"] == 2
+        assert [d["date"] for d in stats["daily_trend"]] == ["2026-10-02", "2026-10-04"]
+
+        everything = get_history_stats(db=db)
+        assert everything["total"] == 4 and everything["success_rate"] == 50.0
+
+
+def test_rebuild_repairs_drift(session_factory):
+    with session_factory() as db:
+        db.add(DownloadRequest(url="https://example.com/a", status=StatusEnum.done,
+                               total_size=10, requested_at=_day(1)))
+        db.commit()
+        expected = _buckets(db)
+
+        db.execute(text("UPDATE download_daily_stats SET count = 99"))
+        db.commit()
+        assert rebuild_history_stats(db=db) == {"success": True, "buckets": 1}
+        assert _buckets(db) == expected
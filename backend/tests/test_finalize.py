@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Tests for moving a finished ``.part`` into place.
+
+With the temp and download folders on different mounts, ``shutil.move`` on the
+event loop was a multi-GB copy that froze the backend. These pin that the move
+is a rename on one device, a fsynced chunked copy with progress across
+devices, and that a failed copy leaves the ``.part`` exactly as it was.
+"""
+
+import errno
+import os
+
+import pytest
+
+import utils.finalize as fin
+
+
+def _part(tmp_path, size):
+    src = tmp_path / "movie.mkv.part"
+    src.write_bytes(os.urandom(size))
+    return src, tmp_path / "movie.mkv"
+
+
+def test_same_device_is_a_rename(tmp_path):
+    src, dst = _part(tmp_path, 1000)
+    data = src.read_bytes()
+
+    assert fin.move_into_place(str(src), str(dst)) == fin.MOVE_RENAME
+    assert not src.exists() and dst.read_bytes() == data
+
+
+def test_cross_device_copies_in_chunks_with_progress(tmp_path, monkeypatch):
+    monkeypatch.setattr(fin, "_same_device", lambda s, d: False)
+    monkeypatch.setattr(fin, "COPY_CHUNK_BYTES", 4096)
+    src, dst = _part(tmp_path, 10_000)
+    data = src.read_bytes()
+    seen = []
+
+    how = fin.move_into_place(str(src), str(dst), lambda c, t: seen.append((c, t)))
+
+    assert how == fin.MOVE_COPY
+    assert dst.read_bytes() == data and not src.exists()
+    assert seen == [(4096, 10_000), (8192, 10_000), (10_000, 10_000)]
+    assert not (tmp_path / ("movie.mkv" + fin.MOVING_SUFFIX)).exists()
+
+
+def test_exdev_rename_falls_back_to_copy(tmp_path, monkeypatch):
+    src, dst = _part(tmp_path, 100)
+    real_replace = os.replace
+    calls = []
+
+    def replace(a, b):
+        calls.append(a)
+        if a == str(src):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        return real_replace(a, b)
+
+    monkeypatch.setattr(fin.os, "replace", replace)
+    assert fin.move_into_place(str(src), str(dst)) == fin.MOVE_COPY
+    assert dst.exists() and not src.exists()
+
+
+def test_a_failed_copy_leaves_the_part_alone(tmp_path, monkeypatch):
+    monkeypatch.setattr(fin, "_same_device", lambda s, d: False)
+    monkeypatch.setattr(fin, "COPY_CHUNK_BYTES", 64)
+    src, dst = _part(tmp_path, 1000)
+    data = src.read_bytes()
+
+    def full_disk(copied, total):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    with pytest.raises(OSError):
+        fin.move_into_place(str(src), str(dst), full_disk)
+
+    assert src.read_bytes() == data
+    assert not dst.exists()
+    assert not (tmp_path / ("movie.mkv" + fin.MOVING_SUFFIX)).exists()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Tests for keyset paging on the grid lists.
+
+Deep pages of /downloads/completed got slower the further back they were: an
+OFFSET walks past every row before the page. These pin the ``after_id`` path
+that replaced it for paging forward — same rows as the offset page, a key for
+the next page, and no key once the last page is reached.
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from core.db import SessionLocal, engine
+from core.models import Base, DownloadRequest, StatusEnum
+from api.routes.history import router as history_router
+
+
+@pytest.fixture(scope="module")
+def client():
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        for i in range(7):
+            db.add(DownloadRequest(url=f"https://example.com/k{i}", file_name=f"k{i}.bin",
+                                   status=StatusEnum.done))
+        db.commit()
+    app = FastAPI()
+    app.include_router(history_router)
+    return TestClient(app)
+
+
+def _page(client, **params):
+    resp = client.get("/api/downloads/completed", params={"page_size": 3, **params})
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def test_after_id_pages_match_offset_pages(client):
+    total_pages = _page(client)["total_pages"]
+    after_id = None
+    for page in range(1, total_pages + 1):
+        by_offset = _page(client, page=page)
+        by_key = by_offset if after_id is None else _page(client, page=page, after_id=after_id)
+        assert [r["id"] for r in by_key["downloads"]] == [r["id"] for r in by_offset["downloads"]]
+        after_id = by_key["next_after_id"]
+    assert after_id is None or _page(client, after_id=after_id)["downloads"] == []
+
+
+def test_rows_carry_only_grid_fields(client):
+    row = _page(client)["downloads"][0]
+    assert "attempts_json" not in row and "save_path" not in row
+    assert row["progress"] == 100.0 and row["updated_seq"]
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Tests for the per-egress connection pools.
+
+Every retry and probe used to open a fresh session and connector — a new DNS
+lookup and TLS handshake to the host it had just talked to. These pin that
+sessions on one egress share one pool, that different egresses do not, and
+that sharing the pool does not mean sharing one download's cookies with another.
+"""
+
+import asyncio
+
+import pytest
+
+from core import http_sessions
+
+
+@pytest.mark.asyncio
+async def test_sessions_on_one_egress_share_a_pool():
+    async with http_sessions.session() as a, http_sessions.session() as b:
+        assert a.connector is b.connector
+        pool = a.connector
+    async with http_sessions.session("10.0.0.1:3128") as proxied:
+        assert proxied.connector is not pool
+    # Closing a session hands the connections back; the pool stays open.
+    assert not pool.closed
+    await http_sessions.close_all()
+
+
+@pytest.mark.asyncio
+async def test_cookies_stay_with_their_download():
+    async with http_sessions.session(cookies={"PHPSESSID": "one"}) as a, \
+            http_sessions.session() as b:
+        assert len(a.cookie_jar) == 1
+        assert len(b.cookie_jar) == 0
+    await http_sessions.close_all()
+
+
+@pytest.mark.asyncio
+async def test_close_all_closes_the_pools():
+    conn = http_sessions.connector()
+    await http_sessions.close_all()
+    assert conn.closed
+    assert http_sessions.connector() is not conn
+    await http_sessions.close_all()
+
+
+@pytest.mark.asyncio
+async def test_proxy_pools_are_capped_least_recently_used_first(monkeypatch):
+    monkeypatch.setattr(http_sessions, "MAX_PROXY_POOLS", 2)
+    direct = http_sessions.connector()
+    first = http_sessions.connector("10.0.0.1:1")
+    second = http_sessions.connector("10.0.0.2:1")
+    http_sessions.connector("10.0.0.1:1")          # used again: now the newest
+    http_sessions.connector("10.0.0.3:1")
+    await asyncio.sleep(0)
+
+    assert second.closed and not first.closed and not direct.closed
+    assert list(http_sessions._connectors) == [http_sessions.EGRESS_DIRECT, "10.0.0.1:1", "10.0.0.3:1"]
+    await http_sessions.close_all()
+
+
+@pytest.mark.asyncio
+async def test_a_failed_proxy_pool_closes_once_idle(monkeypatch):
+    conn = http_sessions.connector("10.0.0.9:8080")
+    monkeypatch.setattr(http_sessions, "_in_use", lambda c: c is conn and busy[0])
+    busy = [True]
+    http_sessions.discard("10.0.0.9:8080")
+    await asyncio.sleep(0)
+    assert not conn.closed and conn in http_sessions._retiring
+    assert http_sessions.connector("10.0.0.9:8080") is not conn
+
+    busy[0] = False
+    http_sessions.connector()                      # any later call sweeps it
+    await asyncio.sleep(0)
+    assert conn.closed and not http_sessions._retiring
+    await http_sessions.close_all()
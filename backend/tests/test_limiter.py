@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Tests for the resizable concurrency limiter.
+
+Saving settings used to swap in a new ``asyncio.Semaphore``: anything already
+waiting on the old one never saw the new limit. These pin that a resize acts
+on the waiters that are already there, that a lowered limit drains instead of
+snatching places back, and that the scheduler starts its queue on a raise.
+"""
+
+import asyncio
+
+import pytest
+
+from core.limiter import ResizableLimiter
+from core.scheduler import DownloadScheduler, QueuedDownload
+
+
+@pytest.mark.asyncio
+async def test_raising_the_capacity_wakes_existing_waiters():
+    limiter = ResizableLimiter(1)
+    await limiter.acquire()
+    waiting = [asyncio.create_task(limiter.acquire()) for _ in range(2)]
+    await asyncio.sleep(0)
+    assert limiter.stats() == {"capacity": 1, "holders": 1, "waiters": 2}
+
+    limiter.resize(3)
+    await asyncio.wait_for(asyncio.gather(*waiting), timeout=1)
+    assert limiter.holders == 3 and limiter.waiters == 0
+
+
+@pytest.mark.asyncio
+async def test_a_lowered_capacity_drains_without_revoking():
+    limiter = ResizableLimiter(3)
+    for _ in range(3):
+        assert limiter.try_acquire()
+
+    limiter.resize(1)
+    assert limiter.holders == 3  # nothing taken back
+    limiter.release()
+    assert not limiter.try_acquire()  # 2 still held, limit is 1
+    limiter.release()
+    limiter.release()
+    assert limiter.try_acquire()
+
+
+@pytest.mark.asyncio
+async def test_a_cancelled_waiter_does_not_keep_a_place():
+    limiter = ResizableLimiter(1)
+    await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    limiter.release()
+    assert limiter.holders == 0
+    assert limiter.try_acquire()
+
+
+def test_raising_the_ceiling_starts_the_queue_at_once():
+    started = []
+    sched = DownloadScheduler(launch=lambda e: started.append(e.req_id), ceiling=1)
+    for i in range(3):
+        sched.submit(QueuedDownload(req_id=i, slot_key=f"host-{i}@direct", limit=2,
+                                    position=float(i)))
+    assert started == [0]
+
+    sched.set_ceiling(3)
+    assert sorted(started) == [0, 1, 2]
@@ -4,10 +4,16 @@
 These never touch the network: the download test encrypts a known plaintext
 with the same AES-CTR scheme MEGA uses, serves it through a fake stream, and
 asserts the module decrypts it back byte-for-byte and validates the MAC.
+
+The chunk-MAC benchmark is opt-in: ``OC_BENCH=1 pytest tests/test_mega.py -k
+benchmark -s`` prints MB/s for the per-block reference and the one-call path.
 """
 
+import asyncio
 import json
 import os
+import struct
+import time
 
 import pytest
 from Crypto.Cipher import AES
@@ -68,6 +74,110 @@ class TestCryptoPrimitives:
             expected_offset += length
 
 
+# ---------------------------------------------------------------------------
+# Chained CBC-MAC
+# ---------------------------------------------------------------------------
+
+def _per_block_meta_mac(data: bytes, aes_key: bytes, iv) -> tuple:
+    """The MAC computed one 16-byte block at a time, as MEGA's reference
+    clients spell it out — what the one-call-per-chunk version must equal."""
+    block_iv = mc.a32_to_bytes((iv[0], iv[1], iv[0], iv[1]))
+    chain = AES.new(aes_key, AES.MODE_CBC, b"\0" * 16)
+    file_mac = b"\0" * 16
+    for offset, length in mc.get_chunks(len(data)):
+        inner = AES.new(aes_key, AES.MODE_CBC, block_iv)
+        block_mac = b"\0" * 16
+        chunk = data[offset:offset + length]
+        for i in range(0, len(chunk), 16):
+            block_mac = inner.encrypt(chunk[i:i + 16].ljust(16, b"\0"))
+        file_mac = chain.encrypt(block_mac)
+    m = mc.bytes_to_a32(file_mac)
+    return (m[0] ^ m[1], m[2] ^ m[3])
+
+
+class TestChainedCbcMac:
+    KEY = bytes(range(16))
+    IV = (0x01234567, 0x89ABCDEF, 0, 0)
+
+    def _mac(self, data):
+        mac = mh._ChainedCbcMac(self.KEY, self.IV)
+        for offset, length in mc.get_chunks(len(data)):
+            mac.update(data[offset:offset + length])
+        return mac.result()
+
+    def test_known_vectors(self):
+        data = bytes(i % 251 for i in range(300_001))
+        assert self._mac(data) == (0x8CE6BA7A, 0x88B81EE2)
+        assert self._mac(b"") == (0x412E60B5, 0xCE87591B)
+
+    @pytest.mark.parametrize("size", [1, 15, 16, 17, 0x20000, 0x20000 + 5, 1_500_003])
+    def test_matches_the_per_block_mac(self, size):
+        data = os.urandom(size)
+        assert self._mac(data) == _per_block_meta_mac(data, self.KEY, self.IV)
+
+    # A file key laid out as MEGA's uploader builds it — words 0-3 are the AES
+    # key folded with the IV and meta-MAC, 4-5 the IV, 6-7 the meta-MAC — for
+    # _FILE_KEY_CONTENT below. The MAC was computed by _sdk_meta_mac, which
+    # shares no code with the module (its own chunk boundaries, struct instead
+    # of mega_crypto). No real MEGA file could be fetched where this was
+    # written; a captured one belongs next to it.
+    FILE_KEY = (0xE23B7DEA, 0x51FBADB4, 0x5AC4D22F, 0x6904F87B,
+                0x71FF1A09, 0x2C4B6A10, 0x8B7AEDAE, 0x6856332D)
+
+    def test_a_file_key_vector_validates(self):
+        data = _file_key_content()
+        aes_key, iv, meta_mac = mc.unpack_file_key(self.FILE_KEY)
+        key = mc.a32_to_bytes(aes_key)
+        assert _sdk_meta_mac(data, key, iv) == meta_mac
+
+        mac = mh._ChainedCbcMac(key, iv)
+        for offset, length in mc.get_chunks(len(data)):
+            mac.update(data[offset:offset + length])
+        assert mac.result() == meta_mac
+
+    @pytest.mark.skipif(not os.environ.get("OC_BENCH"),
+                        reason="benchmark; set OC_BENCH=1 to run")
+    def test_benchmark_one_call_per_chunk(self):
+        """``OC_BENCH=1 pytest tests/test_mega.py -k benchmark -s``"""
+        data = os.urandom(16 * 0x100000)
+        timings, results = {}, {}
+        for name, fn in (("per-block", lambda: _per_block_meta_mac(data, self.KEY, self.IV)),
+                         ("per-chunk", lambda: self._mac(data))):
+            started = time.perf_counter()
+            results[name] = fn()
+            timings[name] = time.perf_counter() - started
+            print(f"[BENCH] {name}: {len(data) / timings[name] / 1e6:.1f} MB/s")
+        assert results["per-chunk"] == results["per-block"]
+        assert timings["per-chunk"] * 10 < timings["per-block"]
+
+
+def _file_key_content() -> bytes:
+    """5 MiB + 7 bytes: every chunk size up to 1 MiB, then a short tail."""
+    return bytes((i * 7 + 3) & 0xFF for i in range(5 * 0x100000 + 7))
+
+
+def _sdk_meta_mac(data: bytes, aes_key: bytes, iv) -> tuple:
+    """The meta-MAC as MEGA's SDK computes it, written from its description
+    rather than from this module: chunk ``k`` (from 1) is ``min(k, 8) * 128 KiB``
+    long, each chunk's CBC-MAC starts from ``iv_hi, iv_lo, iv_hi, iv_lo``."""
+    ends, end, k = [], 0, 1
+    while end < len(data):
+        end = min(end + min(k, 8) * 0x20000, len(data))
+        ends.append(end)
+        k += 1
+    block_iv = struct.pack(">IIII", iv[0], iv[1], iv[0], iv[1])
+    chain = AES.new(aes_key, AES.MODE_CBC, b"\0" * 16)
+    file_mac, start = b"\0" * 16, 0
+    for end in ends or [0]:
+        inner = AES.new(aes_key, AES.MODE_CBC, block_iv)
+        chunk_mac = b"\0" * 16
+        for i in range(start, end, 16):
+            chunk_mac = inner.encrypt(data[i:min(i + 16, end)].ljust(16, b"\0"))
+        file_mac, start = chain.encrypt(chunk_mac), end
+    w = struct.unpack(">IIII", file_mac)
+    return (w[0] ^ w[1], w[2] ^ w[3])
+
+
 # ---------------------------------------------------------------------------
 # parse_mega_url
 # ---------------------------------------------------------------------------
@@ -84,8 +194,10 @@ class TestParseUrl:
         assert key == "VbkkCyKey"
 
     def test_folder_link_rejected(self):
+        # A folder is not one file: it is listed and queued per file instead.
         with pytest.raises(ValueError):
             mh.parse_mega_url("https://mega.nz/folder/AbCd#key")
+        assert mh.is_mega_folder_url("https://mega.nz/folder/AbCd#key")
 
     def test_missing_key_rejected(self):
         with pytest.raises(ValueError):
@@ -127,8 +239,9 @@ class _FakeStream:
 
 
 class _FakeResponse:
-    def __init__(self, data: bytes):
+    def __init__(self, data: bytes, status: int = 200):
         self.content = _FakeStream(data)
+        self.status = status
 
     def raise_for_status(self):
         pass
@@ -141,10 +254,20 @@ class _FakeResponse:
 
 
 class _FakeSession:
-    def __init__(self, data: bytes):
-        self._data = data
+    """Serves ``data``, honouring ``Range: bytes=N-`` unless told not to."""
 
-    def get(self, url, **kwargs):
+    def __init__(self, data: bytes, honour_range: bool = True):
+        self._data = data
+        self._honour_range = honour_range
+        self.ranges = []
+
+    def get(self, url, headers=None, **kwargs):
+        requested = (headers or {}).get("Range")
+        self.ranges.append(requested)
+        if requested and self._honour_range:
+            first, _, last = requested[len("bytes="):].partition("-")
+            end = int(last) + 1 if last else len(self._data)
+            return _FakeResponse(self._data[int(first):end], status=206)
         return _FakeResponse(self._data)
 
 
@@ -187,6 +310,31 @@ async def test_streaming_decrypt_roundtrip(tmp_path):
     assert progress[-1] == (len(plaintext), len(plaintext))
 
 
+@pytest.mark.asyncio
+async def test_decrypt_and_mac_run_off_the_loop(tmp_path, monkeypatch, capsys):
+    import threading
+
+    aes_key = mc.a32_to_bytes((5, 6, 7, 8))
+    iv = (9, 10, 0, 0)
+    plaintext = os.urandom(600_000)
+    info = mh.MegaFileInfo(
+        download_url="x", size=len(plaintext), name="t.bin",
+        aes_key=aes_key, iv=iv, meta_mac=_expected_meta_mac(plaintext, aes_key, iv),
+    )
+    threads = set()
+    real_update = mh._ChainedCbcMac.update
+    monkeypatch.setattr(mh._ChainedCbcMac, "update",
+                        lambda self, chunk: threads.add(threading.get_ident()) or real_update(self, chunk))
+
+    await mh.download_mega_file(
+        _FakeSession(_encrypt_ctr(plaintext, aes_key, iv)), info, str(tmp_path / "t.bin"),
+    )
+
+    assert (tmp_path / "t.bin").read_bytes() == plaintext
+    assert threads and threading.get_ident() not in threads
+    assert "MAC 불일치" not in capsys.readouterr().out
+
+
 @pytest.mark.asyncio
 async def test_streaming_decrypt_cancel(tmp_path):
     aes_key = mc.a32_to_bytes((1, 2, 3, 4))
@@ -196,7 +344,7 @@ async def test_streaming_decrypt_cancel(tmp_path):
         download_url="x", size=len(plaintext), name="c.bin",
         aes_key=aes_key, iv=iv, meta_mac=(0, 0),
     )
-    with pytest.raises(__import__("asyncio").CancelledError):
+    with pytest.raises(asyncio.CancelledError):
         await mh.download_mega_file(
             _FakeSession(_encrypt_ctr(plaintext, aes_key, iv)),
             info, str(tmp_path / "c.bin"),
@@ -204,6 +352,162 @@ async def test_streaming_decrypt_cancel(tmp_path):
         )
 
 
+def _resume_fixture(size=700_000):
+    aes_key = mc.a32_to_bytes((3, 1, 4, 1))
+    iv = (5, 9, 0, 0)
+    plaintext = os.urandom(size)
+    info = mh.MegaFileInfo(
+        download_url="x", size=size, name="r.bin",
+        aes_key=aes_key, iv=iv, meta_mac=_expected_meta_mac(plaintext, aes_key, iv),
+    )
+    return info, plaintext, _encrypt_ctr(plaintext, aes_key, iv)
+
+
+async def _interrupted(tmp_path, info, encrypted, stop_after):
+    """Run a download that is stopped once ``stop_after`` bytes were read."""
+    dest = tmp_path / "r.bin"
+    seen = [0]
+    with pytest.raises(asyncio.CancelledError):
+        await mh.download_mega_file(
+            _FakeSession(encrypted), info, str(dest),
+            progress_cb=lambda d, t: seen.__setitem__(0, d),
+            is_cancelled=lambda: seen[0] >= stop_after,
+        )
+    return dest
+
+
+@pytest.mark.asyncio
+async def test_a_stopped_download_resumes_where_it_stopped(tmp_path, capsys):
+    info, plaintext, encrypted = _resume_fixture()
+    dest = await _interrupted(tmp_path, info, encrypted, stop_after=300_000)
+    offset, _ = mh.load_mac_state(str(dest), info)
+    assert offset in {o for o, _ in mc.get_chunks(info.size)} and offset >= 300_000
+
+    session = _FakeSession(encrypted)
+    progress = []
+    written = await mh.download_mega_file(session, info, str(dest),
+                                          progress_cb=lambda d, t: progress.append(d))
+
+    assert session.ranges == [f"bytes={offset}-"]
+    assert progress[0] == offset
+    assert written == info.size and dest.read_bytes() == plaintext
+    out = capsys.readouterr().out
+    assert "이어받기" in out and "MAC 불일치" not in out
+    assert not os.path.exists(mh.mac_state_path(str(dest)))
+
+
+@pytest.mark.asyncio
+async def test_a_server_ignoring_the_range_restarts_from_zero(tmp_path, capsys):
+    info, plaintext, encrypted = _resume_fixture()
+    dest = await _interrupted(tmp_path, info, encrypted, stop_after=300_000)
+
+    session = _FakeSession(encrypted, honour_range=False)
+    written = await mh.download_mega_file(session, info, str(dest))
+
+    assert session.ranges[0] is not None
+    assert written == info.size and dest.read_bytes() == plaintext
+    assert "MAC 불일치" not in capsys.readouterr().out
+
+
+@pytest.mark.asyncio
+async def test_a_sidecar_for_another_file_is_ignored(tmp_path):
+    info, plaintext, encrypted = _resume_fixture()
+    dest = await _interrupted(tmp_path, info, encrypted, stop_after=300_000)
+    other = mh.MegaFileInfo(**{**info.__dict__, "aes_key": bytes(16)})
+    assert mh.load_mac_state(str(dest), other) is None
+
+    # Nor is one that claims more bytes than the .part holds.
+    with open(dest, "r+b") as fh:
+        fh.truncate(100)
+    assert mh.load_mac_state(str(dest), info) is None
+
+    session = _FakeSession(encrypted)
+    await mh.download_mega_file(session, info, str(dest))
+    assert session.ranges == [None] and dest.read_bytes() == plaintext
+
+
+class TestParallelFetch:
+    """Chunk groups over several ranged requests, MAC chained in file order."""
+
+    @pytest.fixture(autouse=True)
+    def small_groups(self, monkeypatch):
+        monkeypatch.setattr(mh, "MEGA_GROUP_BYTES", 512 * 1024)
+
+    def test_groups_are_whole_chunks_covering_the_rest(self):
+        size = 5_000_000
+        groups = mh.chunk_groups(size, start=393_216)
+        flat = [chunk for group in groups for chunk in group]
+        assert flat == [c for c in mc.get_chunks(size) if c[0] >= 393_216]
+        assert all(sum(length for _, length in group) >= 512 * 1024 for group in groups[:-1])
+
+    @pytest.mark.asyncio
+    async def test_out_of_order_groups_decrypt_and_validate(self, tmp_path, capsys, monkeypatch):
+        import threading
+
+        info, plaintext, encrypted = _resume_fixture(size=4_000_000)
+        session = _FakeSession(encrypted)
+        real_get = session.get
+        threads = set()
+        real_decrypt = mh._ctr_cipher
+
+        def slow_first_group(url, headers=None, **kwargs):
+            response = real_get(url, headers=headers, **kwargs)
+            if headers["Range"].startswith("bytes=0-"):
+                read = response.content.read
+
+                async def late_read(n):
+                    await asyncio.sleep(0.05)
+                    return await read(n)
+                response.content.read = late_read
+            return response
+
+        def tracked(info, offset):
+            threads.add(threading.get_ident())
+            return real_decrypt(info, offset)
+
+        session.get = slow_first_group
+        monkeypatch.setattr(mh, "_ctr_cipher", tracked)
+        written = await mh.download_mega_file(session, info, str(tmp_path / "p.bin"), connections=4)
+
+        assert written == info.size
+        assert (tmp_path / "p.bin").read_bytes() == plaintext
+        assert len(session.ranges) == len(mh.chunk_groups(info.size)) > 4
+        assert all(r.count("-") == 1 and not r.endswith("-") for r in session.ranges)
+        assert threads and threading.get_ident() not in threads
+        assert "MAC 불일치" not in capsys.readouterr().out
+
+    @pytest.mark.asyncio
+    async def test_ignored_ranges_fall_back_to_one_stream(self, tmp_path, capsys):
+        info, plaintext, encrypted = _resume_fixture(size=2_000_000)
+        session = _FakeSession(encrypted, honour_range=False)
+        await mh.download_mega_file(session, info, str(tmp_path / "f.bin"), connections=4)
+
+        assert (tmp_path / "f.bin").read_bytes() == plaintext
+        assert session.ranges[-1] is None
+        out = capsys.readouterr().out
+        assert "단일 연결" in out and "MAC 불일치" not in out
+
+    @pytest.mark.asyncio
+    async def test_a_stopped_parallel_download_resumes_from_its_prefix(self, tmp_path, capsys):
+        info, plaintext, encrypted = _resume_fixture(size=8_000_000)
+        dest = tmp_path / "s.bin"
+        seen = [0]
+        with pytest.raises(asyncio.CancelledError):
+            await mh.download_mega_file(
+                _FakeSession(encrypted), info, str(dest), connections=4,
+                progress_cb=lambda d, t: seen.__setitem__(0, d),
+                is_cancelled=lambda: seen[0] >= 3_000_000,
+            )
+        offset, _ = mh.load_mac_state(str(dest), info)
+        assert 0 < offset < info.size
+
+        session = _FakeSession(encrypted)
+        await mh.download_mega_file(session, info, str(dest), connections=4)
+        assert dest.read_bytes() == plaintext
+        assert min(int(r[len("bytes="):].split("-")[0]) for r in session.ranges) == offset
+        assert "MAC 불일치" not in capsys.readouterr().out
+
+
 class TestErrorClassification:
     """MegaApiError → message → central classifier must land on the right kind."""
 
@@ -226,6 +530,7 @@ class TestErrorClassification:
         assert mh.is_mega_url("https://mega.nz/file/abc#key")
         assert mh.is_mega_url("https://mega.nz/#!abc!key")
         assert not mh.is_mega_url("https://mega.nz/folder/abc#key")
+        assert mh.is_mega_url("https://mega.nz/folder/abc#key/file/h1")
         assert not mh.is_mega_url("https://1fichier.com/?x")
 
 
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Tests for the off-loop ``.part`` writer.
+
+Inline ``f.write`` on the HDD stripe stalled the event loop for every download
+at once. The writer thread fixes that only if it keeps three promises: bytes
+land where they were addressed, a disk that falls behind slows the reader down
+instead of filling memory, and a full disk still fails the download with the
+same "disk full" message the inline write produced.
+"""
+
+import asyncio
+import errno
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import utils.file_helpers as fh
+from utils.part_writer import PartWriter
+
+
+@pytest.mark.asyncio
+async def test_buffers_land_at_their_offsets(tmp_path):
+    path = str(tmp_path / "a.bin.part")
+    async with PartWriter(path, truncate_to=0) as writer:
+        await writer.write(b"world", 5)
+        await writer.write(b"hello", 0)
+        await writer.write(b"!", 10)
+    assert open(path, "rb").read() == b"helloworld!"
+
+
+@pytest.mark.asyncio
+async def test_truncate_drops_bytes_past_the_resume_point(tmp_path):
+    path = tmp_path / "a.bin.part"
+    path.write_bytes(b"0123456789")
+    async with PartWriter(str(path), truncate_to=4) as writer:
+        await writer.write(b"ab", 4)
+    assert path.read_bytes() == b"0123ab"
+
+
+@pytest.mark.asyncio
+async def test_a_slow_disk_holds_the_reader_back(tmp_path, monkeypatch):
+    gate = threading.Event()
+    real_write = PartWriter._write
+
+    def slow_write(self, fh_, offset, parts, size):
+        gate.wait(5)
+        real_write(self, fh_, offset, parts, size)
+
+    monkeypatch.setattr(PartWriter, "_write", slow_write)
+    path = str(tmp_path / "a.bin.part")
+    writer = PartWriter(path, truncate_to=0, max_pending_bytes=8)
+    await writer.start()
+    await writer.write(b"12345678", 0)
+
+    second = asyncio.create_task(writer.write(b"9", 8))
+    await asyncio.sleep(0.05)
+    assert not second.done()  # over budget: the socket read waits here
+
+    gate.set()
+    await asyncio.wait_for(second, 2)
+    await writer.close()
+    assert open(path, "rb").read() == b"123456789"
+
+
+class _FullDisk:
+    def __init__(self, *a, **kw):
+        pass
+
+    def truncate(self, _):
+        pass
+
+    def seek(self, _):
+        pass
+
+    def write(self, _):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    def close(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_write_error_comes_back_as_the_original_oserror(tmp_path, monkeypatch):
+    monkeypatch.setattr(PartWriter, "_open", lambda self: _FullDisk())
+    writer = PartWriter(str(tmp_path / "a.bin.part"))
+    await writer.start()
+    await writer.write(b"x", 0)
+    with pytest.raises(OSError) as excinfo:
+        await writer.close()
+    assert excinfo.value.errno == errno.ENOSPC
+
+
+class _Stream:
+    def __init__(self, chunks):
+        self._chunks = list(chunks)
+
+    async def read(self, _n):
+        return self._chunks.pop(0) if self._chunks else b""
+
+
+class _Query:
+    def filter(self, *a):
+        return self
+
+    def all(self):
+        return []
+
+
+class _Db:
+    def query(self, *a):
+        return _Query()
+
+    def commit(self):
+        pass
+
+    def refresh(self, _):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_full_disk_still_fails_the_download_with_the_disk_full_message(tmp_path, monkeypatch):
+    monkeypatch.setattr(PartWriter, "_open", lambda self: _FullDisk())
+    response = SimpleNamespace(content=_Stream([b"a" * 10, b"b" * 10]))
+    req = SimpleNamespace(id=1, status=None, downloaded_size=0)
+
+    with pytest.raises(Exception) as excinfo:
+        await fh.download_file_content(response, str(tmp_path / "a.part"), 0, 20, req, _Db())
+
+    assert "디스크" in str(excinfo.value) or "disk" in str(excinfo.value).lower()
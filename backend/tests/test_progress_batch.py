@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Tests for the batched progress ticker.
+
+Each transfer used to schedule its own ``status_update`` broadcast on its own
+timer; thirty downloads and a few tabs were a steady stream of tasks and
+repeated JSON encoding. These pin the replacement: transfers only record, one
+tick sends every row that moved as a single ``progress_batch`` frame, and rows
+that did not move — or whose download already ended — are not sent.
+"""
+
+from unittest.mock import AsyncMock
+
+import pytest
+
+from core import live_progress
+
+
+def _reset():
+    live_progress.take_changed()
+    for i in (1, 2, 3):
+        live_progress.clear(i)
+
+
+def test_only_rows_that_moved_are_taken():
+    _reset()
+    live_progress.record_progress(1, 100, 1000, 50)
+    live_progress.record_progress(2, 0, 0, 0)
+    rows = live_progress.take_changed()
+    assert [r["id"] for r in rows] == [1, 2]
+    assert rows[0]["progress"] == 10.0 and rows[0]["status"] == "downloading"
+
+    live_progress.record_progress(1, 100, 1000, 50)  # unchanged
+    live_progress.record_progress(2, 10, 0, 5)
+    assert [r["id"] for r in live_progress.take_changed()] == [2]
+    assert live_progress.take_changed() == []
+
+
+def test_a_cleared_download_sends_no_late_row():
+    _reset()
+    live_progress.record_progress(3, 500, 1000, 10)
+    live_progress.clear(3)
+    assert live_progress.take_changed() == []
+    assert live_progress.speed_of(3) == 0
+
+
+@pytest.mark.asyncio
+async def test_the_final_status_drops_the_last_progress_row():
+    from core.download_core import DownloadCore
+
+    _reset()
+    live_progress.record_progress(1, 1000, 1000, 80)   # the transfer's last record
+    live_progress.record_progress(2, 10, 1000, 80)
+    await DownloadCore().send_download_update(1, {"status": "done", "progress": 100})
+    await DownloadCore().send_download_update(2, {"status": "downloading", "progress": 1})
+    assert [r["id"] for r in live_progress.take_changed()] == [2]
+    _reset()
+
+
+def test_interval_is_clamped():
+    try:
+        assert live_progress.set_interval(0) == live_progress.MIN_INTERVAL_SEC
+        assert live_progress.set_interval("bogus") == live_progress.DEFAULT_INTERVAL_SEC
+        assert live_progress.set_interval(2.5) == 2.5
+    finally:
+        live_progress.set_interval(live_progress.DEFAULT_INTERVAL_SEC)
+
+
+@pytest.mark.asyncio
+async def test_one_frame_per_tick(monkeypatch):
+    import services.download_service as ds
+
+    _reset()
+    broadcast = AsyncMock()
+    monkeypatch.setattr(ds.sse_manager, "broadcast_message", broadcast)
+    service = ds.DownloadService()
+
+    live_progress.record_progress(1, 1, 10, 1)
+    live_progress.record_progress(2, 2, 10, 1)
+    assert await service.flush_progress() == 2
+    assert await service.flush_progress() == 0
+
+    broadcast.assert_awaited_once()
+    kind, rows = broadcast.await_args.args
+    assert kind == "progress_batch" and {r["id"] for r in rows} == {1, 2}
+    _reset()
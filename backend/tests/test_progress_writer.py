@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Tests for the group-commit progress writer.
+
+Every running download committed its own ``downloaded_size`` every few seconds,
+each commit a separate trip for SQLite's write lock. These pin the writer that
+replaced them: many marks become one transaction, a late mark never lowers a
+final count, and a single download's value can be flushed on its own.
+
+An attempt that starts over from 0 (Range answered with 200, a refused MEGA
+resume) used to freeze at the previous attempt's count until it passed it;
+begin() lets the new attempt's first value through.
+"""
+
+from sqlalchemy import create_engine, text
+
+from core import progress_writer
+
+
+def _engine(tmp_path, rows, status="downloading"):
+    engine = create_engine(f"sqlite:///{tmp_path / 'w.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE download_requests "
+                          "(id INTEGER PRIMARY KEY, downloaded_size INTEGER, updated_seq INTEGER, "
+                          "status VARCHAR)"))
+        conn.execute(text("CREATE TABLE download_tombstones (id INTEGER PRIMARY KEY, deleted_seq INTEGER)"))
+        for row_id, size in rows.items():
+            conn.execute(text("INSERT INTO download_requests (id, downloaded_size, status) VALUES (:i, :s, :st)"),
+                         {"i": row_id, "s": size, "st": status})
+    return engine
+
+
+def _sizes(engine):
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT id, downloaded_size FROM download_requests")).all()
+        return {row_id: size for row_id, size in rows}
+
+
+def test_marks_are_written_in_one_flush(tmp_path):
+    for i in list(progress_writer.pending()):
+        progress_writer.discard(i)
+    engine = _engine(tmp_path, {1: 0, 2: None, 3: 0})
+    progress_writer.mark(1, 100)
+    progress_writer.mark(2, 50)
+    progress_writer.mark(1, 200)  # only the latest counts
+
+    assert progress_writer.flush_sync(engine=engine) == 2
+    assert _sizes(engine) == {1: 200, 2: 50, 3: 0}
+    with engine.connect() as conn:
+        seqs = dict(conn.execute(text("SELECT id, updated_seq FROM download_requests")).all())
+    assert seqs[1] and seqs[2] and seqs[1] != seqs[2] and seqs[3] is None
+    assert progress_writer.flush_sync(engine=engine) == 0
+
+
+def test_a_late_mark_never_lowers_the_final_count(tmp_path):
+    engine = _engine(tmp_path, {1: 1000})
+    progress_writer.mark(1, 900)
+    progress_writer.flush_sync(engine=engine)
+    assert _sizes(engine)[1] == 1000
+
+
+def test_flushing_one_download_leaves_the_others_marked(tmp_path):
+    engine = _engine(tmp_path, {1: 0, 2: 0})
+    progress_writer.mark(1, 10)
+    progress_writer.mark(2, 20)
+
+    assert progress_writer.flush_sync([2], engine=engine) == 1
+    assert _sizes(engine) == {1: 0, 2: 20}
+    assert progress_writer.pending() == {1: 10}
+    progress_writer.discard(1)
+
+
+def test_a_restarted_attempt_writes_its_count_from_zero(tmp_path):
+    engine = _engine(tmp_path, {1: 900})
+    progress_writer.mark(1, 950)  # left over from the previous attempt
+    progress_writer.begin(1)
+    progress_writer.mark(1, 100)
+    progress_writer.flush_sync(engine=engine)
+    assert _sizes(engine)[1] == 100
+
+    # From there on the attempt is back under the never-lower rule.
+    progress_writer.mark(1, 50)
+    progress_writer.flush_sync(engine=engine)
+    assert _sizes(engine)[1] == 100
+
+
+def test_a_new_attempt_never_lowers_a_finished_row(tmp_path):
+    engine = _engine(tmp_path, {1: 1000}, status="done")
+    progress_writer.begin(1)
+    progress_writer.mark(1, 10)
+    progress_writer.flush_sync(engine=engine)
+    assert _sizes(engine)[1] == 1000
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Query plans of the hot download queries.
+
+The pending sweeps, the retry sweep, the working/completed tabs, stop-all and
+restart-failed all filter on ``status``, and every add looked for a completed
+duplicate by ``url``/``original_url`` — yet none of those columns was
+indexed, so each of them read the whole history. These run every hot query
+against a database shaped like a real one (almost all rows done) after the
+schema steps and their ANALYZE, and check SQLite's ``EXPLAIN QUERY PLAN``: an
+index search, never a full scan.
+"""
+
+import datetime
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from core import schema_versions
+from core.url_key import normalize_url
+from core.models import Base, DownloadRequest, StatusEnum
+from api.routes.downloads import _find_completed_duplicate
+from api.routes.history import get_completed_downloads, get_working_downloads
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'p.db'}")
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        for i in range(3000):
+            url = f"https://1fichier.com/?done{i}"
+            db.add(DownloadRequest(url=url, original_url=url if i % 3 == 0 else None,
+                                   status=StatusEnum.done))
+        for i, status in enumerate([StatusEnum.pending, StatusEnum.failed,
+                                    StatusEnum.stopped, StatusEnum.downloading] * 5):
+            db.add(DownloadRequest(url=f"https://example.com/w{i}", status=status))
+        db.commit()
+    schema_versions.upgrade(engine)
+    return engine
+
+
+def _plan(engine, statement, params=()):
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", params).all()
+    return [row[3] for row in rows]
+
+
+def _plan_of_query(engine, query):
+    return _plan(engine, str(query.statement.compile(
+        engine, compile_kwargs={"literal_binds": True})))
+
+
+def _plans_of_calls(engine, call):
+    """Plans of the SELECTs ``call(session)`` runs against download_requests."""
+    seen = []
+
+    def capture(conn, cursor, statement, params, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "download_requests" in statement:
+            seen.append((statement, params))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        with sessionmaker(bind=engine)() as db:
+            call(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    assert seen
+    return [_plan(engine, statement, params) for statement, params in seen]
+
+
+def _uses_an_index(plan):
+    return all(" USING " in step for step in plan if step.startswith(("SCAN", "SEARCH")))
+
+
+def test_schema_steps_run_once(engine):
+    with engine.connect() as conn:
+        assert schema_versions.current_version(conn) == schema_versions.STEPS[-1][0]
+        assert conn.execute(text("SELECT COUNT(*) FROM sqlite_stat1")).scalar() > 0
+    assert schema_versions.upgrade(engine) == 0
+
+
+def test_duplicate_check_probes_the_url_indexes(engine):
+    for plan in _plans_of_calls(engine, lambda db: _find_completed_duplicate(db, "https://1fichier.com/?done7")):
+        assert _uses_an_index(plan), plan
+        assert any("ix_download_requests_url_hash" in step for step in plan)
+        assert any("ix_download_requests_original_url" in step for step in plan)
+
+
+@pytest.mark.parametrize("route", [get_working_downloads, get_completed_downloads])
+def test_grid_tabs_search_by_status(engine, route):
+    plans = _plans_of_calls(engine, lambda db: route(db=db, page=1, page_size=10))
+    for plan in plans:
+        assert _uses_an_index(plan), plan
+
+
+def test_completed_tab_needs_no_sort(engine):
+    plans = _plans_of_calls(engine, lambda db: get_completed_downloads(db=db, page=1, page_size=10))
+    assert not any("TEMP B-TREE" in step for plan in plans for step in plan)
+
+
+def test_status_sweeps_search_by_status(engine):
+    now = datetime.datetime.now()
+    with sessionmaker(bind=engine)() as db:
+        queries = {
+            "pending sweep": db.query(DownloadRequest).filter(
+                DownloadRequest.status == StatusEnum.pending,
+            ).order_by(DownloadRequest.requested_at.asc()),
+            "retry sweep": db.query(DownloadRequest).filter(
+                DownloadRequest.status.in_([StatusEnum.failed, StatusEnum.pending]),
+                DownloadRequest.next_retry_at.isnot(None),
+                DownloadRequest.next_retry_at <= now,
+            ).order_by(DownloadRequest.next_retry_at.asc()),
+            "stop-all": db.query(DownloadRequest).filter(
+                DownloadRequest.status.in_([StatusEnum.pending, StatusEnum.downloading, StatusEnum.parsing]),
+            ),
+            "restart-failed": db.query(DownloadRequest).filter(
+                DownloadRequest.status.in_([StatusEnum.failed, StatusEnum.stopped]),
+            ),
+        }
+        for name, query in queries.items():
+            plan = _plan_of_query(engine, query)
+            assert _uses_an_index(plan), (name, plan)
+
+        plan = _plan_of_query(engine, queries["pending sweep"])
+        assert not any("TEMP B-TREE" in step for step in plan), plan
+
+
+def test_duplicate_check_matches_the_same_link_written_differently(engine, tmp_path):
+    saved = tmp_path / "f.bin"
+    saved.write_bytes(b"x")
+    with sessionmaker(bind=engine)() as db:
+        row = DownloadRequest(url="https://Example.com/file/abc/", status=StatusEnum.done,
+                              save_path=str(saved))
+        db.add(row)
+        db.commit()
+        assert _find_completed_duplicate(db, "https://example.com/file/abc#top").id == row.id
+        assert _find_completed_duplicate(db, "https://example.com/file/abcd") is None
+
+
+def test_duplicate_check_tells_legacy_mega_links_apart(engine, tmp_path):
+    # Both are https://mega.nz/ without the fragment — the file is after the #.
+    saved = tmp_path / "m.bin"
+    saved.write_bytes(b"x")
+    with sessionmaker(bind=engine)() as db:
+        row = DownloadRequest(url="https://mega.nz/#!aaaaaaaa!key1", status=StatusEnum.done,
+                              save_path=str(saved))
+        db.add(row)
+        db.commit()
+        assert _find_completed_duplicate(db, "https://MEGA.nz/#!aaaaaaaa!key1").id == row.id
+        assert _find_completed_duplicate(db, "https://mega.nz/#!bbbbbbbb!key2") is None
+        # Only MEGA's own hosts keep the fragment.
+        assert normalize_url("https://omega.io/a#x") == "https://omega.io/a"
+        assert normalize_url("https://www.mega.co.nz/#!a!k") == "https://www.mega.co.nz/#!a!k"
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Tests for the download scheduler.
+
+A 2,000-row backlog used to be 2,000 tasks parked on semaphores, started in
+whatever order the semaphores woke them. These pin what replaced that: nothing
+starts beyond the slots, the order is pins → priority → (size) → position, a
+reorder only swaps places among the ids it names, and a busy host cannot take
+the whole global ceiling while another host waits.
+"""
+
+from core.scheduler import DownloadScheduler, ORDER_SMALLEST_FIRST, QueuedDownload
+
+
+def _scheduler(ceiling=8, order="fifo"):
+    started = []
+    sched = DownloadScheduler(launch=lambda e: started.append(e.req_id),
+                              ceiling=ceiling, order=lambda: order)
+    return sched, started
+
+
+def _entry(req_id, key="host-a@direct", limit=1, **kw):
+    kw.setdefault("position", float(req_id))
+    return QueuedDownload(req_id=req_id, slot_key=key, limit=limit, **kw)
+
+
+def test_a_backlog_starts_only_what_the_slot_allows():
+    sched, started = _scheduler()
+    for i in range(2000):
+        sched.submit(_entry(i, limit=2))
+
+    assert started == [0, 1]
+    assert sched.snapshot()["queued"] == 1998
+
+    sched.finished(0)
+    assert started == [0, 1, 2]
+
+
+def test_pins_then_priority_then_position():
+    sched, started = _scheduler()
+    sched.submit(_entry(1))  # takes the only place
+    sched.submit(_entry(2))
+    sched.submit(_entry(3, priority=5))
+    sched.submit(_entry(4))
+    sched.update(4, pinned=True)
+
+    for running in (1, 4, 3):
+        sched.finished(running)
+    assert started == [1, 4, 3, 2]
+
+
+def test_smallest_first_puts_unknown_sizes_last():
+    sched, started = _scheduler(order=ORDER_SMALLEST_FIRST)
+    sched.submit(_entry(1))
+    sched.submit(_entry(2, size=0))
+    sched.submit(_entry(3, size=50))
+    sched.submit(_entry(4, size=10))
+
+    for running in (1, 4, 3):
+        sched.finished(running)
+    assert started == [1, 4, 3, 2]
+
+
+def test_reorder_swaps_only_the_listed_places():
+    sched, started = _scheduler()
+    sched.submit(_entry(1))
+    for i in (2, 3, 4, 5):
+        sched.submit(_entry(i))
+
+    moved = sched.reorder([4, 2])
+    assert moved == {4: 2.0, 2: 4.0}
+    assert sched.snapshot()["slots"][0]["queued"] == [4, 3, 2, 5]
+
+
+def test_hosts_take_turns_under_the_ceiling():
+    sched, started = _scheduler(ceiling=2)
+    for i in range(4):
+        sched.submit(_entry(i, key="busy@direct", limit=4))
+    sched.submit(_entry(10, key="quiet@direct", limit=4))
+    assert started == [0, 1]
+
+    sched.finished(0)
+    assert started[-1] == 10, "the waiting host gets the freed place first"
+
+
+def test_a_discarded_entry_never_starts():
+    sched, started = _scheduler()
+    sched.submit(_entry(1))
+    sched.submit(_entry(2))
+    sched.discard(2)
+
+    sched.finished(1)
+    assert started == [1]
+    assert sched.snapshot()["slots"] == []
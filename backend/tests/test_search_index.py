@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Tests for the full-text grid search.
+
+The search box ran ``ILIKE '%term%'`` on two columns for the page and again
+for its COUNT — two full scans per keystroke. These pin the FTS5 index that
+replaced it: release-style names are found by any of their words, the
+triggers keep renames and deletes in step, and a database without the index
+still searches the old way.
+"""
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from core import schema_versions, search_index
+from core.models import Base, DownloadRequest, StatusEnum
+from api.routes.history import get_completed_downloads
+
+
+def _engine(path, with_index=True):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    if with_index:
+        schema_versions.upgrade(engine)
+    return engine
+
+
+def _found(db, term):
+    page = get_completed_downloads(db=db, page=1, page_size=50, search=term)
+    assert page["total_count"] == len(page["downloads"])
+    return sorted(row["id"] for row in page["downloads"])
+
+
+@pytest.fixture
+def db(tmp_path):
+    with sessionmaker(bind=_engine(tmp_path / "s.db"))() as session:
+        yield session
+
+
+def _add(db, file_name, url="https://1fichier.com/?abc"):
+    row = DownloadRequest(url=url, file_name=file_name, status=StatusEnum.done)
+    db.add(row)
+    db.commit()
+    return row.id
+
+
+def test_release_names_are_found_by_word_and_prefix(db):
+    nsp = _add(db, "Foo.Bar-NSP-ES.part1.rar")
+    other = _add(db, "Other_Show.S01E02.mkv", url="https://example.com/d/xyz987")
+
+    assert _found(db, "bar nsp") == [nsp]
+    assert _found(db, "Foo.Bar") == [nsp]
+    assert _found(db, "part") == [nsp]
+    assert _found(db, "s01e02") == [other]
+    assert _found(db, "xyz987") == [other]
+    assert _found(db, "nsp other") == []
+
+
+def test_renames_and_deletes_reach_the_index(db):
+    row_id = _add(db, "Old.Name.zip")
+    row = db.get(DownloadRequest, row_id)
+    row.file_name = "New.Name.zip"
+    db.commit()
+    assert _found(db, "old") == [] and _found(db, "new") == [row_id]
+
+    db.delete(row)
+    db.commit()
+    assert _found(db, "new") == []
+    # Raises if the index no longer matches the table.
+    db.execute(text("INSERT INTO download_search(download_search) VALUES ('integrity-check')"))
+
+
+def test_a_database_without_the_index_searches_with_ilike(tmp_path):
+    with sessionmaker(bind=_engine(tmp_path / "plain.db", with_index=False))() as db:
+        row_id = _add(db, "Foo.Bar-NSP-ES.part1.rar")
+        assert not search_index.ready(db.connection())
+        assert _found(db, "ar-NS") == [row_id]
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""Tests for segmented (multi-connection) downloads.
+
+A segmented ``.part`` has holes until the last segment lands, so its size is no
+longer a resume offset. These pin the two things that keep that from corrupting
+a file: the map on disk always tiles the file exactly, and a host that ignores
+``Range`` is finished on the lead stream instead of being spliced together from
+bodies that all start at byte zero.
+"""
+
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import core.download_core as dc
+import utils.file_helpers as fh
+from core.segments import (
+    Segment,
+    collapse_to_prefix,
+    contiguous_prefix,
+    load_segment_map,
+    plan_segments,
+    resume_offset,
+    save_segment_map,
+    segment_map_path,
+)
+
+
+class TestPlanSegments:
+    def test_splits_the_remainder_evenly_and_tiles_the_file(self):
+        segs = plan_segments(100, 4, min_segment=10)
+        assert [(s.start, s.end) for s in segs] == [(0, 25), (25, 50), (50, 75), (75, 100)]
+
+    def test_bytes_already_on_disk_become_a_completed_leading_segment(self):
+        segs = plan_segments(100, 2, start=40, min_segment=10)
+        assert segs[0] == Segment(0, 40, 40)
+        assert [(s.start, s.end) for s in segs[1:]] == [(40, 70), (70, 100)]
+
+    def test_a_small_remainder_is_not_split(self):
+        assert len(plan_segments(100, 8, min_segment=60)) == 1
+
+
+class TestSegmentMap:
+    def test_contiguous_prefix_stops_at_the_first_hole(self):
+        segs = [Segment(0, 10, 10), Segment(10, 20, 4), Segment(20, 30, 10)]
+        assert contiguous_prefix(segs) == 14
+
+    def test_round_trip(self, tmp_path):
+        part = str(tmp_path / "a.bin.part")
+        segs = [Segment(0, 10, 3), Segment(10, 20, 10)]
+        save_segment_map(part, 20, segs)
+        assert load_segment_map(part, 20) == segs
+
+    def test_a_map_for_another_length_is_not_trusted(self, tmp_path):
+        part = str(tmp_path / "a.bin.part")
+        save_segment_map(part, 20, [Segment(0, 20, 5)])
+        assert load_segment_map(part, 21) is None
+
+    def test_resume_offset_ignores_the_holes_in_the_file_size(self, tmp_path):
+        part = tmp_path / "a.bin.part"
+        part.write_bytes(b"x" * 30)  # later segments wrote ahead
+        save_segment_map(str(part), 30, [Segment(0, 15, 6), Segment(15, 30, 15)])
+        assert resume_offset(str(part)) == 6
+
+    def test_an_unreadable_map_restarts_rather_than_trusting_the_size(self, tmp_path):
+        part = tmp_path / "a.bin.part"
+        part.write_bytes(b"x" * 30)
+        open(segment_map_path(str(part)), "w").write("{not json")
+        assert resume_offset(str(part)) == 0
+
+    def test_without_a_map_the_file_size_is_the_offset(self, tmp_path):
+        part = tmp_path / "a.bin.part"
+        part.write_bytes(b"x" * 30)
+        assert resume_offset(str(part)) == 30
+
+    def test_collapse_cuts_back_to_the_prefix_and_drops_the_map(self, tmp_path):
+        part = tmp_path / "a.bin.part"
+        part.write_bytes(b"x" * 30)
+        save_segment_map(str(part), 30, [Segment(0, 15, 6), Segment(15, 30, 15)])
+        collapse_to_prefix(str(part), 6)
+        assert part.stat().st_size == 6
+        assert not os.path.exists(segment_map_path(str(part)))
+
+
+class TestSegmentCountForHost:
+    def test_listed_host_uses_the_table(self, monkeypatch):
+        monkeypatch.setattr(dc, "get_config", lambda: {})
+        assert dc.segment_count_for_host("https://node42.datanodes.to/d/x") == 4
+
+    def test_unlisted_host_gets_one_stream(self, monkeypatch):
+        monkeypatch.setattr(dc, "get_config", lambda: {})
+        assert dc.segment_count_for_host("https://example.com/a.bin") == 1
+
+    def test_config_overrides_and_is_clamped(self, monkeypatch):
+        monkeypatch.setattr(dc, "get_config", lambda: {"download_segments": {
+            "datanodes.to": 1, "example.com": 99, "bad.host": "many"}})
+        assert dc.segment_count_for_host("https://datanodes.to/x") == 1
+        assert dc.segment_count_for_host("https://example.com/x") == dc.MAX_SEGMENTS_PER_DOWNLOAD
+        assert dc.segment_count_for_host("https://bad.host/x") == 1
+
+
+# --- the transfer itself ----------------------------------------------------
+
+class _Stream:
+    """Consumed as it is read, like aiohttp's: a second iterator continues."""
+
+    def __init__(self, data: bytes, chunk: int = 7):
+        self._data = data
+        self._chunk = chunk
+        self._pos = 0
+
+    async def read(self, n):
+        chunk = self._data[self._pos:self._pos + min(n, self._chunk)]
+        self._pos += len(chunk)
+        return chunk
+
+
+class _Body:
+    def __init__(self, status, data):
+        self.status = status
+        self.content = _Stream(data)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _Db:
+    def commit(self):
+        pass
+
+    def refresh(self, _):
+        pass
+
+
+def _req():
+    return SimpleNamespace(id=1, status=None, downloaded_size=0, total_size=0)
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    monkeypatch.setattr(
+        fh, "plan_segments",
+        lambda total, count, start=0: plan_segments(total, count, start, min_segment=8),
+    )
+
+
+@pytest.mark.asyncio
+async def test_segments_land_at_their_offsets(tmp_path, small_segments):
+    data = bytes(range(256)) * 2
+    part = str(tmp_path / "f.bin.part")
+    requested = []
+
+    def fetch_range(header):
+        start, end = header.split("=")[1].split("-")
+        requested.append(header)
+        return _Body(206, data[int(start):int(end) + 1])
+
+    written = await fh.download_segmented_content(
+        _Body(200, data), fetch_range, part, 0, len(data), 4, _req(), _Db()
+    )
+
+    assert written == len(data)
+    assert open(part, "rb").read() == data
+    assert len(requested) == 3
+    assert not os.path.exists(segment_map_path(part))
+
+
+@pytest.mark.asyncio
+async def test_a_host_that_ignores_range_is_finished_on_one_stream(tmp_path, small_segments):
+    data = os.urandom(300)
+    part = str(tmp_path / "f.bin.part")
+
+    # Every "ranged" answer is the whole file from byte zero — writing it at a
+    # segment offset would corrupt the file.
+    written = await fh.download_segmented_content(
+        _Body(200, data), lambda _h: _Body(200, data), part, 0, len(data), 4, _req(), _Db()
+    )
+
+    assert written == len(data)
+    assert open(part, "rb").read() == data
+
+
+@pytest.mark.asyncio
+async def test_resume_fetches_only_what_the_map_says_is_missing(tmp_path, small_segments):
+    data = os.urandom(200)
+    part = tmp_path / "f.bin.part"
+    # First 60 bytes of segment one and all of segment two are already on disk.
+    on_disk = bytearray(200)
+    on_disk[0:60] = data[0:60]
+    on_disk[100:200] = data[100:200]
+    part.write_bytes(bytes(on_disk))
+    save_segment_map(str(part), 200, [Segment(0, 100, 60), Segment(100, 200, 100)])
+
+    written = await fh.download_segmented_content(
+        _Body(206, data[60:]), lambda _h: pytest.fail("nothing else is missing"),
+        str(part), resume_offset(str(part)), 200, 2, _req(), _Db(),
+    )
+
+    assert written == 200
+    assert part.read_bytes() == data
+
+
+@pytest.mark.asyncio
+async def test_a_failed_map_write_closes_the_writer(tmp_path, small_segments, monkeypatch):
+    closed = []
+    real_close = fh.PartWriter.close
+
+    async def close(self):
+        closed.append(self)
+        await real_close(self)
+
+    def no_space(*_args):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(fh.PartWriter, "close", close)
+    monkeypatch.setattr(fh, "save_segment_map", no_space)
+    data = os.urandom(100)
+
+    with pytest.raises(Exception, match="디스크 용량"):
+        await fh.download_segmented_content(
+            _Body(200, data), lambda _h: pytest.fail("nothing is fetched"),
+            str(tmp_path / "f.bin.part"), 0, len(data), 4, _req(), _Db(),
+        )
+    assert len(closed) == 1 and not closed[0]._thread.is_alive()
@@ -6,12 +6,13 @@ files on one host can never starve a small file on a different host. Limits are
 read from config and clamped, and a global ceiling bounds total downloads.
 """
 
-import asyncio
+from types import SimpleNamespace
 
 import pytest
 
 from core import download_core as dc_module
 from core.download_core import DownloadCore, _read_concurrency_limits, SITE_DOWNLOAD_LIMITS
+from core.scheduler import QueuedDownload
 
 
 def _write_config(values):
@@ -87,31 +88,34 @@ def test_refresh_concurrency_settings_reapplies_config():
     _write_config({"max_concurrent_downloads": 8, "max_per_host_downloads": 3})
     dc = DownloadCore()
     assert dc.MAX_CONCURRENT_DOWNLOADS == 8
+    dc._launch_queued = lambda entry: None
+    dc.scheduler.submit(QueuedDownload(req_id=1, slot_key="host-a.example@direct", limit=3))
 
     _write_config({"max_concurrent_downloads": 4, "max_per_host_downloads": 2})
     dc.refresh_concurrency_settings()
     assert dc.MAX_CONCURRENT_DOWNLOADS == 4
     assert dc.MAX_PER_HOST_DOWNLOADS == 2
-    assert dc.total_download_semaphore._value == 4
-    assert dc._site_semaphores == {}  # rebuilt lazily
+    assert dc.scheduler.snapshot()["ceiling"] == 4
+    # An existing slot picks up the new per-host cap, not just new ones.
+    assert dc.scheduler.snapshot()["slots"][0]["limit"] == 2
 
 
-@pytest.mark.asyncio
-async def test_busy_host_does_not_block_a_different_host():
-    """Saturate host A's queue; a host-B download must still acquire its slot."""
+def test_busy_host_does_not_block_a_different_host():
+    """Saturate host A's queue; a host-B download must still get its slot."""
     _write_config({"max_concurrent_downloads": 8, "max_per_host_downloads": 2})
     dc = DownloadCore()
+    dc._launch_queued = lambda entry: None
 
-    key_a, limit_a = dc._resolve_host_limit("https://host-a.example/x")
-    sem_a = asyncio.Semaphore(limit_a)
-    dc._site_semaphores[key_a] = sem_a
-    # Fill host A completely.
-    for _ in range(limit_a):
-        await sem_a.acquire()
-    assert sem_a._value == 0
+    def entry(req_id, url):
+        req = SimpleNamespace(id=req_id, url=url, original_url=None, use_proxy=False,
+                              total_size=0, requested_at=None)
+        return dc._queue_entry(req, skip_parsing=True)
+
+    limit_a = dc._resolve_host_limit("https://host-a.example/x")[1]
+    for i in range(limit_a + 3):
+        dc.scheduler.submit(entry(i, f"https://host-a.example/{i}"))
+    assert dc.scheduler.snapshot()["queued"] == 3
 
     # Host B is independent — its slot is free.
-    key_b, limit_b = dc._resolve_host_limit("https://host-b.example/y")
-    sem_b = dc._site_semaphores.get(key_b) or asyncio.Semaphore(limit_b)
-    acquired = sem_b.locked() is False and sem_b._value > 0
-    assert acquired, "host B should not be blocked by a saturated host A"
+    assert dc.scheduler.submit(entry(99, "https://host-b.example/y")), \
+        "host B should not be blocked by a saturated host A"
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Tests for SSE fan-out.
+
+Every connection used to ``json.dumps`` each message for itself, and a
+broadcast awaited the connections one by one under the manager lock. These pin
+that a broadcast is encoded once, that every tab gets the very same bytes, and
+that the streams write the frame out unchanged — and that a tab which stops
+reading has its progress merged and, if it stays behind, is disconnected
+instead of growing an unbounded queue.
+"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import services.sse_manager as sm
+
+
+def _parse(frame):
+    """(event id or None, decoded data) of one frame."""
+    head, _, data = frame.partition(b"data: ")
+    event_id = int(head[len(b"id: "):]) if head else None
+    assert data.endswith(b"\n\n")
+    return event_id, json.loads(data)
+
+
+def _manager_with(n):
+    manager = sm.SSEManager()
+    manager.connections = [sm.SSEConnection(SimpleNamespace()) for _ in range(n)]
+    return manager
+
+
+@pytest.mark.asyncio
+async def test_a_broadcast_is_encoded_once(monkeypatch):
+    calls = []
+    real = sm.encode_message
+    monkeypatch.setattr(sm, "encode_message", lambda *a: calls.append(a) or real(*a))
+    manager = _manager_with(3)
+
+    await manager.broadcast_message("status_update", {"id": 1, "message": "다운로드 완료"})
+
+    assert len(calls) == 1
+    frames = [c._next_frame() for c in manager.connections]
+    assert frames[0] is frames[1] is frames[2]
+    _, body = _parse(frames[0])
+    assert body["type"] == "status_update" and body["data"]["message"] == "다운로드 완료"
+
+
+@pytest.mark.asyncio
+async def test_an_excluded_connection_is_skipped_but_kept():
+    manager = _manager_with(2)
+    skipped = manager.connections[0]
+
+    await manager.broadcast_message("x", {}, exclude_conn=skipped)
+
+    assert skipped.depth == 0 and manager.connections[1].depth == 1
+    assert skipped in manager.connections
+
+
+@pytest.mark.asyncio
+async def test_the_stream_writes_queued_frames_as_is():
+    conn = sm.SSEConnection(SimpleNamespace())
+    frame = sm.encode_message("progress_batch", [{"id": 2}])
+    conn.send_frame(frame)
+
+    stream = conn.get_stream()
+    hello = await stream.__anext__()
+    assert _parse(hello)[1]["type"] == "connection"
+    assert await stream.__anext__() is frame
+    conn.disconnect()
+    await stream.aclose()
+
+
+def _conn():
+    return sm.SSEConnection(SimpleNamespace())
+
+
+def test_a_client_behind_gets_progress_merged_latest_wins():
+    conn = _conn()
+    conn.send_frame(sm.encode_message("download_added", {"id": 1}))
+    for done in (10, 20, 30):
+        rows = [{"id": 1, "downloaded_size": done}, {"id": 2, "downloaded_size": done}]
+        conn.send_frame(sm.encode_message(sm.PROGRESS_BATCH, rows), rows)
+    conn.send_frame(sm.encode_message("status_update", {"id": 1, "status": "done"}))
+
+    assert conn.depth == 3  # added, one merged batch, done
+    types = [_parse(conn._next_frame())[1] for _ in range(3)]
+    assert [t["type"] for t in types] == ["download_added", "progress_batch", "status_update"]
+    assert [r["downloaded_size"] for r in types[1]["data"]] == [30, 30]
+    assert conn.coalesced == 4
+
+
+def test_a_client_that_stays_behind_is_evicted(monkeypatch):
+    monkeypatch.setattr(sm, "SLOW_CONSUMER_DEPTH", 3)
+    conn = _conn()
+    for i in range(3):
+        conn.send_frame(sm.encode_message("download_added", {"id": i}))
+    assert conn.behind_since is not None and conn.connected
+
+    assert not conn.check_backlog(conn.behind_since + 1)
+    assert conn.check_backlog(conn.behind_since + sm.SLOW_CONSUMER_GRACE_SEC + 1)
+    assert not conn.connected and conn.depth == 0
+
+
+@pytest.mark.asyncio
+async def test_evictions_show_in_the_stats(monkeypatch):
+    monkeypatch.setattr(sm, "MAX_QUEUED_FRAMES", 2)
+    manager = _manager_with(1)
+
+    await manager.broadcast_message("download_added", {"id": 1})
+    assert manager.stats()["queue_depth_max"] == 1
+    await manager.broadcast_message("download_added", {"id": 2})
+
+    stats = manager.stats()
+    assert stats["connections"] == 0 and stats["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_a_reconnect_gets_what_it_missed_in_order():
+    manager = sm.SSEManager()
+    for i in range(5):
+        await manager.broadcast_message("download_added", {"id": i})
+    ids = [event_id for event_id, _, _ in manager._ring]
+    assert ids == sorted(ids) and len(set(ids)) == 5
+
+    conn = await manager.add_connection(SimpleNamespace(), last_event_id=ids[1])
+    replayed = [_parse(conn._next_frame()) for _ in range(conn.depth)]
+    assert [e for e, _ in replayed] == ids[2:]
+    assert [b["data"]["id"] for _, b in replayed] == [2, 3, 4]
+
+
+@pytest.mark.asyncio
+async def test_a_gap_older_than_the_ring_gets_a_resync(monkeypatch):
+    monkeypatch.setattr(sm, "REPLAY_RING_SIZE", 3)
+    manager = sm.SSEManager()
+    first = manager._last_event_id + 1
+    for i in range(6):
+        await manager.broadcast_message("download_added", {"id": i})
+
+    stale = await manager.add_connection(SimpleNamespace(), last_event_id=first)
+    event_id, body = _parse(stale._next_frame())
+    assert body["type"] == sm.RESYNC and event_id == manager._last_event_id
+    assert stale.depth == 0
+
+    # An id from before a restart is newer than nothing here, older than all.
+    restarted = await manager.add_connection(SimpleNamespace(), last_event_id=10)
+    assert _parse(restarted._next_frame())[1]["type"] == sm.RESYNC
+
+    current = await manager.add_connection(SimpleNamespace(), last_event_id=manager._last_event_id)
+    assert current.depth == 0
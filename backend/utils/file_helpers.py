@@ -5,6 +5,9 @@ Common download utility functions
 
 from core import db_async
 from core import live_progress
+from core import disk_reserve
+from core import cancel_signal
+from core import progress_writer
 import asyncio
 import time
 import re
@@ -14,6 +17,15 @@ from urllib.parse import unquote
 from sqlalchemy import and_
 from core.models import StatusEnum, DownloadRequest
 from core.config import get_download_path
+from core.segments import (
+    discard_segment_map,
+    downloaded_bytes,
+    load_segment_map,
+    plan_segments,
+    save_segment_map,
+)
+from utils.part_writer import PartWriter
+from utils.receive_buffers import ReceiveBuffers, configured_buffer_size, receive_into
 from utils.sse import send_sse_message
 from services.sse_manager import sse_manager
 # The legacy synchronous download manager has been removed
@@ -24,9 +36,18 @@ from services.sse_manager import sse_manager
 PART_SUFFIX = '.part'
 
 
-def generate_file_path(filename, is_temporary=True):
-    """Generate a file save path"""
+def generate_file_path(filename, is_temporary=True, subdirs=()):
+    """Generate a file save path
+
+    ``subdirs`` are folder names to nest the file under (a MEGA folder's
+    structure); each is made safe on its own and the folders are created.
+    """
     download_dir = get_download_path()
+    for name in subdirs:
+        safe_dir = re.sub(r'[<>:"/\\|?*]', '_', name).strip(' .') or '_'
+        download_dir = download_dir / safe_dir
+    if subdirs:
+        download_dir.mkdir(parents=True, exist_ok=True)
 
     # Convert to a safe file name
     safe_filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
@@ -86,104 +107,124 @@ def calculate_total_size(initial_size, content_length):
     return total_size
 
 
+async def raise_write_error(write_error, req, db):
+    """Turn a failed ``.part`` write into the error the download fails with.
+
+    A full disk is not this download's problem alone: every other queued or
+    running download is about to hit the same wall, so they are stopped here
+    before the translated "disk full" message is raised. Anything else is a
+    plain write failure.
+    """
+    # Detect file-write errors such as disk space exhaustion
+    error_msg = str(write_error).lower()
+    if any(keyword in error_msg for keyword in ['disk full', 'no space', 'not enough space', 'insufficient disk space', 'space remaining', '28']):
+        print(f"[ERROR] 디스크 용량 부족: {write_error}")
+
+        # Stop all pending downloads
+        try:
+
+            # Change all pending and downloading requests to stopped
+            pending_downloads = await db_async.all_rows(db.query(DownloadRequest).filter(
+                and_(
+                    DownloadRequest.id != req.id,  # exclude the currently failed download
+                    DownloadRequest.status.in_([StatusEnum.pending, StatusEnum.downloading, StatusEnum.parsing])
+                )
+            ))
+
+            stopped_count = 0
+            for download in pending_downloads:
+                download.status = StatusEnum.stopped
+                download.error = "디스크 용량 부족으로 인한 자동 정지"
+                stopped_count += 1
+
+            if stopped_count > 0:
+                await db_async.commit(db)
+                for download in pending_downloads:
+                    cancel_signal.signal_cancel(download.id)
+                print(f"[LOG] 디스크 용량 부족으로 {stopped_count}개 다운로드 자동 정지")
+
+                # Send updates over SSE for the stopped downloads
+                loop = asyncio.get_event_loop()
+                if loop.is_running():
+                    for download in pending_downloads:
+                        live_progress.note_status(download.id, "stopped")
+                        loop.create_task(sse_manager.broadcast_message("status_update", {
+                            "id": download.id,
+                            "status": "stopped",
+                            "message": "디스크 용량 부족으로 인한 자동 정지"
+                        }))
+
+        except Exception as stop_error:
+            print(f"[WARNING] 대기중 다운로드 정지 실패: {stop_error}")
+
+        # Get the error message in the user's language
+        try:
+            from core.config import get_config
+            from core.i18n import get_translations
+            config = get_config()
+            user_language = config.get("language", "ko")
+            translations = get_translations(user_language)
+            disk_full_msg = translations.get("disk_full_error", "디스크 용량이 부족합니다. 저장 공간을 확보한 후 다시 시도해주세요.")
+            raise Exception(disk_full_msg)
+        except Exception:
+            # Default message if translation loading fails
+            raise Exception("디스크 용량이 부족합니다. 저장 공간을 확보한 후 다시 시도해주세요.")
+    else:
+        print(f"[ERROR] 파일 쓰기 오류: {write_error}")
+        raise Exception(f"파일 쓰기 실패: {str(write_error)}")
+
+
+async def open_part_writer(file_path, truncate_to, total_size, req, db):
+    """Open the ``.part`` for writing, allocating the whole file up front.
+
+    Once the file holds its full length on disk the download's reservation in
+    ``core.disk_reserve`` is settled: the free space already counts it. A disk
+    too full for the allocation fails here, before anything is fetched, with
+    the same message a mid-write ENOSPC produces.
+    """
+    writer = PartWriter(file_path, truncate_to=truncate_to,
+                        preallocate=total_size if total_size and total_size > 0 else None)
+    try:
+        await writer.start()
+    except OSError as open_error:
+        await raise_write_error(open_error, req, db)
+    if writer.preallocated:
+        disk_reserve.settle(req.id)
+    return writer
+
+
 async def download_file_content(response, file_path, initial_size, total_size, req, db):
     """Perform the actual file download"""
+    progress_writer.begin(req.id)
     downloaded = initial_size
     last_update_size = downloaded
-    chunk_count = 0
+    buffers = ReceiveBuffers(configured_buffer_size())
+    last_db_check = [time.monotonic()]
+    # A stop fails the read parked on the socket instead of waiting for data.
+    unregister = cancel_signal.interrupt_reads(req.id, response.content)
 
     try:
-        with open(file_path, 'ab' if initial_size > 0 else 'wb') as f:
-            async for chunk in response.content.iter_chunked(8192):
-                if chunk:
+        # The writer thread owns the file; this loop only reads the socket.
+        # Truncating to initial_size is what 'ab'/'wb' used to mean here.
+        writer = await open_part_writer(file_path, initial_size, total_size, req, db)
+        async with writer:
+            try:
+                # One pass per filled receive buffer (256 KB-4 MB), not per 8 KB
+                # chunk — the stop and progress checks below run at that cadence.
+                async for view in receive_into(response.content, buffers):
+                    size = len(view)
                     try:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        chunk_count += 1
+                        await writer.write(view, downloaded, on_written=buffers.recycle)
+                        downloaded += size
                     except OSError as write_error:
-                        # Detect file-write errors such as disk space exhaustion
-                        error_msg = str(write_error).lower()
-                        if any(keyword in error_msg for keyword in ['disk full', 'no space', 'not enough space', 'insufficient disk space', 'space remaining', '28']):
-                            print(f"[ERROR] 디스크 용량 부족: {write_error}")
-
-                            # Stop all pending downloads
-                            try:
-
-                                # Change all pending and downloading requests to stopped
-                                pending_downloads = await db_async.all_rows(db.query(DownloadRequest).filter(
-                                    and_(
-                                        DownloadRequest.id != req.id,  # exclude the currently failed download
-                                        DownloadRequest.status.in_([StatusEnum.pending, StatusEnum.downloading, StatusEnum.parsing])
-                                    )
-                                ))
-
-                                stopped_count = 0
-                                for download in pending_downloads:
-                                    download.status = StatusEnum.stopped
-                                    download.error = "디스크 용량 부족으로 인한 자동 정지"
-                                    stopped_count += 1
-
-                                if stopped_count > 0:
-                                    await db_async.commit(db)
-                                    print(f"[LOG] 디스크 용량 부족으로 {stopped_count}개 다운로드 자동 정지")
-
-                                    # Send updates over SSE for the stopped downloads
-                                    from services.sse_manager import sse_manager
-                                    import asyncio
-                                    loop = asyncio.get_event_loop()
-                                    if loop.is_running():
-                                        for download in pending_downloads:
-                                            loop.create_task(sse_manager.broadcast_message("status_update", {
-                                                "id": download.id,
-                                                "status": "stopped",
-                                                "message": "디스크 용량 부족으로 인한 자동 정지"
-                                            }))
-
-                            except Exception as stop_error:
-                                print(f"[WARNING] 대기중 다운로드 정지 실패: {stop_error}")
-
-                            # Get the error message in the user's language
-                            try:
-                                from core.config import get_config
-                                from core.i18n import get_translations
-                                config = get_config()
-                                user_language = config.get("language", "ko")
-                                translations = get_translations(user_language)
-                                disk_full_msg = translations.get("disk_full_error", "디스크 용량이 부족합니다. 저장 공간을 확보한 후 다시 시도해주세요.")
-                                raise Exception(disk_full_msg)
-                            except Exception:
-                                # Default message if translation loading fails
-                                raise Exception("디스크 용량이 부족합니다. 저장 공간을 확보한 후 다시 시도해주세요.")
-                        else:
-                            print(f"[ERROR] 파일 쓰기 오류: {write_error}")
-                            raise Exception(f"파일 쓰기 실패: {str(write_error)}")
+                        await raise_write_error(write_error, req, db)
                     except Exception as write_error:
                         print(f"[ERROR] 파일 쓰기 중 알 수 없는 오류: {write_error}")
                         raise
 
-                # Performance improvement: widen the check interval (every 128 chunks = every 1MB)
-                if chunk_count % 128 == 0:
                     # Check for a download stop
-                    await db_async.refresh(db, req)
-                    if req.status == StatusEnum.stopped:
-                        print(f"[LOG] 다운로드 중 정지됨: {req.id}")
-
-                        # Send a stopped-status SSE
-                        try:
-
-                            loop = asyncio.get_event_loop()
-                            if loop.is_running():
-                                loop.create_task(sse_manager.broadcast_message("status_update", {
-                                    "id": req.id,
-                                    "status": "stopped",
-                                    "progress": round((downloaded / total_size * 100), 1) if total_size > 0 else 0,
-                                    "download_speed": 0,  # explicitly set speed to 0 when stopped
-                                    "message": "다운로드가 중지되었습니다."
-                                }))
-                        except Exception as sse_error:
-                            print(f"[WARNING] 정지 상태 SSE 전송 실패: {sse_error}")
-
-                        return downloaded
+                    if await stop_requested(req, db, last_db_check):
+                        raise cancel_signal.DownloadCancelled()
 
                     # Check whether a progress update is needed
                     if should_update_progress(downloaded, last_update_size, total_size, req):
@@ -194,30 +235,273 @@ async def download_file_content(response, file_path, initial_size, total_size, r
                         except Exception as sse_error:
                             print(f"[WARNING] SSE 업데이트 실패: {sse_error}")
                             last_update_size = downloaded
+            except cancel_signal.DownloadCancelled:
+                print(f"[LOG] 다운로드 중 정지됨: {req.id}")
+
+                _broadcast_stopped(req, downloaded, total_size)
 
+                return downloaded
+
+            # The last buffers may still be queued; a write error in them is
+            # this download's error just the same.
+            try:
+                await writer.close()
+            except OSError as write_error:
+                await raise_write_error(write_error, req, db)
             print(f"[LOG] 파일 다운로드 완료: {downloaded} bytes")
 
     except Exception as e:
         print(f"[ERROR] 다운로드 중 오류: {e}")
         print(f"[ERROR] 오류 타입: {type(e).__name__}")
+        progress_writer.mark(req.id, downloaded)
         raise
+    finally:
+        unregister()
 
     req.downloaded_size = downloaded
     await db_async.commit(db)
     return downloaded
 
 
+# The database is asked whether a row was stopped only this often. The
+# in-memory cancel signal is what catches a stop; this only covers a status
+# written by something that did not signal.
+STOP_DB_CHECK_INTERVAL_SEC = 10.0
+
+
+async def stop_requested(req, db, last_db_check) -> bool:
+    """Whether ``req`` was stopped — the cancel signal first, the DB rarely.
+
+    ``last_db_check`` is a one-element list the caller keeps per transfer.
+    """
+    if cancel_signal.is_cancelled(req.id):
+        return True
+    now = time.monotonic()
+    if now - last_db_check[0] < STOP_DB_CHECK_INTERVAL_SEC:
+        return False
+    last_db_check[0] = now
+    await db_async.refresh(db, req)
+    if req.status != StatusEnum.stopped:
+        return False
+    # Raise the signal too, so every other stream of this download and the
+    # caller see the stop the same way.
+    cancel_signal.signal_cancel(req.id)
+    return True
+
+
+class RangesIgnored(Exception):
+    """A segment request was not answered with ``206`` — the host ignores ``Range``."""
+
+
+# How often the segment map is rewritten while segments run. Losing the last few
+# seconds of a crash only costs re-fetching them; rewriting per chunk would turn
+# every chunk into a metadata write on the HDD stripe.
+SEGMENT_MAP_SAVE_INTERVAL_SEC = 2.0
+
+
+async def download_segmented_content(response, fetch_range, file_path, initial_size,
+                                     total_size, segment_count, req, db):
+    """Fetch ``[initial_size, total_size)`` over several ranged connections.
+
+    ``response`` is the already-open body that continues from ``initial_size``;
+    it becomes the lead segment instead of being thrown away, which matters for
+    hosters that hand out single-use tokens. ``fetch_range(range_header)``
+    opens one more ranged GET in the caller's session context (cookies, UA,
+    proxy).
+
+    The first extra segment doubles as the probe: if the host answers it with
+    anything but ``206`` the others are cancelled and the lead simply keeps
+    reading to the end of the file — one stream, exactly as before. The lead
+    never hangs up on its segment boundary until that verdict is in.
+    """
+    progress_writer.begin(req.id)
+    segments = load_segment_map(file_path, total_size) if initial_size > 0 else None
+    truncate_to = None
+    if segments is None:
+        segments = plan_segments(total_size, segment_count, start=initial_size)
+        # Nothing past the prefix can be trusted without a map, so cut it off
+        # before the map that now describes this file is written.
+        truncate_to = initial_size
+    writer = await open_part_writer(file_path, truncate_to, total_size, req, db)
+    try:
+        await asyncio.to_thread(save_segment_map, file_path, total_size, segments)
+    except BaseException as map_error:
+        # The writer thread is already running; nothing below will close it.
+        try:
+            await writer.close()
+        except OSError:
+            pass
+        if isinstance(map_error, OSError):
+            await raise_write_error(map_error, req, db)
+        raise
+
+    pending = [seg for seg in segments if not seg.complete]
+    lead = next((seg for seg in pending if seg.offset == initial_size), None)
+    others = [seg for seg in pending if seg is not lead]
+    print(f"[LOG] 분할 다운로드: {len(pending)}개 구간 동시 전송 (총 {total_size} bytes)")
+
+    loop = asyncio.get_running_loop()
+    ranges_ok = loop.create_future()
+    if not others:
+        ranges_ok.set_result(True)
+    buffers = ReceiveBuffers(configured_buffer_size())
+    last_db_check = [time.monotonic()]
+    state = {
+        "last_update_size": downloaded_bytes(segments),
+        "last_map_save": time.time(),
+    }
+
+    async def on_buffer():
+        # Shared by every segment: one stop check and one progress stream for
+        # the file, not one per connection.
+        now = time.time()
+        if now - state["last_map_save"] >= SEGMENT_MAP_SAVE_INTERVAL_SEC:
+            state["last_map_save"] = now
+            # The map may only claim bytes the file already holds; the
+            # segments count what they queued, so drain the writer first.
+            await writer.flush()
+            await asyncio.to_thread(save_segment_map, file_path, total_size, segments)
+        if await stop_requested(req, db, last_db_check):
+            raise cancel_signal.DownloadCancelled()
+        downloaded = downloaded_bytes(segments)
+        if should_update_progress(downloaded, state["last_update_size"], total_size, req):
+            try:
+                state["last_update_size"] = await send_progress_update(
+                    downloaded, total_size, state["last_update_size"], req, db
+                )
+            except Exception as sse_error:
+                print(f"[WARNING] SSE 업데이트 실패: {sse_error}")
+                state["last_update_size"] = downloaded
+
+    async def pump(body, seg):
+        # Reads are capped at the segment's end, so a stream never receives a
+        # byte that belongs to the next segment.
+        unregister = cancel_signal.interrupt_reads(req.id, body.content)
+        try:
+            async for view in receive_into(body.content, buffers, limit=seg.end - seg.offset):
+                size = len(view)
+                try:
+                    await writer.write(view, seg.offset, on_written=buffers.recycle)
+                except OSError as write_error:
+                    await raise_write_error(write_error, req, db)
+                seg.done += size
+                await on_buffer()
+        finally:
+            unregister()
+
+    async def run_lead():
+        await pump(response, lead)
+        if not await ranges_ok:
+            # Single stream from here: the lead's body already runs to the end
+            # of the file, so it just keeps going. Everything before the lead
+            # is complete (it started at the contiguous prefix), so the map
+            # collapses to one segment and stays a valid description of disk.
+            lead.done = lead.offset
+            lead.start, lead.end = 0, total_size
+            segments[:] = [lead]
+            await asyncio.to_thread(save_segment_map, file_path, total_size, segments)
+            await pump(response, lead)
+
+    async def run_segment(seg):
+        async with fetch_range(seg.range_header()) as ranged:
+            if ranged.status != 206:
+                raise RangesIgnored(f"HTTP {ranged.status}")
+            if not ranges_ok.done():
+                ranges_ok.set_result(True)
+            await pump(ranged, seg)
+
+    # The lead is None only when the open body starts where no segment does (a
+    # stale map); then every segment is fetched by range and there is nothing
+    # to fall back on.
+    lead_task = asyncio.create_task(run_lead()) if lead is not None else None
+    segment_tasks = [asyncio.create_task(run_segment(seg)) for seg in others]
+    waiting = set(segment_tasks) | ({lead_task} if lead_task else set())
+    try:
+        while waiting:
+            finished, waiting = await asyncio.wait(waiting, return_when=asyncio.FIRST_EXCEPTION)
+            for task in finished:
+                error = task.exception()
+                if error is None:
+                    continue
+                if isinstance(error, RangesIgnored) and lead_task is not None:
+                    print(f"[LOG] 호스트가 Range 를 무시함({error}) — 단일 연결로 계속")
+                    for other in segment_tasks:
+                        other.cancel()
+                    await asyncio.gather(*segment_tasks, return_exceptions=True)
+                    waiting = {lead_task} if not lead_task.done() else set()
+                    if not ranges_ok.done():
+                        ranges_ok.set_result(False)
+                    break
+                if isinstance(error, cancel_signal.DownloadCancelled):
+                    downloaded = downloaded_bytes(segments)
+                    print(f"[LOG] 다운로드 중 정지됨: {req.id}")
+                    _broadcast_stopped(req, downloaded, total_size)
+                    return downloaded
+                if isinstance(error, RangesIgnored):
+                    raise Exception(f"분할 다운로드 실패: 호스트가 Range 요청을 거부함 ({error})")
+                raise error
+    finally:
+        # Whatever happened, no connection outlives this call, and the map on
+        # disk describes the bytes on disk.
+        for task in segment_tasks + ([lead_task] if lead_task else []):
+            task.cancel()
+        await asyncio.gather(*segment_tasks, *([lead_task] if lead_task else []),
+                             return_exceptions=True)
+        try:
+            await writer.close()
+        except OSError as write_error:
+            close_error = write_error
+        else:
+            close_error = None
+        # After a failed write the segments count bytes that never landed, so
+        # the last map saved from a flushed writer is the one left standing.
+        if not writer.failed:
+            await asyncio.to_thread(save_segment_map, file_path, total_size, segments)
+            progress_writer.mark(req.id, downloaded_bytes(segments))
+
+    if close_error is not None:
+        await raise_write_error(close_error, req, db)
+    downloaded = downloaded_bytes(segments)
+    if downloaded >= total_size:
+        await asyncio.to_thread(discard_segment_map, file_path)
+    print(f"[LOG] 분할 다운로드 완료: {downloaded} bytes")
+
+    req.downloaded_size = downloaded
+    await db_async.commit(db)
+    return downloaded
+
+
+def _broadcast_stopped(req, downloaded, total_size):
+    """Tell the grid a transfer loop noticed the stop, with speed forced to 0."""
+    # The task's final flush writes this count to the row.
+    progress_writer.mark(req.id, downloaded)
+    live_progress.note_status(req.id, "stopped")
+    try:
+        loop = asyncio.get_event_loop()
+        if loop.is_running():
+            loop.create_task(sse_manager.broadcast_message("status_update", {
+                "id": req.id,
+                "status": "stopped",
+                "progress": round((downloaded / total_size * 100), 1) if total_size > 0 else 0,
+                "download_speed": 0,  # explicitly set speed to 0 when stopped
+                "message": "다운로드가 중지되었습니다."
+            }))
+    except Exception as sse_error:
+        print(f"[WARNING] 정지 상태 SSE 전송 실패: {sse_error}")
+
+
 def should_update_progress(downloaded, last_update_size, total_size, req):
     """Check whether a progress update is needed - optimized interval"""
     current_time = time.time()
     last_update_time = getattr(req, '_last_sse_send_time', 0)
     time_since_last_update = current_time - last_update_time
 
-    # On the first update, or immediately on completion, otherwise every 3 seconds (a reasonable interval)
+    # On the first update, or immediately on completion, otherwise once per
+    # progress_batch tick — recording more often than it is sent buys nothing.
     should_update = (
         (last_update_time == 0) or  # first update
         (downloaded >= total_size) or  # immediately on completion
-        (time_since_last_update >= 3.0)  # update every 3 seconds (so it doesn't change too often)
+        (time_since_last_update >= live_progress.interval())
     )
 
     # Progress-update logging removed (too noisy)
@@ -226,13 +510,11 @@ def should_update_progress(downloaded, last_update_size, total_size, req):
 
 
 async def send_progress_update(downloaded, total_size, last_update_size, req, db):
-    """Send a progress update.
+    """Record a progress reading for the next progress_batch and DB flush.
 
-    Async because of the commit below, not the SSE: the broadcast is scheduled
-    onto the running loop, so this has to stay on the loop's thread — it is only
-    the database write that gets moved off it.
+    Nothing here waits any more — both readings are picked up by the download
+    service's tickers. It stays ``async`` for its callers.
     """
-    progress = (downloaded / total_size * 100) if total_size > 0 else 0.0
     current_time = time.time()
     last_update_time = getattr(req, '_last_sse_send_time', 0)
     time_diff = current_time - last_update_time
@@ -288,39 +570,17 @@ async def send_progress_update(downloaded, total_size, last_update_size, req, db
     speed_attr = '_last_proxy_download_speed' if hasattr(req, '_last_proxy_download_speed') else '_last_local_download_speed'
     setattr(req, speed_attr, download_speed)
 
-    # Use the sse_manager
-    try:
-
-        # Asynchronous SSE send
-        speed_bps = int(download_speed) if download_speed > 0 else 0
-        # Also park it where a list refetch can find it — the stream alone
-        # cannot keep the column filled, since every refetch replaces the row.
-        live_progress.record_speed(req.id, speed_bps)
-
-        sse_data = {
-            "id": req.id,
-            "downloaded_size": downloaded,
-            "total_size": total_size,
-            "progress": round(min(100.0, progress), 1),
-            "download_speed": speed_bps,
-            "status": "downloading"
-        }
+    # Recorded, not broadcast: the download service's ticker sends every
+    # download that moved in one progress_batch frame (core/live_progress.py).
+    # The list endpoints read the speed from the same place, so a refetch keeps
+    # the column filled.
+    speed_bps = int(download_speed) if download_speed > 0 else 0
+    live_progress.record_progress(req.id, downloaded, total_size, speed_bps)
 
-        # SSE send-data logging removed (too noisy)
+    # The row is written by the group-commit writer (core/progress_writer.py),
+    # together with every other download's, not by a commit of our own.
+    progress_writer.mark(req.id, downloaded)
 
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            loop.create_task(sse_manager.broadcast_message("status_update", sse_data))
-    except Exception as sse_error:
-        print(f"[WARNING] SSE 진행률 전송 실패: {sse_error}")
-    
-    # Optimize the database update too (every 5 seconds)
-    last_db_update_time = getattr(req, '_last_db_update_time', 0)
-    if current_time - last_db_update_time >= 5.0 or downloaded >= total_size:
-        req.downloaded_size = downloaded
-        await db_async.commit(db)
-        req._last_db_update_time = current_time
-    
     return downloaded
 
 
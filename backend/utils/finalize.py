@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Moves a finished ``.part`` to its final name without blocking the loop.
+
+Finalizing used to be ``shutil.move(part, final)`` called straight from the
+download coroutine. Inside one filesystem that is a rename and nobody notices.
+With the temp directory on one mount and the download folder on another it is a
+full copy of a multi-GB file — and for the minutes it takes, the event loop
+does nothing else: every other download stops, the SSE stream stalls and the
+API stops answering.
+
+:func:`move_into_place` is plain blocking code meant for a worker thread
+(``asyncio.to_thread``). When source and destination share a device it is a
+single ``os.replace``. Otherwise the bytes are copied in large chunks into a
+sibling temp file next to the destination, fsynced, renamed over the final
+name and the directory fsynced; only then is the ``.part`` removed. A crash or
+a full disk at any point leaves the ``.part`` untouched, so a retry simply
+finalizes again. Progress is reported through a callback so the caller can
+forward it to the UI.
+"""
+
+from __future__ import annotations
+
+import errno
+import os
+import shutil
+from typing import Callable, Optional
+
+# Large reads and writes keep a cross-device copy sequential on both disks.
+COPY_CHUNK_BYTES = 8 * 1024 * 1024
+
+MOVING_SUFFIX = ".moving"
+
+MOVE_RENAME = "rename"
+MOVE_COPY = "copy"
+
+ProgressCallback = Callable[[int, int], None]
+
+
+def _same_device(src: str, dst: str) -> bool:
+    try:
+        dst_dir = os.path.dirname(os.path.abspath(dst))
+        return os.stat(src).st_dev == os.stat(dst_dir).st_dev
+    except OSError:
+        # Let the rename itself report a missing source or directory.
+        return True
+
+
+def _fsync_dir(path: str) -> None:
+    # Makes the rename itself durable. Not possible on Windows; skip there.
+    if os.name == "nt":
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _copy_across(src: str, dst: str, progress: Optional[ProgressCallback]) -> None:
+    total = os.path.getsize(src)
+    tmp = dst + MOVING_SUFFIX
+    buf = bytearray(COPY_CHUNK_BYTES)
+    view = memoryview(buf)
+    copied = 0
+    try:
+        with open(src, "rb") as fin, open(tmp, "wb") as fout:
+            while True:
+                n = fin.readinto(buf)
+                if not n:
+                    break
+                fout.write(view[:n])
+                copied += n
+                if progress is not None:
+                    progress(copied, total)
+            fout.flush()
+            os.fsync(fout.fileno())
+        try:
+            shutil.copystat(src, tmp)
+        except OSError:
+            pass
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    finally:
+        view.release()
+    _fsync_dir(os.path.dirname(os.path.abspath(dst)))
+    os.unlink(src)
+
+
+def move_into_place(src: str, dst: str, progress: Optional[ProgressCallback] = None) -> str:
+    """Move ``src`` to ``dst``; returns :data:`MOVE_RENAME` or :data:`MOVE_COPY`.
+
+    Blocking — run it in a worker thread. ``progress(copied, total)`` is called
+    from that thread after every chunk of a cross-device copy.
+    """
+    if _same_device(src, dst):
+        try:
+            os.replace(src, dst)
+            return MOVE_RENAME
+        except OSError as e:
+            # Bind mounts and overlay filesystems can share st_dev and still
+            # refuse the rename.
+            if e.errno != errno.EXDEV:
+                raise
+    _copy_across(src, dst, progress)
+    return MOVE_COPY
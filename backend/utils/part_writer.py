@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""Writes a ``.part`` file from a thread of its own, off the event loop.
+
+The transfer loops used to call ``f.write(chunk)`` inline. On the 8 TB HDD
+stripe a single write can sit for hundreds of milliseconds behind a seek or a
+flush of the page cache, and while it sits, the loop does nothing else: every
+other download stops reading, the SSE stream stalls and the API stops
+answering. One slow disk froze the whole app.
+
+Here the network coroutine only hands bytes over. A thread per open file takes
+them from a queue and writes them, joining neighbouring buffers into one large
+write so the disk sees a few big sequential writes instead of thousands of 8 KB
+ones. The queue is bounded in *bytes*: once the disk falls that far behind,
+``write`` waits, the coroutine stops reading, and TCP flow control slows the
+sender — the socket is throttled instead of memory filling up.
+
+Buffers handed over with an ``on_written`` callback are given back through it
+once their bytes are in the file (or dropped after a failure), which is how the
+receive-buffer pool reuses them without ever copying.
+
+A write error in the thread is kept and raised from the next ``write`` (or from
+``close``) as the very ``OSError`` the thread got, so callers handle ENOSPC
+exactly as they did when the write was inline.
+
+A ``transform`` runs in the same thread on every buffer, in the order they
+were queued, before it is written; it must return as many bytes as it got.
+MEGA decrypts and MACs there, so that CPU work stays off the loop too.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import queue
+import threading
+from typing import Callable, Optional
+
+from core import disk_reserve
+
+# How far the disk may fall behind the network before reads are held back. Big
+# enough to ride out a seek storm on the HDD stripe, small enough that twenty
+# downloads cannot park hundreds of MB in memory.
+MAX_PENDING_BYTES = 16 * 1024 * 1024
+
+# Neighbouring buffers are joined up to this size before one write() call.
+COALESCE_BYTES = 4 * 1024 * 1024
+
+_CLOSE = object()
+
+
+class PartWriter:
+    """Positional writer for one ``.part`` file, fed from the event loop."""
+
+    def __init__(self, path: str, truncate_to: Optional[int] = None,
+                 max_pending_bytes: int = MAX_PENDING_BYTES,
+                 preallocate: Optional[int] = None,
+                 transform: Optional[Callable] = None):
+        self.path = path
+        self._truncate_to = truncate_to
+        self._preallocate = preallocate
+        self._transform = transform
+        # Whether the full length is allocated on disk (see core.disk_reserve).
+        self.preallocated = False
+        self._max_pending = max(1, max_pending_bytes)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+        self._drained: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    async def __aenter__(self) -> "PartWriter":
+        if self._thread is None:
+            await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.close()
+        else:
+            # Already failing — the bytes still queued are flushed so the
+            # .part matches what resume will assume, but a second error from
+            # the disk must not mask the first one.
+            try:
+                await self.close()
+            except OSError:
+                pass
+        return False
+
+    async def start(self) -> None:
+        """Open the file (off the loop) and start the writer thread."""
+        self._loop = asyncio.get_running_loop()
+        self._drained = asyncio.Event()
+        fh = await asyncio.to_thread(self._open)
+        self._thread = threading.Thread(
+            target=self._run, args=(fh,), name=f"part-writer:{os.path.basename(self.path)}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _open(self):
+        fh = open(self.path, "r+b" if os.path.exists(self.path) else "w+b")
+        try:
+            if self._truncate_to is not None:
+                fh.truncate(self._truncate_to)
+            # After the truncate: cutting the file back also frees blocks
+            # allocated past its end.
+            if self._preallocate:
+                self.preallocated = disk_reserve.preallocate(fh.fileno(), self._preallocate)
+        except OSError:
+            fh.close()
+            raise
+        return fh
+
+    async def write(self, data, offset: int, on_written=None) -> None:
+        """Queue ``data`` for ``offset``; waits while the disk is too far behind.
+
+        ``on_written(data)`` runs on the loop once ``data`` is no longer needed.
+        """
+        self._raise_pending_error()
+        size = len(data)
+        while True:
+            with self._lock:
+                # One oversized buffer must still get through an empty queue.
+                if self._pending == 0 or self._pending + size <= self._max_pending:
+                    self._pending += size
+                    break
+                self._drained.clear()
+            await self._drained.wait()
+            self._raise_pending_error()
+        self._queue.put((offset, data, on_written))
+
+    async def flush(self) -> None:
+        """Wait until every queued byte has reached the file."""
+        while True:
+            with self._lock:
+                if self._pending == 0:
+                    break
+                self._drained.clear()
+            await self._drained.wait()
+        self._raise_pending_error()
+
+    async def close(self) -> None:
+        """Flush everything queued, close the file, and surface any write error."""
+        if self._closed:
+            self._raise_pending_error()
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(_CLOSE)
+            await asyncio.to_thread(self._thread.join)
+        self._raise_pending_error()
+
+    @property
+    def failed(self) -> bool:
+        """Whether a write has failed — queued bytes may not be on disk."""
+        return self._error is not None
+
+    @property
+    def pending_bytes(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def _raise_pending_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def _release(self, size: int) -> None:
+        with self._lock:
+            self._pending -= size
+        loop, drained = self._loop, self._drained
+        if loop is not None and drained is not None:
+            try:
+                loop.call_soon_threadsafe(drained.set)
+            except RuntimeError:
+                pass  # loop already closed (shutdown); nobody is waiting
+
+    def _run(self, fh) -> None:
+        try:
+            closing = False
+            while not closing:
+                item = self._queue.get()
+                if item is _CLOSE:
+                    break
+                offset, data, callback = item
+                parts = [self._transformed(data)]
+                size = len(data)
+                done = [(callback, data)]
+                # Join whatever is already queued and continues where this
+                # buffer ends — the common case of one sequential stream.
+                while size < COALESCE_BYTES:
+                    try:
+                        nxt = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if nxt is _CLOSE:
+                        closing = True
+                        break
+                    if nxt[0] != offset + size:
+                        self._write(fh, offset, parts, size)
+                        self._written(done)
+                        offset, parts, size = nxt[0], [self._transformed(nxt[1])], len(nxt[1])
+                        done = [(nxt[2], nxt[1])]
+                        continue
+                    parts.append(self._transformed(nxt[1]))
+                    size += len(nxt[1])
+                    done.append((nxt[2], nxt[1]))
+                self._write(fh, offset, parts, size)
+                self._written(done)
+        finally:
+            try:
+                fh.close()
+            except OSError as close_error:
+                if self._error is None:
+                    self._error = close_error
+            # Anything still queued after a failure is dropped, but its budget
+            # is returned so a waiting writer wakes up and sees the error.
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _CLOSE:
+                    self._release(len(item[1]))
+                    self._written([(item[2], item[1])])
+
+    def _transformed(self, data):
+        if self._transform is None or self._error is not None:
+            return data
+        try:
+            return self._transform(data)
+        except Exception as transform_error:
+            # Kept like a write error: nothing after it is written.
+            self._error = transform_error
+            return data
+
+    def _written(self, done) -> None:
+        loop = self._loop
+        for callback, data in done:
+            if callback is None or loop is None:
+                continue
+            try:
+                loop.call_soon_threadsafe(callback, data)
+            except RuntimeError:
+                pass
+
+    def _write(self, fh, offset: int, parts, size: int) -> None:
+        try:
+            if self._error is None:
+                fh.seek(offset)
+                fh.write(parts[0] if len(parts) == 1 else b"".join(parts))
+        except OSError as write_error:
+            self._error = write_error
+        finally:
+            self._release(size)
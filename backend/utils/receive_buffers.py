@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Large, reusable receive buffers for the transfer loops.
+
+``iter_chunked(8192)`` made a gigabit download cost ~15,000 trips around the
+loop per second — each one a fresh ``bytes``, a writer hand-off and a stop
+check. The loop work, not the socket, was what a fast line paid for.
+
+Here a transfer reads as much as the socket already has into a preallocated
+``bytearray`` and only hands it on once it is full: one writer hand-off and one
+stop/progress check per buffer instead of per 8 KB. The writer gets a
+``memoryview`` of the buffer, not a copy, and gives the buffer back to the pool
+once the bytes are on disk, so a long download reuses the same few buffers from
+start to finish.
+
+The size follows the measured rate — enough for about a quarter second of data,
+between 256 KB and 4 MB — so a 300 KB/s hoster is not held back waiting to fill
+4 MB, and a fast line is not back to thousands of hand-offs. A buffer that is
+slow to fill is handed on part-full after :data:`FLUSH_INTERVAL_SEC` either way,
+which keeps stop checks and progress timely on slow links.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import AsyncIterator, List, Optional
+
+MIN_BUFFER_BYTES = 256 * 1024
+MAX_BUFFER_BYTES = 4 * 1024 * 1024
+
+# A buffer holds roughly this much time at the measured rate.
+FILL_TARGET_SEC = 0.25
+
+# A part-full buffer is handed on after this long regardless.
+FLUSH_INTERVAL_SEC = 0.5
+
+
+def _clamp(size: int) -> int:
+    return max(MIN_BUFFER_BYTES, min(MAX_BUFFER_BYTES, size))
+
+
+def configured_buffer_size() -> Optional[int]:
+    """The fixed size from ``receive_buffer_kb``, or ``None`` to follow the rate."""
+    from core.config import get_config
+
+    try:
+        kb = int(get_config().get("receive_buffer_kb") or 0)
+    except (TypeError, ValueError):
+        return None
+    return _clamp(kb * 1024) if kb > 0 else None
+
+
+def buffer_size_for_rate(bytes_per_sec: float) -> int:
+    """A power of two holding about :data:`FILL_TARGET_SEC` at this rate."""
+    wanted = int(bytes_per_sec * FILL_TARGET_SEC)
+    size = MIN_BUFFER_BYTES
+    while size < wanted and size < MAX_BUFFER_BYTES:
+        size *= 2
+    return size
+
+
+class ReceiveBuffers:
+    """A small pool of receive buffers shared by one transfer's streams.
+
+    Buffers come back through :meth:`recycle`, which the part writer calls once
+    a buffer's bytes are written. The pool never holds more than two buffers
+    beyond one per stream: when all are out, :meth:`take` waits, which is the
+    same back-pressure as a full writer queue.
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        self._fixed = size is not None
+        self.size = _clamp(size) if size is not None else MIN_BUFFER_BYTES
+        self.streams = 0
+        self._free: List[bytearray] = []
+        self._out = 0
+        self._returned = asyncio.Event()
+        self._rate_bytes = 0
+        self._rate_since = time.monotonic()
+
+    async def take(self) -> bytearray:
+        while True:
+            while self._free:
+                buf = self._free.pop()
+                if len(buf) == self.size:
+                    self._out += 1
+                    return buf
+                # Sized for an older rate: let it go and allocate afresh.
+            if self._out < max(1, self.streams) + 2:
+                self._out += 1
+                return bytearray(self.size)
+            self._returned.clear()
+            await self._returned.wait()
+
+    def recycle(self, view) -> None:
+        """Take back the buffer behind ``view``; its bytes are on disk."""
+        buf = view
+        if isinstance(view, memoryview):
+            buf = view.obj
+            view.release()
+        self._out -= 1
+        if len(buf) == self.size:
+            self._free.append(buf)
+        self._returned.set()
+
+    def observe(self, nbytes: int) -> None:
+        """Count received bytes; retune the size about once a second."""
+        if self._fixed:
+            return
+        self._rate_bytes += nbytes
+        elapsed = time.monotonic() - self._rate_since
+        if elapsed < 1.0:
+            return
+        per_stream = self._rate_bytes / elapsed / max(1, self.streams)
+        self.size = buffer_size_for_rate(per_stream)
+        self._rate_bytes = 0
+        self._rate_since = time.monotonic()
+
+
+async def receive_into(content, pool: ReceiveBuffers,
+                       limit: Optional[int] = None) -> AsyncIterator[memoryview]:
+    """Yield filled views of pool buffers read from ``content``.
+
+    ``limit`` stops the read after that many bytes — a segment never reads past
+    its own end, so nothing it receives belongs to another segment. Each
+    yielded view must reach the writer (or :meth:`ReceiveBuffers.recycle`);
+    that is what returns its buffer to the pool.
+    """
+    remaining = limit
+    pool.streams += 1
+    try:
+        while remaining is None or remaining > 0:
+            buf = await pool.take()
+            view = memoryview(buf)
+            filled = 0
+            started = time.monotonic()
+            eof = False
+            while filled < len(buf):
+                want = len(buf) - filled
+                if remaining is not None:
+                    want = min(want, remaining - filled)
+                    if want <= 0:
+                        break
+                try:
+                    data = await content.read(want)
+                except Exception:
+                    # A stop or a dropped connection: what is already in the
+                    # buffer was received in full and is still worth keeping.
+                    if filled:
+                        yield view[:filled]
+                    raise
+                if not data:
+                    eof = True
+                    break
+                n = len(data)
+                view[filled:filled + n] = data
+                filled += n
+                if time.monotonic() - started >= FLUSH_INTERVAL_SEC:
+                    break
+            if filled:
+                pool.observe(filled)
+                if remaining is not None:
+                    remaining -= filled
+                yield view[:filled]
+            view.release()
+            if not filled:
+                pool.recycle(buf)
+            if eof:
+                return
+    finally:
+        pool.streams -= 1
@@ -11,6 +11,10 @@ export class EventSourceManager {
     this.updateQueue = new Map();
     this.debounceTimer = null;
     this.debounceDelay = 50; // 50ms debounce for faster updates
+    // Id of the last event received. A reconnect hands it back so the server
+    // replays what was missed instead of the UI refetching everything; the
+    // server answers with a "resync" event only when it cannot.
+    this.lastEventId = null;
   }
 
   connect(onMessage) {
@@ -25,10 +29,14 @@ export class EventSourceManager {
     // EventSource cannot carry an Authorization header, so when authentication is
     // enabled the stream takes the token as a query parameter instead. Without it
     // the API guard rejects the connection and the grid stops updating live.
+    // A new EventSource does not send Last-Event-ID by itself, so the id
+    // goes in the query as well.
     const token = localStorage.getItem("auth_token");
-    this.eventSource = new EventSource(
-      token ? `/api/events?token=${encodeURIComponent(token)}` : "/api/events"
-    );
+    const params = new URLSearchParams();
+    if (token) params.set("token", token);
+    if (this.lastEventId) params.set("last_event_id", this.lastEventId);
+    const query = params.toString();
+    this.eventSource = new EventSource(query ? `/api/events?${query}` : "/api/events");
 
     this.eventSource.onopen = () => {
       sseLog("EventSource connected");
@@ -37,6 +45,9 @@ export class EventSourceManager {
 
     this.eventSource.onmessage = (event) => {
       try {
+        if (event.lastEventId) {
+          this.lastEventId = event.lastEventId;
+        }
         const message = JSON.parse(event.data);
         
         // heartbeat and connection messages are used only to check connection status
@@ -51,7 +62,8 @@ export class EventSourceManager {
         }
 
         // Important messages are handled immediately
-        if (message.type === "force_refresh" || message.type === "test_message") {
+        if (message.type === "force_refresh" || message.type === "resync" ||
+            message.type === "test_message") {
           if (onMessage) {
             sseLog("📨 Priority SSE message:", message.type);
             onMessage(message);
@@ -59,6 +71,16 @@ export class EventSourceManager {
           return;
         }
 
+        // progress_batch: one frame per tick with every download that moved.
+        // The rows already carry status "downloading", so they go through the
+        // same batch path the debounced status_updates use.
+        if (message.type === "progress_batch") {
+          if (onMessage && Array.isArray(message.data) && message.data.length > 0) {
+            onMessage({ type: "batch_status_update", data: message.data });
+          }
+          return;
+        }
+
         // status_update messages are debounced (but important states are handled immediately)
         if (message.type === "status_update") {
           sseLog("📨 Status update received:", message.data.id, "진행률:" + message.data.progress + "%", "상태:" + message.data.status);
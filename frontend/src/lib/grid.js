@@ -59,3 +59,37 @@ export function truncateMiddle(name, cap) {
   const head = cap - tail - 1;
   return `${name.slice(0, head)}…${name.slice(-tail)}`;
 }
+
+/**
+ * Apply a /api/downloads/changes response to the grid page on screen.
+ *
+ * Returns the patched rows, or `null` when only reloading the page can be
+ * trusted: a shown row was deleted or left this tab, or a row that may now sort
+ * onto this page (or onto one before it, shifting this one) changed. Rows are
+ * newest first by id, which is what makes "may sort onto" decidable without
+ * the search or period filters — unsure means reload.
+ */
+export function applyGridChanges(rows, feed, { completed, page, pageSize }) {
+  if (!feed || feed.resync || feed.has_more) return null;
+  const shown = new Set(rows.map((row) => row.id));
+  if ((feed.deleted || []).some((id) => shown.has(id))) return null;
+
+  const pageFull = rows.length >= pageSize;
+  const lowestShown = rows.reduce((low, row) => Math.min(low, row.id), Infinity);
+  const patched = new Map();
+  for (const row of feed.changes || []) {
+    const belongsHere =
+      (String(row.status || "").toLowerCase() === "done") === completed;
+    if (shown.has(row.id)) {
+      if (!belongsHere) return null;
+      patched.set(row.id, row);
+    } else if (belongsHere ? !pageFull || row.id > lowestShown
+                           : page > 1 && row.id > lowestShown) {
+      return null;
+    }
+  }
+  if (!patched.size) return rows;
+  return rows.map((row) =>
+    patched.has(row.id) ? { ...row, ...patched.get(row.id) } : row,
+  );
+}
@@ -2,6 +2,7 @@ import { describe, expect, it } from "vitest";
 
 import {
   ACTIVE_STATUSES,
+  applyGridChanges,
   countActiveByStatus,
   countLive,
   isLiveStatus,
@@ -115,3 +116,43 @@ describe("shortening a release name", () => {
     expect(wide).toContain("[Base].rar");
   });
 });
+
+describe("applying the change feed to the shown page", () => {
+  // Page 2 of the working tab, newest first.
+  const rows = [
+    { id: 20, status: "downloading", progress: 10 },
+    { id: 18, status: "stopped", progress: 0 },
+    { id: 15, status: "failed", progress: 0 },
+  ];
+  const working = { completed: false, page: 2, pageSize: 3 };
+  const feed = (changes, deleted = []) => ({
+    changes, deleted, cursor: 9, has_more: false, resync: false,
+  });
+
+  it("patches a shown row that stays in the tab", () => {
+    const out = applyGridChanges(rows, feed([{ id: 20, status: "downloading", progress: 55 }]), working);
+
+    expect(out.map((r) => r.progress)).toEqual([55, 0, 0]);
+  });
+
+  it("ignores a row below this page", () => {
+    expect(applyGridChanges(rows, feed([{ id: 3, status: "downloading" }]), working)).toBe(rows);
+  });
+
+  it("reloads when a shown row finishes and leaves the working tab", () => {
+    expect(applyGridChanges(rows, feed([{ id: 18, status: "done" }]), working)).toBeNull();
+  });
+
+  it("reloads when a shown row was deleted", () => {
+    expect(applyGridChanges(rows, feed([], [15]), working)).toBeNull();
+  });
+
+  it("reloads when a row above this page joins or leaves the tab", () => {
+    expect(applyGridChanges(rows, feed([{ id: 30, status: "pending" }]), working)).toBeNull();
+    expect(applyGridChanges(rows, feed([{ id: 30, status: "done" }]), working)).toBeNull();
+  });
+
+  it("reloads when the server can no longer answer from the cursor", () => {
+    expect(applyGridChanges(rows, { ...feed([]), resync: true }, working)).toBeNull();
+  });
+});